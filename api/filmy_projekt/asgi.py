@@ -14,3 +14,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'filmy_projekt.settings')
 
 application = get_asgi_application()
+
+# Map the movie dataset and build its index before workers are forked (gunicorn --preload) so they
+# share its pages and the first movie list request does not build the index
+from main.dataset import store  # noqa: E402
+from main.query import get_movie_index  # noqa: E402
+dataset = store.get()
+if dataset is not None:
+    get_movie_index(dataset)
@@ -30,7 +30,7 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
-    'main.apps',
+    'main',
     'corsheaders',
     'rest_framework',
     'django.contrib.admin',
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.ServerTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -129,3 +130,63 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Clustering results
+# Encoded K-Means responses are kept in an in-process LRU bounded by total size. Set
+# CLUSTERING_CACHE_ALIAS to a configured CACHES alias (e.g. Redis/Memcached) to share them between workers.
+
+CLUSTERING_CACHE_MAX_BYTES = 64 * 1024 * 1024
+CLUSTERING_CACHE_ALIAS = None
+CLUSTERING_CACHE_TIMEOUT = 60 * 60
+
+# POST /api/clustering/<kmeans|dbscan>/ runs the fit as a background job in a process pool of this size.
+# Jobs beyond CLUSTERING_JOB_MAX_PENDING are rejected with 503; finished jobs are kept for polling.
+
+CLUSTERING_JOB_WORKERS = 2
+CLUSTERING_JOB_MAX_PENDING = 32
+CLUSTERING_JOB_MAX_FINISHED = 256
+CLUSTERING_JOB_START_METHOD = 'spawn'  # fork from a threaded server can deadlock the workers
+
+# Largest number of movies accepted by POST /api/clustering/predict/batch/
+PREDICTION_BATCH_MAX_ITEMS = 50000
+
+# GET /api/clustering/kmeans/sweep/ fits k_min..k_max (at most KMEANS_SWEEP_MAX_K) in a process pool
+# of KMEANS_SWEEP_WORKERS (None = one per CPU); silhouette is computed on a sample of this many movies
+KMEANS_SWEEP_MAX_K = 20
+KMEANS_SWEEP_WORKERS = None
+KMEANS_SWEEP_SILHOUETTE_SAMPLE = 2000
+
+# Async views under ASGI (main/asyncviews.py): clustering and prediction run in a thread pool of
+# ASYNC_EXECUTOR_WORKERS, movie list reads on the event loop. Per-endpoint (URL name) concurrency limits,
+# ASYNC_DEFAULT_LIMIT for the other offloaded endpoints; beyond ASYNC_MAX_WAITING queued requests 503
+ASYNC_EXECUTOR_WORKERS = 4
+ASYNC_ENDPOINT_LIMITS = {
+    'kmeans_clustering': 2,
+    'kmeans_sweep': 1,
+    'dbscan_clustering': 2,
+    'cluster_predict_batch': 2,
+}
+ASYNC_DEFAULT_LIMIT = 8
+ASYNC_MAX_WAITING = 32
+
+# Request timings (main/timing.py): Server-Timing header on every response, histograms at /api/metrics.
+# Set PROFILE_SLOW_REQUESTS_MS to run PROFILE_SAMPLE_RATE of the requests under cProfile and keep
+# the profiles of those slower than that in PROFILE_DIR (api/profiles by default)
+PROFILE_SLOW_REQUESTS_MS = None
+PROFILE_SAMPLE_RATE = 1.0
+PROFILE_DIR = None
+
+# DBSCAN neighbour search (main/neighbors.py): the default engine searches once at eps in chunks of
+# DBSCAN_CHUNK_MAX_BYTES and keeps the radius graph for smaller eps when it fits in DBSCAN_GRAPH_MAX_BYTES;
+# engine=graph builds it for the largest radius up to DBSCAN_GRAPH_RADIUS that fits
+DBSCAN_GRAPH_RADIUS = 1.0
+DBSCAN_GRAPH_MAX_BYTES = 64 * 1024 * 1024
+DBSCAN_CHUNK_MAX_BYTES = 16 * 1024 * 1024
+
+# GET /api/movies/export/ (main/export.py) streams the filtered movies this many rows at a time;
+# Parquet needs the optional pyarrow package
+EXPORT_CHUNK_ROWS = 10000
+
+# GET /api/movies/aggregate/ (main/aggregate.py): largest number of bins per histogram axis.
+# Results are kept in the clustering results cache above
+AGGREGATE_MAX_BINS = 200
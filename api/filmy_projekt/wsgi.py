@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'filmy_projekt.settings')
 
 application = get_wsgi_application()
+
+# Map the movie dataset before workers are forked (gunicorn --preload) so they share its pages
+from main.dataset import store  # noqa: E402
+store.get()
@@ -0,0 +1,247 @@
+"""Statistics of the movies matching the movie list ``filters`` for charts.
+
+Three kinds of aggregation, each a few kilobytes of JSON however many movies
+match:
+
+* ``groupby`` - count and, for a numeric ``column``, mean, median, min, max
+  and percentiles per genre, spoken language or release year. A movie counts
+  in every genre and language it lists,
+* ``histogram`` - equal-width bins of a numeric column,
+* ``histogram2d`` - counts over a grid of equal-width bins of two columns.
+
+Everything works on the cached float columns of ``MovieIndex`` and the genre
+and language matrices (genres.py): per-group sums are ``bincount`` and
+percentiles are read from one ``lexsort`` by group and value. Bins span the
+column over the whole dataset unless a range is given, so charts keep their
+axes as the filters change.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .genres import get_genre_matrix
+from .query import COLUMN_TYPES, get_movie_index
+from .timing import timed
+
+KINDS = ('groupby', 'histogram', 'histogram2d')
+GROUP_COLUMNS = {'genre': 'genres', 'language': 'spoken_languages', 'year': 'release_date'}
+NUMERIC = tuple(column for column, col_type in COLUMN_TYPES.items() if col_type == 'numeric' and column != 'id')
+
+DEFAULT_PERCENTILES = (25, 75)
+DEFAULT_BINS = 20
+MAX_BINS = getattr(settings, 'AGGREGATE_MAX_BINS', 200)
+
+
+def _numeric_column(params, name, required=True):
+    column = params.get(name)
+    if not column:
+        if required:
+            raise ValueError(f"{name} is required")
+        return None
+    if column not in NUMERIC:
+        raise ValueError(f"{name} must be one of: {', '.join(NUMERIC)}")
+    return column
+
+
+def _bins(value):
+    message = f"bins must be an integer between 1 and {MAX_BINS}"
+    try:
+        bins = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(message)
+    if not 1 <= bins <= MAX_BINS:
+        raise ValueError(message)
+    return bins
+
+
+def _finite(value, message):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(message)
+    if not math.isfinite(number):
+        raise ValueError(message)
+    return number
+
+
+def _range(value):
+    """``"lo,hi"`` -> ``[lo, hi]``, None when not given."""
+    if not value:
+        return None
+    message = "range must be 'low,high' with finite numbers and low < high"
+    parts = str(value).split(',')
+    if len(parts) != 2:
+        raise ValueError(message)
+    low, high = (_finite(part, message) for part in parts)
+    if not low < high:
+        raise ValueError(message)
+    return [low, high]
+
+
+def parse_aggregate_params(params):
+    kind = params.get('kind') or 'groupby'
+    if kind not in KINDS:
+        raise ValueError(f"Unknown kind '{kind}', use one of: {', '.join(KINDS)}")
+
+    if kind == 'groupby':
+        by = params.get('by')
+        if by not in GROUP_COLUMNS:
+            raise ValueError(f"by must be one of: {', '.join(GROUP_COLUMNS)}")
+        percentiles = params.get('percentiles')
+        message = "percentiles must be numbers between 0 and 100"
+        percentiles = [_finite(p, message) for p in str(percentiles).split(',') if p.strip()] if percentiles \
+            else list(DEFAULT_PERCENTILES)
+        if not all(0 <= p <= 100 for p in percentiles):
+            raise ValueError(message)
+        return {'kind': kind, 'by': by, 'column': _numeric_column(params, 'column', required=False),
+                'percentiles': sorted(set(percentiles))}
+
+    if kind == 'histogram':
+        return {'kind': kind, 'column': _numeric_column(params, 'column'),
+                'bins': _bins(params.get('bins', DEFAULT_BINS)), 'range': _range(params.get('range'))}
+
+    # histogram2d: ?bins=n or ?bins=nx,ny
+    bins = str(params.get('bins', DEFAULT_BINS)).split(',')
+    if len(bins) > 2:
+        raise ValueError("bins must be 'n' or 'nx,ny'")
+    return {'kind': kind, 'x': _numeric_column(params, 'x'), 'y': _numeric_column(params, 'y'),
+            'bins': [_bins(bins[0]), _bins(bins[-1])],
+            'x_range': _range(params.get('x_range')), 'y_range': _range(params.get('y_range'))}
+
+
+def _float(value):
+    return None if np.isnan(value) else float(value)
+
+
+def _release_years(dataset):
+    dates = pd.Series(dataset.column('release_date'), dtype=object)
+    return pd.to_numeric(dates.str[:4], errors='coerce').to_numpy(dtype=np.float64)
+
+
+def _groups(dataset, by, rows):
+    """``(names, groups, rows)``: a group code per (movie, group) pair of ``rows`` and the movie of each pair."""
+    if by == 'year':
+        years = dataset.cached('release_years', _release_years)[rows]
+        known = ~np.isnan(years)
+        names, groups = np.unique(years[known].astype(np.int64), return_inverse=True)
+        return [int(name) for name in names], groups, rows[known]
+
+    matrix = get_genre_matrix(dataset, GROUP_COLUMNS[by])
+    selected = matrix.matrix[rows]
+    return matrix.names, selected.indices, np.repeat(rows, np.diff(selected.indptr))
+
+
+def _percentile(ordered, starts, sizes, percentile):
+    position = starts + np.maximum(sizes - 1, 0) * (percentile / 100)
+    low = np.floor(position)
+    lower = ordered[np.minimum(low.astype(np.int64), len(ordered) - 1)]
+    upper = ordered[np.minimum(np.ceil(position).astype(np.int64), len(ordered) - 1)]
+    return lower + (upper - lower) * (position - low)
+
+
+def grouped_stats(groups, values, n_groups, percentiles):
+    """Count, mean, min, max and ``percentiles`` (linear, like ``np.percentile``) of ``values`` per group.
+
+    NaN values are left out of everything but the count.
+    """
+    stats = {'count': np.bincount(groups, minlength=n_groups)}
+    valid = ~np.isnan(values)
+    groups, values = groups[valid], values[valid]
+    sizes = np.bincount(groups, minlength=n_groups)
+    empty = sizes == 0
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats['mean'] = np.bincount(groups, weights=values, minlength=n_groups) / sizes
+
+    # Values sorted by group, then by value: group g is ordered[starts[g]:starts[g] + sizes[g]]
+    ordered = values[np.lexsort((values, groups))]
+    if len(ordered) == 0:
+        ordered = np.full(1, np.nan)
+    starts = np.cumsum(sizes) - sizes
+    last = starts + np.maximum(sizes - 1, 0)
+    stats['min'] = np.where(empty, np.nan, ordered[np.minimum(starts, len(ordered) - 1)])
+    stats['max'] = np.where(empty, np.nan, ordered[np.minimum(last, len(ordered) - 1)])
+    stats['median'] = np.where(empty, np.nan, _percentile(ordered, starts, sizes, 50))
+    for percentile in percentiles:
+        stats[f'p{percentile:g}'] = np.where(empty, np.nan, _percentile(ordered, starts, sizes, percentile))
+    return stats
+
+
+def group_by(dataset, index, rows, params):
+    names, groups, pair_rows = _groups(dataset, params['by'], rows)
+    result = {'by': params['by'], 'column': params['column'], 'total_count': len(rows)}
+    if params['column'] is None:
+        counts = np.bincount(groups, minlength=len(names))
+        result['groups'] = [{'key': name, 'count': int(count)} for name, count in zip(names, counts) if count]
+        return result
+
+    values = index.sort_columns[params['column']][pair_rows]
+    stats = grouped_stats(groups, values, len(names), params['percentiles'])
+    result['groups'] = [
+        {'key': name, 'count': int(stats['count'][group]),
+         **{stat: _float(column[group]) for stat, column in stats.items() if stat != 'count'}}
+        for group, name in enumerate(names) if stats['count'][group]
+    ]
+    return result
+
+
+def _bin_range(index, column, given):
+    if given is not None:
+        return given
+    numeric = index.numeric[column]
+    if numeric.n_valid == 0:
+        return [0.0, 1.0]
+    return [float(numeric.sorted_values[0]), float(numeric.sorted_values[-1])]
+
+
+def histogram(index, rows, params):
+    column = params['column']
+    values = index.sort_columns[column][rows]
+    values = values[~np.isnan(values)]
+    low, high = _bin_range(index, column, params['range'])
+    counts, edges = np.histogram(values, bins=params['bins'], range=(low, high))
+    return {
+        'column': column,
+        'total_count': len(rows),
+        'missing': len(rows) - len(values),
+        'outside': int(len(values) - counts.sum()),
+        'edges': edges.tolist(),
+        'counts': counts.tolist(),
+    }
+
+
+def histogram2d(index, rows, params):
+    x = index.sort_columns[params['x']][rows]
+    y = index.sort_columns[params['y']][rows]
+    known = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[known], y[known]
+    ranges = [_bin_range(index, params['x'], params['x_range']), _bin_range(index, params['y'], params['y_range'])]
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=params['bins'], range=ranges)
+    counts = counts.astype(np.int64)
+    return {
+        'x': params['x'],
+        'y': params['y'],
+        'total_count': len(rows),
+        'missing': len(rows) - len(x),
+        'outside': int(len(x) - counts.sum()),
+        'x_edges': x_edges.tolist(),
+        'y_edges': y_edges.tolist(),
+        # counts[i][j]: movies in x bin i and y bin j
+        'counts': counts.tolist(),
+    }
+
+
+@timed('aggregate')
+def aggregate(dataset, filters, params):
+    """Aggregation of ``parse_aggregate_params`` over the movies matching ``filters``."""
+    index = get_movie_index(dataset)
+    rows = index.positions(filters)
+    if params['kind'] == 'groupby':
+        result = group_by(dataset, index, rows, params)
+    elif params['kind'] == 'histogram':
+        result = histogram(index, rows, params)
+    else:
+        result = histogram2d(index, rows, params)
+    return {'kind': params['kind'], **result}
@@ -0,0 +1,134 @@
+"""Async entry points of the API views for ASGI servers (``filmy_projekt/asgi.py``).
+
+The views stay synchronous DRF views; ``async_view`` decides where they run:
+
+* cheap reads (the movie list, autocomplete, job status...) are called
+  directly on the event loop; the movie list and autocomplete only once the
+  dataset, its index and the requested sort order are built
+  (``movie_index_missing``), the request that needs them built goes to the
+  pool,
+* clustering, prediction and the other CPU-heavy views go to a bounded
+  thread pool (``ASYNC_EXECUTOR_WORKERS``), so a long scikit-learn fit never
+  blocks the loop; numpy and scikit-learn release the GIL for most of it.
+
+Every endpoint can be limited to ``ASYNC_ENDPOINT_LIMITS[name]`` requests at a
+time (``ASYNC_DEFAULT_LIMIT`` for offloaded ones without an entry). Requests
+over the limit wait, and once more than ``ASYNC_MAX_WAITING`` of them wait
+for the same endpoint the next ones get 503. Under WSGI Django runs the
+async views in a fresh event loop per request, the limits then do not
+apply and the WSGI server's own thread count bounds the concurrency.
+
+Django serves a streamed response with a sync iterator under ASGI by reading
+it into a list first; ``async_view`` hands such iterators to the executor
+one chunk at a time instead, so exports keep streaming.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
+
+from .timing import run_profiled, save_profile
+
+EXECUTOR_WORKERS = getattr(settings, 'ASYNC_EXECUTOR_WORKERS', 4)
+ENDPOINT_LIMITS = getattr(settings, 'ASYNC_ENDPOINT_LIMITS', {})
+DEFAULT_LIMIT = getattr(settings, 'ASYNC_DEFAULT_LIMIT', 8)
+MAX_WAITING = getattr(settings, 'ASYNC_MAX_WAITING', 32)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix='api-view')
+        return _executor
+
+
+class EndpointLimit:
+    """At most ``limit`` concurrent requests of one endpoint, per event loop."""
+
+    def __init__(self, limit, max_waiting):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._waiting = weakref.WeakKeyDictionary()
+
+    async def run(self, call):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.limit)
+        if semaphore.locked() and self._waiting.get(loop, 0) >= self.max_waiting:
+            return None
+        self._waiting[loop] = self._waiting.get(loop, 0) + 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting[loop] -= 1
+        try:
+            return await call()
+        finally:
+            semaphore.release()
+
+
+def _offloaded(view, endpoint, request, args, kwargs):
+    started = time.perf_counter()
+    response, profile = run_profiled(lambda: view(request, *args, **kwargs), offloaded=True)
+    if profile is not None:
+        save_profile(profile, endpoint, (time.perf_counter() - started) * 1000)
+    return response
+
+
+async def _iterate(iterator):
+    """Chunks of the sync ``iterator``, each produced in the executor."""
+    loop = asyncio.get_running_loop()
+    done = object()
+    while True:
+        chunk = await loop.run_in_executor(get_executor(), next, iterator, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+def _stream_async(request, response):
+    if isinstance(request, ASGIRequest) and getattr(response, 'streaming', False) and not response.is_async:
+        response.streaming_content = _iterate(iter(response.streaming_content))
+    return response
+
+
+def async_view(view, endpoint, offload=True):
+    """Async version of the sync ``view`` registered under the URL name ``endpoint``.
+
+    ``offload`` may also be a callable, called with every request, that tells
+    whether this one has to go to the executor.
+    """
+    limit = ENDPOINT_LIMITS.get(endpoint, DEFAULT_LIMIT if offload is True else None)
+    gate = EndpointLimit(limit, MAX_WAITING) if limit else None
+
+    async def call(request, args, kwargs):
+        if not (offload(request) if callable(offload) else offload):
+            return view(request, *args, **kwargs)
+        # The context carries the request's stage timings into the worker thread
+        context = contextvars.copy_context()
+        task = functools.partial(context.run, _offloaded, view, endpoint, request, args, kwargs)
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), task)
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if gate is None:
+            return _stream_async(request, await call(request, args, kwargs))
+        response = await gate.run(lambda: call(request, args, kwargs))
+        if response is None:
+            return JsonResponse({"detail": "Too many concurrent requests, try again later."}, status=503)
+        return _stream_async(request, response)
+
+    return wrapper
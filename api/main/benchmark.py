@@ -0,0 +1,179 @@
+"""In-process benchmark of the API endpoints, see ``manage.py benchmark``.
+
+Requests go through the Django test client against a ``DatasetStore`` of a
+synthetic dataset (``synthetic.py``), so the numbers cover routing,
+parsing, the computation and the encoding, but no network or server. The
+first request of an endpoint is reported apart as ``cold_ms``: it also
+builds the indexes and matrices the later ones reuse.
+
+K-Means responses are kept in the result cache, so for the ``CACHED``
+endpoints it is cleared before every request and the timings are of the
+clustering itself; one more repeated request is reported as
+``cache_hit_ms``. DBSCAN responses are not cached, its warm requests only
+reuse the neighbor graph like the eps slider does.
+
+``compare_dbscan`` times the default DBSCAN engine against plain sklearn on
+cold requests, where no graph can be reused.
+"""
+import json
+import time
+
+import numpy as np
+
+from . import dataset as dataset_module
+from .cache import clustering_cache
+from .dataset import Dataset
+from .neighbors import dbscan
+
+FILTER_MIXES = [
+    [],
+    [{"column": "title", "operator": "contains", "value": "the"}],
+    [{"column": "title", "operator": "startswith", "value": "star"}],
+    [{"column": "genres", "operator": "contains", "value": "Drama"}, {"column": "vote_average", "operator": "gte", "value": 7}],
+    [{"column": "spoken_languages", "operator": "contains", "value": "French"}, {"column": "budget", "operator": "gt", "value": 1000000}],
+    [{"column": "runtime", "operator": "gte", "value": 90}, {"column": "runtime", "operator": "lte", "value": 120},
+     {"column": "popularity", "operator": "gt", "value": 5}],
+]
+
+# name -> requests ``(method, path, params)`` cycled through by the runs
+ENDPOINTS = {
+    'movies': [('get', '/api/movies/', {'filters': json.dumps(filters), 'page': 2, 'limit': 20}) for filters in FILTER_MIXES],
+    'movies_sorted': [('get', '/api/movies/', {'filters': json.dumps(filters), 'sort': '-popularity', 'cursor': ''})
+                      for filters in FILTER_MIXES],
+    'kmeans': [('get', '/api/clustering/kmeans/', {'k': k}) for k in (3, 5, 8)],
+    'dbscan': [('get', '/api/clustering/dbscan/', {'eps': eps, 'minPts': 5}) for eps in (0.2, 0.3, 0.5)],
+    'predict': [('post', '/api/clustering/predict/', {'vote_average': 6.5 + i / 10, 'budget': 1e7 * (i + 1), 'genre': genre})
+                for i, genre in enumerate(('Action', 'Drama', 'Comedy'))],
+}
+
+# Endpoints answered from ``clustering_cache`` once their parameters were seen
+CACHED = {'kmeans'}
+
+DBSCAN_FEATURES = ['vote_average', 'vote_count', 'popularity', 'budget', 'revenue', 'runtime']
+DBSCAN_EPS = (0.2, 0.5, 1.0, 1.5)
+
+
+def _reset_peak_rss():
+    # Linux resets the high water mark of the process on "5"
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _request(client, method, path, params):
+    if method == 'post':
+        return client.post(path, params, content_type='application/json')
+    return client.get(path, params)
+
+
+def _timed_request(client, method, path, params):
+    started = time.perf_counter()
+    response = _request(client, method, path, params)
+    if getattr(response, 'streaming', False):
+        b''.join(response.streaming_content)
+    return response, (time.perf_counter() - started) * 1000
+
+
+def run_endpoint(client, requests, count, clear_cache=False):
+    """Latency summary of ``count`` requests cycling through ``requests``.
+
+    With ``clear_cache`` the result cache is emptied before each request
+    (outside of the timing) and a repeated last request is reported as
+    ``cache_hit_ms``.
+    """
+    rss_reset = _reset_peak_rss()
+    statuses = {}
+    timings = []
+    elapsed = 0.0
+    for i in range(count):
+        method, path, params = requests[i % len(requests)]
+        if clear_cache:
+            clustering_cache.clear()
+        response, took = _timed_request(client, method, path, params)
+        timings.append(took)
+        elapsed += took / 1000
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    warm = np.array(timings[1:] or timings)
+    result = {
+        'requests': count,
+        'status_codes': statuses,
+        'cold_ms': round(timings[0], 3),
+        'mean_ms': round(float(warm.mean()), 3),
+        'p50_ms': round(float(np.percentile(warm, 50)), 3),
+        'p90_ms': round(float(np.percentile(warm, 90)), 3),
+        'p99_ms': round(float(np.percentile(warm, 99)), 3),
+        'max_ms': round(float(warm.max()), 3),
+        'throughput_rps': round(count / elapsed, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        # Without a reset the peak is the one of the whole process so far
+        'peak_rss_scope': 'endpoint' if rss_reset else 'process',
+    }
+    if clear_cache:
+        _, took = _timed_request(client, method, path, params)
+        result['cache_hit_ms'] = round(took, 3)
+    return result
+
+
+def run_scale(csv_path, endpoints, count, progress=None):
+    """``(rows, results of every endpoint)`` against the dataset in ``csv_path``.
+
+    ``progress(name, result)`` is called after each endpoint.
+    """
+    from django.test import Client
+
+    previous = dataset_module.store
+    dataset_module.store = dataset_module.DatasetStore(csv_path)
+    clustering_cache.clear()
+    try:
+        rows = len(dataset_module.get_dataset())
+        client = Client()
+        results = {}
+        for name in endpoints:
+            results[name] = run_endpoint(client, ENDPOINTS[name], count, clear_cache=name in CACHED)
+            if progress is not None:
+                progress(name, results[name])
+        return rows, results
+    finally:
+        dataset_module.store = previous
+        clustering_cache.clear()
+
+
+def compare_dbscan(df, eps_values=DBSCAN_EPS, min_samples=5, repeat=3, features=DBSCAN_FEATURES):
+    """``{eps: {'sklearn_ms', 'auto_ms', 'auto_engine'}}`` of cold DBSCAN runs, best of ``repeat``.
+
+    Every run gets a new ``Dataset`` of ``df``, so nothing is reused from an
+    earlier one and both engines build their matrices and KD-tree.
+    """
+    results = {}
+    for eps in eps_values:
+        best = {}
+        for _ in range(repeat):
+            for engine in ('sklearn', 'auto'):
+                dataset = Dataset(df, (0, len(df)))
+                started = time.perf_counter()
+                _, used, _ = dbscan(dataset, features, eps, min_samples, engine)
+                took = (time.perf_counter() - started) * 1000
+                if took < best.get(engine, (float('inf'),))[0]:
+                    best[engine] = took, used
+        results[eps] = {
+            'sklearn_ms': round(best['sklearn'][0], 3),
+            'auto_ms': round(best['auto'][0], 3),
+            'auto_engine': best['auto'][1],
+        }
+    return results
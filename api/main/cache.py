@@ -0,0 +1,78 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def make_key(namespace, params, fingerprint):
+    """Cache key from normalized request parameters and the dataset fingerprint."""
+    encoded = json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)
+    return f"{namespace}:{fingerprint}:{hashlib.sha1(encoded.encode('utf-8')).hexdigest()}"
+
+
+class ResultCache:
+    """LRU of encoded response bodies bounded by their total size in bytes.
+
+    When ``alias`` names a Django cache backend, entries are also written
+    there so other workers can reuse them; the local LRU stays in front of it.
+    """
+
+    def __init__(self, max_bytes, alias=None, timeout=None):
+        self.max_bytes = max_bytes
+        self.alias = alias
+        self.timeout = timeout
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _backend(self):
+        return caches[self.alias] if self.alias else None
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                return body
+
+        backend = self._backend()
+        if backend is None:
+            return None
+        body = backend.get(key)
+        if body is not None:
+            self._store(key, body)
+        return body
+
+    def set(self, key, body):
+        self._store(key, body)
+        backend = self._backend()
+        if backend is not None:
+            backend.set(key, body, self.timeout)
+
+    def _store(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+clustering_cache = ResultCache(
+    getattr(settings, 'CLUSTERING_CACHE_MAX_BYTES', 64 * 1024 * 1024),
+    alias=getattr(settings, 'CLUSTERING_CACHE_ALIAS', None),
+    timeout=getattr(settings, 'CLUSTERING_CACHE_TIMEOUT', None),
+)
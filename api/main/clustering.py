@@ -0,0 +1,241 @@
+import math
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+
+from .features import SCALERS, get_feature_matrices, projection_key
+from .genres import get_genre_matrix
+from .neighbors import ENGINES, dbscan
+from .timing import span
+from .query import COLUMN_TYPES
+
+DEFAULT_FEATURES = ['vote_average', 'vote_count', 'popularity', 'budget', 'revenue', 'runtime']
+
+
+class ClusteringError(Exception):
+    pass
+
+
+class ClusteringResult:
+    """Outcome of one clustering run, kept columnar until it is encoded (see ``renderers.py``).
+
+    ``meta`` holds the scalar fields of the response, the frames become
+    ``cluster_summary``, ``movies_with_cluster`` and ``pca_data``.
+    """
+
+    def __init__(self, meta, cluster_summary, movies, pca):
+        self.meta = {key: value.item() if isinstance(value, np.generic) else value for key, value in meta.items()}
+        self.cluster_summary = cluster_summary
+        self.movies = movies
+        self.pca = pca
+
+
+def _number(params, name, default, convert):
+    """``params[name]`` as ``convert`` (int or float); JSON bodies may hold any type, so anything else is a ValueError."""
+    value = params.get(name, default)
+    if isinstance(value, (bool, list, dict)):
+        raise ValueError(f"{name} must be a number")
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+
+
+def parse_features(features_query):
+    """Feature list from ``?features=a,b`` (or a JSON list), defaults when empty. Raises ValueError for unknown columns."""
+    if not features_query:
+        return list(DEFAULT_FEATURES)
+    if isinstance(features_query, str):
+        features_query = features_query.split(',')
+    if not isinstance(features_query, list) or not all(isinstance(feature, str) for feature in features_query):
+        raise ValueError("features must be a comma-separated list of column names")
+
+    features = []
+    for feature in features_query:
+        feature = feature.strip()
+        if not feature or feature in features:
+            continue
+        if COLUMN_TYPES.get(feature) != 'numeric' or feature == 'id':
+            raise ValueError(f"Unknown feature '{feature}'")
+        features.append(feature)
+    if not features:
+        return list(DEFAULT_FEATURES)
+    return features
+
+
+def parse_scaler(tf):
+    """Scaler name from ``?tf=``, standardScaler when not given."""
+    if not tf:
+        return 'standardScaler'
+    if not isinstance(tf, str) or tf not in SCALERS:
+        raise ValueError(f"Unknown transformation '{tf}', use one of: {', '.join(SCALERS)}")
+    return tf
+
+
+def parse_kmeans_params(params):
+    n_clusters = _number(params, 'k', 5, int)
+    if n_clusters < 2:
+        raise ValueError("k must be at least 2")
+    return {
+        'k': n_clusters,
+        'features': parse_features(params.get('features')),
+        'tf': parse_scaler(params.get('tf')),
+    }
+
+
+def parse_dbscan_params(params):
+    eps = _number(params, 'eps', 0.5, float)
+    min_samples = _number(params, 'minPts', 5, int)
+    if not math.isfinite(eps) or eps <= 0 or min_samples < 2:
+        raise ValueError("eps must be > 0 a minPts >= 2")
+    engine = params.get('engine') or 'auto'
+    if not isinstance(engine, str) or engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', use one of: {', '.join(ENGINES)}")
+    return {
+        'eps': eps,
+        'minPts': min_samples,
+        'features': parse_features(params.get('features')),
+        'engine': engine,
+    }
+
+
+def run_clustering(dataset, kind, params, progress=None):
+    """Payload of one clustering request; ``params`` come from ``parse_<kind>_params``."""
+    if kind == 'kmeans':
+        return kmeans_clustering(dataset, params['k'], params['features'], params['tf'], progress)
+    if kind == 'dbscan':
+        return dbscan_clustering(dataset, params['eps'], params['minPts'], params['features'], progress,
+                                 engine=params.get('engine', 'auto'))
+    raise ValueError(f"Unknown clustering '{kind}'")
+
+
+def _report(progress, stage, fraction):
+    if progress is not None:
+        progress(stage, fraction)
+
+
+def kmeans_clustering(dataset, n_clusters, numeric_features, scaler_name, progress=None):
+    # Data preparation (the shared frame is read-only, work on a copy of the needed columns)
+    df = dataset.df[['id', 'title', 'genres'] + numeric_features].copy()
+
+    try:
+        # Preprocessing (imputed and scaled once per dataset version)
+        _report(progress, 'preprocessing', 0.0)
+        X_scaled = get_feature_matrices(dataset).scaled(numeric_features, scaler_name)
+
+        # K-Means
+        _report(progress, 'fitting', 0.1)
+        with span('fit'):
+            kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+            clusters = kmeans.fit_predict(X_scaled)
+
+        df['cluster'] = clusters
+
+        # Reduction dimension pro visualisation (shared by every k for the same features)
+        _report(progress, 'projection', 0.7)
+        principal_components = get_feature_matrices(dataset).projection(numeric_features, scaler_name)
+
+    except Exception as e:
+        raise ClusteringError(f"Error while K-Means or PCA: {e}")
+
+    _report(progress, 'summary', 0.8)
+
+    # Summary
+    with span('summary'):
+        cluster_summary = df.groupby('cluster')[numeric_features].agg(['count', 'mean']).reset_index()
+    cluster_summary.columns = ['_'.join(col).strip() if col[1] else col[0] for col in cluster_summary.columns.values]
+
+    cluster_summary.rename(columns={'vote_average_count': 'movie_count'}, inplace=True)
+    cluster_summary['cluster'] = cluster_summary['cluster'].astype(int)
+
+    # Dominant genre and genre distribution (one sparse product over all clusters)
+    cluster_ids = np.arange(n_clusters)
+    with span('genres'):
+        dominant_genres, genre_distributions = get_genre_matrix(dataset).summary(clusters, cluster_ids)
+    cluster_genres = pd.DataFrame({
+        'cluster': cluster_ids, 'dominant_genre': dominant_genres, 'genre_distribution': genre_distributions,
+    })
+
+    summary_df = cluster_summary.merge(cluster_genres, on='cluster')
+
+    # Film details
+    movies_to_serialize = df[['id', 'title', 'cluster'] + numeric_features].copy()
+
+    # Data for PCA visualisation
+    pca_df = pd.DataFrame(data=principal_components, columns=['PC1', 'PC2'])
+    pca_df['cluster'] = clusters
+
+    # 6. Serialization (JSON-incompatible values)
+    summary_df.replace([np.inf, -np.inf], np.nan, inplace=True)
+    movies_to_serialize.replace([np.inf, -np.inf], np.nan, inplace=True)
+    pca_df.replace([np.inf, -np.inf], np.nan, inplace=True)
+
+    return ClusteringResult(
+        {"n_clusters": n_clusters, "projection": projection_key(dataset, numeric_features, scaler_name)},
+        summary_df, movies_to_serialize, pca_df
+    )
+
+
+def dbscan_clustering(dataset, eps, min_samples, numeric_features, progress=None, engine='auto'):
+    df = dataset.df[['id', 'title', 'genres'] + numeric_features].copy()
+
+    try:
+        _report(progress, 'preprocessing', 0.0)
+        get_feature_matrices(dataset).scaled(numeric_features, 'standardScaler')
+
+        # Neighbour search and labelling, see neighbors.py for the engines
+        _report(progress, 'fitting', 0.1)
+        started = time.perf_counter()
+        with span('fit'):
+            clusters, engine, graph_reused = dbscan(dataset, numeric_features, eps, min_samples, engine)
+        engine_ms = (time.perf_counter() - started) * 1000
+
+        df['cluster'] = clusters
+
+        _report(progress, 'projection', 0.7)
+        principal_components = get_feature_matrices(dataset).projection(numeric_features, 'standardScaler')
+
+    except Exception as e:
+        raise ClusteringError(f"Chyba při DBSCAN: {e}")
+
+    _report(progress, 'summary', 0.8)
+
+    clustered_df = df[df['cluster'] != -1].copy()
+    noise_points = len(df[df['cluster'] == -1])
+
+    unique_clusters = clustered_df['cluster'].unique()
+    n_clusters = len(unique_clusters)
+
+    with span('summary'):
+        cluster_summary = clustered_df.groupby('cluster')[numeric_features].agg(['count', 'mean']).reset_index()
+    cluster_summary.columns = ['_'.join(col).strip() if col[1] else col[0] for col in cluster_summary.columns.values]
+
+    cluster_summary.rename(columns={f'{numeric_features[0]}_count': 'movie_count', 'cluster': 'cluster_id'}, inplace=True)
+    cluster_summary['cluster_id'] = cluster_summary['cluster_id'].astype(int)
+
+    with span('genres'):
+        dominant_genres, genre_distributions = get_genre_matrix(dataset).summary(clusters, unique_clusters)
+    cluster_genres = pd.DataFrame({
+        'cluster_id': unique_clusters.astype(int), 'dominant_genre': dominant_genres,
+        'genre_distribution': genre_distributions,
+    })
+
+    summary_df = cluster_summary.merge(cluster_genres, on='cluster_id', how='left')
+    movies_to_serialize = df[['id', 'title', 'cluster'] + numeric_features].copy()
+    pca_df = pd.DataFrame(data=principal_components, columns=['PC1', 'PC2'])
+    pca_df['cluster'] = clusters
+
+    summary_df.replace([np.inf, -np.inf], np.nan, inplace=True)
+    movies_to_serialize.replace([np.inf, -np.inf], np.nan, inplace=True)
+    pca_df.replace([np.inf, -np.inf], np.nan, inplace=True)
+
+    return ClusteringResult(
+        {
+            "n_clusters": n_clusters, "noise_points": noise_points, "eps": eps, "min_samples": min_samples,
+            "engine": engine, "engine_ms": round(engine_ms, 3), "graph_reused": graph_reused,
+            "projection": projection_key(dataset, numeric_features, 'standardScaler'),
+        },
+        summary_df, movies_to_serialize, pca_df
+    )
@@ -0,0 +1,149 @@
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .segments import SegmentStore, file_version
+from .timing import span
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+PROJECT_ROOT = BASE_DIR.parent
+CSV_FILENAME = 'tmdb_movie_data.csv'
+DATA_FILE_PATH = os.path.join(PROJECT_ROOT, CSV_FILENAME)
+
+# Columns where 0 means "unknown" in the TMDB export
+ZERO_AS_MISSING = ['budget', 'revenue', 'runtime']
+NUMERIC_COLUMNS = ['id', 'vote_average', 'vote_count', 'popularity', 'budget', 'revenue', 'runtime']
+STRING_COLUMNS = ['title', 'release_date', 'genres', 'spoken_languages']
+
+
+def clean_dataframe(df):
+    # Replace 0 in budget/revenue/runtime for NaN
+    df[ZERO_AS_MISSING] = df[ZERO_AS_MISSING].replace(0, np.nan)
+    for column in NUMERIC_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+    for column in STRING_COLUMNS:
+        df[column] = df[column].astype(object)
+    return df
+
+
+def _read_only(values):
+    values = values.view()
+    values.flags.writeable = False
+    return values
+
+
+class Dataset:
+    """One loaded and cleaned version of the movie data.
+
+    ``df`` is shared by every request, so views must not write into it;
+    ``column`` hands out read-only numpy arrays. Structures derived from the
+    data (indexes, matrices...) are memoized with ``cached`` and are dropped
+    together with the dataset once the source file changes.
+    """
+
+    def __init__(self, df, version):
+        self.df = df
+        self.version = version
+        self.fingerprint = '%x-%x' % version
+        self._derived = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.df)
+
+    def column(self, name):
+        return self.cached(('column', name), lambda dataset: _read_only(dataset.df[name].to_numpy()))
+
+    def is_cached(self, key):
+        return key in self._derived
+
+    def cached(self, key, factory):
+        try:
+            return self._derived[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._derived:
+                self._derived[key] = factory(self)
+            return self._derived[key]
+
+
+class DatasetStore:
+    """Process-wide holder of the current ``Dataset``.
+
+    The data is the base CSV plus the segments appended by
+    ``download_data.py`` (see ``segments.py``). It is loaded once and
+    reloaded when the segment manifest changes, so new downloads are picked
+    up without a restart. A binary snapshot built from the same version of
+    the base is mapped instead of parsing the text (see ``snapshot.py``).
+    """
+
+    # Compaction may delete the files of a manifest that was just read
+    READ_ATTEMPTS = 3
+
+    def __init__(self, path, snapshot_path=None):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.segments = SegmentStore(path)
+        self._dataset = None
+        self._lock = threading.Lock()
+
+    def source_version(self):
+        return self.segments.version()
+
+    def read_base(self, path):
+        if self.snapshot_path:
+            from .snapshot import load_snapshot
+            df = load_snapshot(self.snapshot_path, source_version=file_version(path))
+            if df is not None:
+                return df
+        return clean_dataframe(pd.read_csv(path))
+
+    def read_source(self):
+        for attempt in range(self.READ_ATTEMPTS):
+            try:
+                base, *segments = self.segments.files()
+                df = self.read_base(base)
+                if segments:
+                    appended = clean_dataframe(pd.concat([pd.read_csv(path) for path in segments], ignore_index=True))
+                    df = pd.concat([df, appended[df.columns]], ignore_index=True)
+                return df
+            except FileNotFoundError:
+                if attempt == self.READ_ATTEMPTS - 1:
+                    raise
+
+    def current(self):
+        """The loaded dataset if it is still the current version, without loading anything."""
+        dataset = self._dataset
+        if dataset is None or dataset.version != self.source_version():
+            return None
+        return dataset
+
+    def get(self):
+        version = self.source_version()
+        if version is None:
+            return None
+
+        dataset = self._dataset
+        if dataset is not None and dataset.version == version:
+            return dataset
+
+        with self._lock:
+            if self._dataset is None or self._dataset.version != version:
+                try:
+                    with span('dataset_load'):
+                        df = self.read_source()
+                except FileNotFoundError:
+                    return None
+                self._dataset = Dataset(df, version)
+            return self._dataset
+
+
+store = DatasetStore(DATA_FILE_PATH, snapshot_path=os.path.splitext(DATA_FILE_PATH)[0] + '.snapshot')
+
+
+def get_dataset():
+    return store.get()
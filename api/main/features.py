@@ -0,0 +1,86 @@
+"""Preprocessed feature matrices shared by the clustering algorithms.
+
+Median imputation, scaling and the 2-D PCA projection only depend on the
+dataset, the feature set and the scaler, so each combination is computed once
+per dataset version and kept as a read-only C-contiguous array.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from sklearn.decomposition import PCA
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+from .timing import span
+
+SCALERS = {
+    'standardScaler': StandardScaler,
+    'minMaxScaler': MinMaxScaler,
+}
+
+
+class FeatureMatrices:
+    # Enough for every scaler over the feature combinations the clustering page offers
+    MAX_ENTRIES = 32
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, key, build):
+        with self._lock:
+            matrix = self._entries.get(key)
+            if matrix is not None:
+                self._entries.move_to_end(key)
+                return matrix
+        # The kind of matrix names the stage: imputed, scaled or projection (scaled includes imputed)
+        with span(key[0]):
+            matrix = np.ascontiguousarray(build())
+        matrix.flags.writeable = False
+        with self._lock:
+            self._entries[key] = matrix
+            if len(self._entries) > self.MAX_ENTRIES:
+                self._entries.popitem(last=False)
+        return matrix
+
+    def imputed(self, features, dtype=np.float64):
+        features = tuple(features)
+        dtype = np.dtype(dtype)
+
+        def build():
+            X = self.dataset.df[list(features)]
+            return SimpleImputer(strategy='median').fit_transform(X).astype(dtype, copy=False)
+
+        return self._cached(('imputed', features, dtype.str), build)
+
+    def scaled(self, features, scaler_name, dtype=np.float64):
+        features = tuple(features)
+        dtype = np.dtype(dtype)
+
+        def build():
+            X_imputed = self.imputed(features, np.float64)
+            return SCALERS[scaler_name]().fit_transform(X_imputed).astype(dtype, copy=False)
+
+        return self._cached(('scaled', features, scaler_name, dtype.str), build)
+
+    def projection(self, features, scaler_name):
+        """2-D PCA coordinates of every movie, independent of the clustering parameters."""
+        features = tuple(features)
+
+        def build():
+            return PCA(n_components=2).fit_transform(self.scaled(features, scaler_name))
+
+        return self._cached(('projection', features, scaler_name), build)
+
+
+def projection_key(dataset, features, scaler_name):
+    """Identifies a projection, clients keep their coordinates while it stays the same."""
+    raw = '|'.join([dataset.fingerprint, scaler_name] + list(features))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def get_feature_matrices(dataset):
+    return dataset.cached('feature_matrices', FeatureMatrices)
@@ -0,0 +1,91 @@
+"""Movie x genre indicator matrix and per-cluster genre statistics.
+
+The ``genres`` strings are parsed once per dataset version into a sparse
+CSR matrix with one column per genre (sorted by name). Genre counts of all
+clusters are then a single sparse product of a cluster indicator matrix with
+it, instead of joining and splitting the strings of every cluster.
+
+The comma-separated ``spoken_languages`` get the same matrix for the
+per-language statistics of aggregate.py.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from .timing import timed
+
+GENRE_STRIP_RE = re.compile(r'[\[\]"]')
+
+# Genres listed in ``genre_distribution`` of each cluster
+DISTRIBUTION_TOP_N = 5
+
+
+def split_genres(value):
+    if not isinstance(value, str):
+        return []
+    return [genre.strip() for genre in GENRE_STRIP_RE.sub('', value).split(',') if genre.strip()]
+
+
+class GenreMatrix:
+    def __init__(self, dataset, column='genres'):
+        # Few distinct genre strings repeat over many movies, each is split only once
+        codes, uniques = pd.factorize(pd.Series(dataset.column(column), dtype=object), use_na_sentinel=True)
+        parsed = [split_genres(value) for value in uniques]
+        self.names = sorted({genre for genres in parsed for genre in genres})
+        positions = {name: position for position, name in enumerate(self.names)}
+
+        # Genre columns of every distinct string, then expanded to the movies using it
+        lengths = np.array([len(genres) for genres in parsed] + [0], dtype=np.int64)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        columns = np.array([positions[genre] for genres in parsed for genre in genres], dtype=np.int64)
+
+        codes = np.where(codes < 0, len(uniques), codes)
+        row_lengths = lengths[codes]
+        indptr = np.zeros(len(codes) + 1, dtype=np.int64)
+        np.cumsum(row_lengths, out=indptr[1:])
+        entries = np.repeat(offsets[codes] - indptr[:-1], row_lengths) + np.arange(indptr[-1])
+        self.matrix = csr_matrix(
+            (np.ones(indptr[-1], dtype=np.int64), columns[entries], indptr),
+            shape=(len(codes), len(self.names)),
+        )
+
+    def cluster_counts(self, labels, clusters):
+        """Genre counts and sizes of ``clusters`` from one sparse product, labels of other clusters are ignored."""
+        rows = pd.Index(clusters).get_indexer(labels)
+        member = rows >= 0
+        indicator = csr_matrix(
+            (np.ones(int(member.sum()), dtype=np.int64), (rows[member], np.flatnonzero(member))),
+            shape=(len(clusters), len(labels)),
+        )
+        return (indicator @ self.matrix).toarray(), np.bincount(rows[member], minlength=len(clusters))
+
+    def summary(self, labels, clusters, top_n=DISTRIBUTION_TOP_N):
+        """``dominant_genre`` and ``genre_distribution`` of each of ``clusters``.
+
+        The dominant genre is the most frequent one, ties going to the first
+        name in alphabetical order. The distribution lists the ``top_n``
+        genres with their count and share of the cluster's movies.
+        """
+        counts, sizes = self.cluster_counts(np.asarray(labels), np.asarray(clusters))
+
+        dominant = []
+        distributions = []
+        for cluster_counts, size in zip(counts, sizes):
+            # Stable sort keeps the alphabetical order among equal counts
+            top = np.argsort(-cluster_counts, kind='stable')[:top_n]
+            top = top[cluster_counts[top] > 0]
+            dominant.append(self.names[top[0]] if len(top) else "N/A")
+            distributions.append([
+                {'genre': self.names[genre], 'count': int(cluster_counts[genre]),
+                 'share': round(float(cluster_counts[genre]) / size, 4)}
+                for genre in top
+            ])
+        return dominant, distributions
+
+
+def get_genre_matrix(dataset, column='genres'):
+    build = timed('genre_matrix')(lambda dataset: GenreMatrix(dataset, column))
+    return dataset.cached(('genre_matrix', column), build)
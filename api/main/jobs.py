@@ -0,0 +1,211 @@
+"""Background clustering jobs.
+
+``POST /clustering/<kind>/`` submits a job instead of fitting inside the
+request. The local backend runs jobs in a bounded process pool owned by the
+Django process, so it needs no broker (Redis, Celery...). Workers report
+their stage through a queue that a listener thread turns into job progress.
+Identical in-flight requests share one job.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Forking a threaded server process can deadlock the child, workers start from a fresh interpreter instead
+START_METHOD = getattr(settings, 'CLUSTERING_JOB_START_METHOD', 'spawn')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+
+_progress_queue = None
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind, params, key):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.key = key
+        self.status = QUEUED
+        self.stage = None
+        self.progress = 0.0
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def finish(self, result):
+        self.result = result
+        self.status = FINISHED
+        self.stage = None
+        self.progress = 1.0
+        self.finished_at = time.time()
+
+    def fail(self, error):
+        self.error = error
+        self.status = FAILED
+        self.finished_at = time.time()
+
+    def as_dict(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': round(self.progress, 3),
+            'error': self.error,
+        }
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+    # Spawned workers start from a fresh interpreter
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'filmy_projekt.settings')
+    import django
+    django.setup()
+
+
+def _run_job(job_id, kind, params):
+    from .clustering import run_clustering
+    from .dataset import get_dataset
+
+    def progress(stage, fraction):
+        if _progress_queue is not None:
+            _progress_queue.put((job_id, stage, fraction))
+
+    dataset = get_dataset()
+    if dataset is None:
+        raise FileNotFoundError("CSV file was not found")
+    return run_clustering(dataset, kind, params, progress)
+
+
+class LocalJobBackend:
+    def __init__(self, max_workers, max_pending, max_finished):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self._jobs = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._queue = None
+
+    def _get_executor(self):
+        """The process pool, created on first use; call with ``_lock`` held."""
+        if self._executor is None:
+            context = multiprocessing.get_context(START_METHOD)
+            self._queue = context.Queue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._queue,),
+            )
+            threading.Thread(target=self._listen, args=(self._queue,), name='clustering-job-progress',
+                             daemon=True).start()
+        return self._executor
+
+    def _discard_executor(self, executor):
+        """Forget a broken pool, the next job starts a new one."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _listen(self, progress_queue):
+        while True:
+            try:
+                job_id, stage, fraction = progress_queue.get()
+            except (EOFError, OSError, queue.Empty):
+                return
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None and job.status in (QUEUED, RUNNING):
+                    job.status = RUNNING
+                    job.stage = stage
+                    job.progress = fraction
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def submit(self, kind, params, key, on_result=None):
+        """Job for ``key``, reusing one that is still running for the same request.
+
+        ``on_result`` is called with the ``ClusteringResult`` once the job succeeds.
+        """
+        with self._lock:
+            job_id = self._in_flight.get(key)
+            if job_id is not None:
+                return self._jobs[job_id]
+
+            job = Job(kind, params, key)
+            if len(self._in_flight) >= self.max_pending:
+                raise JobQueueFull("Too many clustering jobs are waiting, try again later.")
+            executor = self._get_executor()
+            self._in_flight[key] = job.id
+            self._remember(job)
+
+        try:
+            future = executor.submit(_run_job, job.id, kind, params)
+        except Exception as e:
+            self._complete_failed(job, executor, e)
+            return job
+        future.add_done_callback(lambda done: self._complete(job, executor, done, on_result))
+        return job
+
+    def _complete(self, job, executor, future, on_result):
+        try:
+            result = future.result()
+        except Exception as e:
+            self._complete_failed(job, executor, e)
+            return
+        try:
+            if on_result is not None:
+                on_result(result)
+        except Exception:
+            # The result is still good, only caching it failed
+            logger.exception("Storing the result of clustering job %s failed", job.id)
+        finally:
+            # Under the lock, so the listener cannot set a late stage on the finished job
+            with self._lock:
+                job.finish(result)
+                self._in_flight.pop(job.key, None)
+
+    def _complete_failed(self, job, executor, error):
+        with self._lock:
+            job.fail(str(error) or error.__class__.__name__)
+            self._in_flight.pop(job.key, None)
+        if isinstance(error, BrokenExecutor):
+            self._discard_executor(executor)
+
+    def _remember(self, job):
+        self._jobs[job.id] = job
+        # Drop the oldest finished jobs, pending ones are always kept
+        finished = [job_id for job_id, known in self._jobs.items() if known.status in (FINISHED, FAILED)]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+
+backend = LocalJobBackend(
+    max_workers=getattr(settings, 'CLUSTERING_JOB_WORKERS', 2),
+    max_pending=getattr(settings, 'CLUSTERING_JOB_MAX_PENDING', 32),
+    max_finished=getattr(settings, 'CLUSTERING_JOB_MAX_FINISHED', 256),
+)
@@ -0,0 +1,99 @@
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment
+
+from main.benchmark import ENDPOINTS, compare_dbscan, run_scale
+from main.dataset import PROJECT_ROOT, DatasetStore
+from main.synthetic import generate_csv
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT, capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the API endpoints in-process on synthetic datasets of several sizes "
+            "and save latency percentiles, throughput and peak RSS as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='10,100', help="Comma separated multiples of the real row count, e.g. 10,100,1000.")
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help=f"Comma separated subset of: {', '.join(ENDPOINTS)}.")
+        parser.add_argument('--requests', type=int, default=30, help="Requests per endpoint and scale.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--data-dir', help="Keep the generated datasets here and reuse them in later runs.")
+        parser.add_argument('--compare-dbscan', action='store_true',
+                            help="Also time cold DBSCAN requests of the default engine against plain sklearn.")
+        parser.add_argument('--output', help="JSON file for the results, benchmark-<commit>.json by default.")
+
+    def handle(self, *args, **options):
+        try:
+            scales = [float(scale) for scale in options['scales'].split(',')]
+        except ValueError:
+            raise CommandError("--scales must be numbers")
+        endpoints = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = [name for name in endpoints if name not in ENDPOINTS]
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(unknown)}")
+        if options['requests'] < 1:
+            raise CommandError("--requests must be at least 1")
+
+        commit = _commit()
+        output = options['output'] or f"benchmark-{commit or 'local'}.json"
+        setup_test_environment()
+
+        report = {
+            'commit': commit,
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'requests': options['requests'],
+            'runs': [],
+        }
+        with tempfile.TemporaryDirectory() as temporary:
+            data_dir = options['data_dir'] or temporary
+            os.makedirs(data_dir, exist_ok=True)
+            for scale in scales:
+                path = os.path.join(data_dir, f"synthetic-x{scale:g}-seed{options['seed']}.csv")
+                started = time.perf_counter()
+                if not os.path.exists(path):
+                    generate_csv(path, scale, options['seed'])
+                generated = time.perf_counter() - started
+                self.stdout.write(f"x{scale:g}: {path}")
+
+                rows, results = run_scale(path, endpoints, options['requests'], progress=self.print_result)
+                report['runs'].append({
+                    'scale': scale,
+                    'rows': rows,
+                    'generate_s': round(generated, 3),
+                    'endpoints': results,
+                })
+                if options['compare_dbscan']:
+                    report['runs'][-1]['dbscan_engines'] = engines = compare_dbscan(DatasetStore(path).get().df)
+                    for eps, timing in engines.items():
+                        self.stdout.write(f"  dbscan eps={eps:<5g} sklearn {timing['sklearn_ms']:>9.1f} ms  "
+                                          f"auto {timing['auto_ms']:>9.1f} ms ({timing['auto_engine']})")
+
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+    def print_result(self, name, result):
+        self.stdout.write(
+            f"  {name:<14} cold {result['cold_ms']:>10.1f} ms  p50 {result['p50_ms']:>9.1f} ms  "
+            f"p99 {result['p99_ms']:>9.1f} ms  {result['throughput_rps']:>8.1f} req/s  "
+            f"RSS {result['peak_rss_mb']:.0f} MB"
+            + (f"  cache hit {result['cache_hit_ms']:.1f} ms" if 'cache_hit_ms' in result else '')
+        )
+        self.stdout.flush()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.snapshot import build_snapshot, SnapshotError, SNAPSHOT_FILE_PATH
+
+
+class Command(BaseCommand):
+    help = "Compile tmdb_movie_data.csv into the columnar snapshot mapped by the API workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', help="CSV file to compile, the current base of the dataset by default.")
+        parser.add_argument('--output', default=SNAPSHOT_FILE_PATH, help="Where to write the snapshot.")
+
+    def handle(self, *args, **options):
+        try:
+            rows = build_snapshot(options['source'], options['output'])
+        except SnapshotError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Snapshot with {rows} movies written to {options['output']}"))
@@ -0,0 +1,27 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from main.dataset import store
+from main.snapshot import build_snapshot, SNAPSHOT_FILE_PATH
+
+
+class Command(BaseCommand):
+    help = "Merge the appended dataset segments into a new base file. Safe to run while the API is serving."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-segments', type=int, default=1, help="Only compact with at least this many segments.")
+        parser.add_argument('--no-snapshot', action='store_true', help="Do not rebuild an existing snapshot for the new base.")
+
+    def handle(self, *args, **options):
+        manifest = store.segments.compact(min_segments=options['min_segments'])
+        if manifest is None:
+            self.stdout.write("Nothing to compact.")
+            return
+
+        base = store.segments.files(manifest)[0]
+        self.stdout.write(self.style.SUCCESS(f"Segments merged into {base}"))
+        # The old snapshot describes the previous base and would no longer be used
+        if os.path.exists(SNAPSHOT_FILE_PATH) and not options['no_snapshot']:
+            rows = build_snapshot(base, SNAPSHOT_FILE_PATH)
+            self.stdout.write(self.style.SUCCESS(f"Snapshot with {rows} movies written to {SNAPSHOT_FILE_PATH}"))
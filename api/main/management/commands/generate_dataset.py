@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.synthetic import generate_csv
+
+
+class Command(BaseCommand):
+    help = "Write a synthetic TMDB-shaped dataset of a multiple of the real row count (see main/synthetic.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="CSV file to write.")
+        parser.add_argument('--scale', type=float, default=10, help="Multiple of the real row count.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['scale'] <= 0:
+            raise CommandError("--scale must be positive")
+        rows = generate_csv(options['output'], options['scale'], options['seed'])
+        self.stdout.write(self.style.SUCCESS(f"{rows} movies written to {options['output']}"))
@@ -0,0 +1,51 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .timing import collect, metrics, profile_offloaded, run_profiled, save_profile, server_timing
+
+
+def _endpoint(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.url_name if match is not None and match.url_name else 'unmatched'
+
+
+class ServerTimingMiddleware:
+    """Sends the stage timings of a request as ``Server-Timing`` and records them (see ``timing.py``).
+
+    Runs natively under WSGI and ASGI. For streamed responses the timings end
+    when the view returns, before the body is sent.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        started = time.perf_counter()
+        with collect() as timings:
+            response, profile = run_profiled(lambda: self.get_response(request))
+        total_ms = (time.perf_counter() - started) * 1000
+        self.finish(request, response, timings, total_ms)
+        if profile is not None:
+            save_profile(profile, _endpoint(request), total_ms)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        # The event loop serves every request, the offloaded view is profiled instead
+        with collect() as timings, profile_offloaded():
+            response = await self.get_response(request)
+        self.finish(request, response, timings, (time.perf_counter() - started) * 1000)
+        return response
+
+    def finish(self, request, response, timings, total_ms):
+        response['Server-Timing'] = server_timing(timings, total_ms)
+        metrics.record(_endpoint(request), request.method, response.status_code, total_ms, timings)
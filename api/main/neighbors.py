@@ -0,0 +1,359 @@
+"""Memory-bounded DBSCAN over a KD-tree.
+
+``sklearn.cluster.DBSCAN`` materializes the eps-neighbourhood of every point
+at once, which grows quadratically with eps. The engines here never do:
+
+* ``chunked`` streams the neighbourhoods from the tree in chunks of at most
+  ``DBSCAN_CHUNK_MAX_BYTES`` and labels them as they come, in one pass
+  like sklearn's single query.
+* ``graph`` keeps a radius graph (neighbours of every row with their
+  distances) per dataset version and feature set. It is built for the
+  largest radius between eps and ``DBSCAN_GRAPH_RADIUS`` that is estimated
+  to fit in ``DBSCAN_GRAPH_MAX_BYTES`` and answers every eps up to it.
+* ``auto`` answers from a kept graph that covers eps. Otherwise it runs
+  ``chunked`` and keeps the neighbourhoods at eps as the graph while they
+  fit in ``DBSCAN_GRAPH_MAX_BYTES``, so moving the minPts slider or eps
+  down only re-labels, and a first request costs no more than sklearn.
+
+Both label exactly like sklearn: clusters are numbered by their lowest core
+point and a border point joins the first (lowest) cluster that reaches it.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.neighbors import KDTree
+
+from .features import get_feature_matrices
+
+ENGINES = ('auto', 'graph', 'chunked', 'sklearn')
+
+# Neighbour index (int64) and distance (float64) of one edge
+EDGE_BYTES = 16
+
+GRAPH_RADIUS = getattr(settings, 'DBSCAN_GRAPH_RADIUS', 1.0)
+GRAPH_MAX_BYTES = getattr(settings, 'DBSCAN_GRAPH_MAX_BYTES', 64 * 1024 * 1024)
+CHUNK_MAX_BYTES = getattr(settings, 'DBSCAN_CHUNK_MAX_BYTES', 16 * 1024 * 1024)
+
+
+class GraphTooLarge(Exception):
+    pass
+
+
+def _row_chunks(rows, sizes, max_bytes):
+    """Consecutive slices of ``rows`` whose ``sizes`` (edges) fit in ``max_bytes``, at least one row each."""
+    ends = np.cumsum(sizes) * EDGE_BYTES
+    start = 0
+    while start < len(rows):
+        limit = (ends[start - 1] if start else 0) + max_bytes
+        end = max(start + 1, int(np.searchsorted(ends, limit, 'right')))
+        yield rows[start:end]
+        start = end
+
+
+class NeighborSearch:
+    # Rows whose neighbours are counted to estimate the size of a whole graph
+    SAMPLE_ROWS = 1024
+    # Rows whose neighbours are counted to size the first chunk, later ones follow the previous chunk
+    FIRST_CHUNK_SAMPLE = 64
+
+    def __init__(self, X, chunk_max_bytes=CHUNK_MAX_BYTES):
+        self.X = X
+        self.tree = KDTree(X)
+        self.chunk_max_bytes = chunk_max_bytes
+
+    def counts(self, radius):
+        """Neighbours within ``radius`` of every row, the row itself included."""
+        return self.tree.query_radius(self.X, radius, count_only=True)
+
+    def _sample(self, rows=None):
+        return np.linspace(0, len(self.X) - 1, min(len(self.X), rows or self.SAMPLE_ROWS)).astype(np.int64)
+
+    def average_degree(self, radius, rows=None):
+        return float(self.tree.query_radius(self.X[self._sample(rows)], radius, count_only=True).mean())
+
+    def graph_radius(self, low, high, max_bytes):
+        """Largest radius in ``[low, high]`` whose graph is estimated to fit in ``max_bytes``, None if none does.
+
+        One query of the sample rows at ``high``: the sorted distances give the
+        estimated degree at every smaller radius.
+        """
+        sample = self._sample()
+        _, distances = self.tree.query_radius(self.X[sample], high, return_distance=True)
+        distances = np.sort(np.concatenate(distances))
+        # Edges of the sample rows allowed by the cap
+        budget = int(max_bytes / (EDGE_BYTES * len(self.X)) * len(sample))
+        if budget >= len(distances):
+            return high
+        # Below the budget-th smallest distance, ties at it would already exceed the budget
+        radius = float(np.nextafter(distances[budget], -np.inf)) if budget > 0 else 0.0
+        return radius if radius >= low else None
+
+    def edges(self, radius, collector=None):
+        """``(rows, counts, neighbours)`` chunks of every row, one query per chunk (see ``dbscan_labels``).
+
+        Chunks are sized from the average degree of the previous one, so they
+        stay near ``chunk_max_bytes`` as the density changes over the rows.
+        The neighbourhoods also go to ``collector`` (a ``GraphCollector``)
+        with their distances until it is full.
+        """
+        n = len(self.X)
+        degree = self.average_degree(radius, self.FIRST_CHUNK_SAMPLE)
+        start = 0
+        while start < n:
+            end = min(n, start + max(1, int(self.chunk_max_bytes / (EDGE_BYTES * max(degree, 1.0)))))
+            rows = np.arange(start, end)
+            collect = collector is not None and not collector.full
+            found = self.tree.query_radius(self.X[start:end], radius, return_distance=collect)
+            if collect:
+                found, distances = found
+            counts = np.fromiter(map(len, found), dtype=np.int64, count=len(rows))
+            neighbours = np.concatenate(found)
+            if collect:
+                collector.add(counts, neighbours, np.concatenate(distances))
+            degree = counts.mean()
+            yield rows, counts, neighbours
+            start = end
+
+
+class GraphCollector:
+    """Neighbourhoods of consecutive row chunks gathered into a ``NeighborGraph`` while they fit in ``max_bytes``."""
+
+    def __init__(self, radius, max_bytes):
+        self.radius = radius
+        self.max_bytes = max_bytes
+        self.full = False
+        self._counts, self._indices, self._distances = [], [], []
+        self._size = 0
+
+    def add(self, counts, indices, distances):
+        self._size += len(indices) * EDGE_BYTES
+        if self._size > self.max_bytes:
+            self.full = True
+            self._counts, self._indices, self._distances = [], [], []
+            return
+        self._counts.append(counts)
+        self._indices.append(indices)
+        self._distances.append(distances)
+
+    def graph(self, chunk_max_bytes):
+        """The graph of all rows given, None when it outgrew ``max_bytes``."""
+        if self.full:
+            return None
+        return NeighborGraph(self.radius, np.concatenate(self._counts), np.concatenate(self._indices).astype(np.int64, copy=False),
+                             np.concatenate(self._distances), chunk_max_bytes)
+
+
+class NeighborGraph:
+    """Radius graph in CSR form: neighbours and their distances for every row."""
+
+    def __init__(self, radius, counts, indices, distances, chunk_max_bytes=CHUNK_MAX_BYTES):
+        self.radius = radius
+        self.chunk_max_bytes = chunk_max_bytes
+        self.indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.indptr[1:])
+        self.indices = indices
+        self.distances = distances
+
+    @classmethod
+    def build(cls, search, radius, max_bytes):
+        """Graph of ``search`` at ``radius`` in one pass, raises GraphTooLarge as soon as it outgrows ``max_bytes``."""
+        collector = GraphCollector(radius, max_bytes)
+        for _ in search.edges(radius, collector):
+            if collector.full:
+                raise GraphTooLarge(f"Neighbour graph for eps={radius} would exceed {max_bytes} bytes")
+        return collector.graph(search.chunk_max_bytes)
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.distances.nbytes
+
+    def counts(self, eps):
+        # Every row lists itself, so no segment is empty
+        return np.add.reduceat((self.distances <= eps).astype(np.int64), self.indptr[:-1])
+
+    def edges(self, eps):
+        """``(rows, counts, neighbours)`` chunks of every row within ``eps`` (see ``dbscan_labels``)."""
+        lengths = np.diff(self.indptr)
+        for chunk in _row_chunks(np.arange(len(lengths)), lengths, self.chunk_max_bytes):
+            # Rows of a chunk are consecutive, their neighbours one slice of the CSR arrays
+            start, end = self.indptr[chunk[0]], self.indptr[chunk[-1] + 1]
+            if eps >= self.radius:
+                yield chunk, lengths[chunk], self.indices[start:end]
+                continue
+            within = self.distances[start:end] <= eps
+            counts = np.add.reduceat(within, self.indptr[chunk] - start, dtype=np.int64)
+            yield chunk, counts, self.indices[start:end][within]
+
+
+def _segments(starts, lengths):
+    """Positions ``starts[i]:starts[i] + lengths[i]`` of every ``i``, concatenated."""
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - (ends - lengths), lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+
+def _join(components, core, rows, counts, neighbours):
+    """``components`` with every core row of the chunk joined to its core neighbours' components.
+
+    Only core flags already known count, so each pair of core rows is joined
+    from the later of the two. The lowest and highest component around every
+    row come from one gather and ``reduceat`` each; rows where they differ
+    are joined to both and looked at again until they do not.
+    """
+    n = len(components)
+    active = np.flatnonzero(core[rows])
+    offsets = np.cumsum(counts) - counts
+    while len(active):
+        # Components of core neighbours, -1 for the others: ignored by the max, and as unsigned by the min.
+        # Going over the whole chunk is cheaper than selecting the neighbourhoods of the active rows.
+        around = np.where(core, components, -1)[neighbours]
+        low = np.minimum.reduceat(around.view(np.uint32), offsets).view(np.int32)[active]
+        high = np.maximum.reduceat(around, offsets)[active]
+        spread = low != high
+        if not spread.any():
+            break
+        active, low, high = active[spread], low[spread], high[spread]
+        own = components[rows[active]]
+        graph = coo_matrix((np.ones(2 * len(active), dtype=np.int8), (np.concatenate([own, own]), np.concatenate([low, high]))),
+                           shape=(n, n))
+        _, merged = connected_components(graph, directed=False)
+        components = merged[components]
+    return components
+
+
+def dbscan_labels(n, min_samples, chunks):
+    """DBSCAN labels of ``n`` rows from ``chunks`` of ``(rows, counts, neighbours)`` in row order.
+
+    ``rows`` are consecutive, ``counts`` their neighbour counts (the row itself
+    included) and ``neighbours`` the neighbours of each row in turn. Core rows
+    are joined as their chunk comes (see ``_join``), so one pass over the
+    neighbourhoods is enough. The neighbourhoods of non-core rows, fewer than
+    ``min_samples`` each, are kept to find the border points at the end.
+    """
+    core = np.zeros(n, dtype=bool)
+    # Core points within eps of each other end up in one component, merged chunk by chunk
+    components = np.arange(n, dtype=np.int32)
+    border, reaching = [], []
+    for rows, counts, neighbours in chunks:
+        core[rows] = counts >= min_samples
+        components = _join(components, core, rows, counts, neighbours)
+        few = ~core[rows]
+        border.append(np.repeat(rows[few], counts[few]))
+        reaching.append(neighbours[_segments((np.cumsum(counts) - counts)[few], counts[few])])
+
+    core_rows = np.flatnonzero(core)
+    labels = np.full(n, -1, dtype=np.int64)
+    if len(core_rows) == 0:
+        return labels
+
+    roots, first, inverse = np.unique(components[core_rows], return_index=True, return_inverse=True)
+    order = np.empty(len(roots), dtype=np.int64)
+    order[np.argsort(first)] = np.arange(len(roots))
+    labels[core_rows] = order[inverse]
+
+    # A border point joins the first (lowest) cluster that reaches it
+    border, reaching = np.concatenate(border), np.concatenate(reaching)
+    near_core = core[reaching]
+    first_label = np.full(n, n, dtype=np.int64)
+    np.minimum.at(first_label, border[near_core], labels[reaching[near_core]])
+    reached = first_label < n
+    labels[reached] = first_label[reached]
+    return labels
+
+
+class NeighborIndex:
+    """KD-trees and radius graphs of one dataset version, per feature set."""
+
+    MAX_GRAPHS = 4
+    # Share of DBSCAN_GRAPH_MAX_BYTES the sampled size estimate may fill
+    ESTIMATE_HEADROOM = 0.9
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self._searches = {}
+        self._graphs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def search(self, features):
+        features = tuple(features)
+        with self._lock:
+            search = self._searches.get(features)
+        if search is None:
+            search = NeighborSearch(get_feature_matrices(self.dataset).scaled(features, 'standardScaler'))
+            with self._lock:
+                search = self._searches.setdefault(features, search)
+        return search
+
+    def cached_graph(self, features, eps):
+        """The graph of ``features`` when it covers ``eps``, else None."""
+        features = tuple(features)
+        with self._lock:
+            graph = self._graphs.get(features)
+            if graph is None or graph.radius < eps:
+                return None
+            self._graphs.move_to_end(features)
+            return graph
+
+    def add_graph(self, features, graph):
+        with self._lock:
+            self._graphs[tuple(features)] = graph
+            self._graphs.move_to_end(tuple(features))
+            if len(self._graphs) > self.MAX_GRAPHS:
+                self._graphs.popitem(last=False)
+
+    def graph(self, features, eps):
+        """``(graph, reused)`` covering ``eps``. Raises GraphTooLarge when no graph fits in the memory cap."""
+        graph = self.cached_graph(features, eps)
+        if graph is not None:
+            return graph, True
+
+        search = self.search(features)
+        # The largest radius that fits lets later slider moves, up and down, reuse the graph
+        radius = search.graph_radius(eps, max(eps, GRAPH_RADIUS), GRAPH_MAX_BYTES * self.ESTIMATE_HEADROOM)
+        if radius is None:
+            raise GraphTooLarge(f"Neighbour graph for eps={eps} would exceed {GRAPH_MAX_BYTES} bytes")
+        # The estimate comes from a sample, a graph at exactly eps may still fit when it was too optimistic
+        for radius in dict.fromkeys((radius, eps)):
+            try:
+                graph = NeighborGraph.build(search, radius, GRAPH_MAX_BYTES)
+            except GraphTooLarge:
+                continue
+            self.add_graph(features, graph)
+            return graph, False
+        raise GraphTooLarge(f"Neighbour graph for eps={eps} would exceed {GRAPH_MAX_BYTES} bytes")
+
+
+def get_neighbor_index(dataset):
+    return dataset.cached('neighbor_index', NeighborIndex)
+
+
+def dbscan(dataset, features, eps, min_samples, engine='auto'):
+    """``(labels, engine used, graph reused)`` of DBSCAN on the standardized ``features``."""
+    if engine == 'sklearn':
+        from sklearn.cluster import DBSCAN
+        X = get_feature_matrices(dataset).scaled(features, 'standardScaler')
+        return DBSCAN(eps=eps, min_samples=min_samples).fit_predict(X), 'sklearn', False
+
+    index = get_neighbor_index(dataset)
+    if engine == 'graph':
+        graph, reused = index.graph(features, eps)
+        return dbscan_labels(len(graph.indptr) - 1, min_samples, graph.edges(eps)), 'graph', reused
+
+    search = index.search(features)
+    if engine == 'chunked':
+        return dbscan_labels(len(search.X), min_samples, search.edges(eps)), 'chunked', False
+
+    graph = index.cached_graph(features, eps)
+    if graph is not None:
+        return dbscan_labels(len(search.X), min_samples, graph.edges(eps)), 'graph', True
+    # One pass at eps, like sklearn; its neighbourhoods are kept as the graph when they fit
+    collector = GraphCollector(eps, GRAPH_MAX_BYTES)
+    labels = dbscan_labels(len(search.X), min_samples, search.edges(eps, collector))
+    graph = collector.graph(search.chunk_max_bytes)
+    if graph is None:
+        return labels, 'chunked', False
+    index.add_graph(features, graph)
+    return labels, 'graph', False
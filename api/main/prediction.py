@@ -0,0 +1,129 @@
+"""In-memory K-Means prediction pipeline and precomputed cluster assignments.
+
+``kmeans_pipeline.pkl`` is unpickled once and reloaded only when the file
+changes. The cluster of every movie is computed once per model and dataset
+version and indexed by ``(cluster, genre)``, so a prediction only transforms
+the one new movie and samples from a ready list.
+"""
+import os
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .dataset import PROJECT_ROOT, file_version
+from .genres import split_genres
+from .timing import span, timed
+
+MODEL_KMEANS_FILENAME = 'kmeans_pipeline.pkl'
+MODEL_KMEANS_PATH = os.path.join(PROJECT_ROOT, MODEL_KMEANS_FILENAME)
+PREDICTION_FEATURES = ['vote_average', 'vote_count', 'popularity', 'budget', 'revenue', 'runtime']
+
+# Defaults of the prediction form for the optional inputs, vote_average and budget are required
+FEATURE_DEFAULTS = {
+    'vote_count': 100,
+    'popularity': 50,
+    'revenue': 0,
+    'runtime': 90,
+}
+DEFAULT_GENRE = 'Action'
+RECOMMENDATION_COUNT = 3
+
+class ModelNotFound(Exception):
+    pass
+
+
+def parse_movie_features(data):
+    """Feature row for the pipeline from a request dict. Raises TypeError/ValueError on bad input."""
+    return {feature: float(data.get(feature, FEATURE_DEFAULTS.get(feature))) for feature in PREDICTION_FEATURES}
+
+
+class ClusterAssignments:
+    def __init__(self, pipeline, dataset):
+        self.dataset = dataset
+        # Unknown values become 0, like in the prediction view this replaces, so movies keep their clusters.
+        # Training differs: there a 0 budget/revenue/runtime is missing and gets the imputer's median.
+        self.labels = pipeline.predict(dataset.df[PREDICTION_FEATURES].fillna(0))
+
+        rows_by_key = {}
+        for row, (label, genres) in enumerate(zip(self.labels, dataset.column('genres'))):
+            for genre in split_genres(genres):
+                rows_by_key.setdefault((int(label), genre), []).append(row)
+        self.rows = {key: np.array(rows, dtype=np.int64) for key, rows in rows_by_key.items()}
+        self.genres = sorted({genre for _, genre in rows_by_key})
+        self.titles = dataset.column('title')
+        self.vote_averages = dataset.column('vote_average')
+        self.popularities = dataset.column('popularity')
+        self._partial = {}
+
+    def candidates(self, cluster, genre):
+        rows = self.rows.get((cluster, genre))
+        if rows is None:
+            rows = self._partial.get((cluster, genre))
+        if rows is not None:
+            return rows
+        # Partial genre names ("Sci") match every genre containing them
+        matching = [self.rows[(cluster, name)] for name in self.genres if genre in name and (cluster, name) in self.rows]
+        rows = np.unique(np.concatenate(matching)) if matching else np.empty(0, dtype=np.int64)
+        if len(self._partial) >= 1024:
+            self._partial.clear()
+        self._partial[(cluster, genre)] = rows
+        return rows
+
+    def recommend(self, cluster, genre, count=RECOMMENDATION_COUNT, rng=None):
+        candidates = self.candidates(int(cluster), genre)
+        if len(candidates) == 0:
+            return []
+        rng = rng or np.random.default_rng()
+        rows = rng.choice(candidates, size=min(count, len(candidates)), replace=False)
+        return [
+            {'title': self.titles[row], 'vote_average': float(self.vote_averages[row]), 'popularity': float(self.popularities[row])}
+            for row in rows
+        ]
+
+
+class PipelineStore:
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self._pipeline = None
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def get(self):
+        version = file_version(self.path)
+        if version is None:
+            raise ModelNotFound("Model pipeline not found.")
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    with open(self.path, 'rb') as file:
+                        self._pipeline = pickle.load(file)
+                    self._derived = {}
+                    self.version = version
+        return self._pipeline
+
+    def for_dataset(self, name, factory, dataset):
+        """``factory(pipeline, dataset)`` under the current model, built once per version of either."""
+        self.get()
+        with self._lock:
+            key = (self.version, dataset.fingerprint)
+            derived = self._derived.get(name)
+            if derived is None or derived[0] != key:
+                with span(name):
+                    derived = (key, factory(self._pipeline, dataset))
+                self._derived[name] = derived
+        return derived[1]
+
+    def assignments(self, dataset):
+        """Cluster assignments of ``dataset`` under the current model."""
+        return self.for_dataset('assignments', ClusterAssignments, dataset)
+
+    @timed('predict')
+    def predict(self, rows):
+        """Clusters of feature rows, a single vectorized ``predict`` call for the whole batch."""
+        return self.get().predict(pd.DataFrame(rows, columns=PREDICTION_FEATURES))
+
+
+pipeline_store = PipelineStore(MODEL_KMEANS_PATH)
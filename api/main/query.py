@@ -0,0 +1,338 @@
+"""Indexed evaluation of the movie list ``filters`` grammar.
+
+Every filter is ``{"column": ..., "operator": ..., "value": ...}``. Indexes
+are built once per dataset version and a query is answered by combining
+boolean row bitmaps, without copying the shared frame:
+
+* numeric columns keep an argsort permutation, so ``gte/lte/gt/lt/eq`` are
+  two binary searches and a slice of the permutation,
+* string columns keep a hash of distinct values to row postings for ``eq``,
+* ``contains`` and ``startswith`` are case- and accent-insensitive and go
+  through the trigram and prefix indexes of the distinct values (search.py).
+"""
+import base64
+import bisect
+import json
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from . import dataset as dataset_module
+from .search import TextIndex
+from .timing import timed
+
+COLUMN_TYPES = {
+    'id': 'numeric',
+    'title': 'string',
+    'release_date': 'string',
+    'vote_average': 'numeric',
+    'vote_count': 'numeric',
+    'popularity': 'numeric',
+    'budget': 'numeric',
+    'revenue': 'numeric',
+    'runtime': 'numeric',
+    'genres': 'string',
+    'spoken_languages': 'string',
+}
+
+class FilterError(ValueError):
+    pass
+
+
+class NumericIndex:
+    def __init__(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        # NaNs sort to the end and are never matched by a comparison
+        self.order = np.argsort(values, kind='stable')
+        self.n_valid = int(np.count_nonzero(~np.isnan(values)))
+        self.sorted_values = values[self.order[:self.n_valid]]
+
+    def lookup(self, operator, value):
+        if math.isnan(value):
+            return self.order[:0]
+        if operator == 'gte':
+            return self.order[np.searchsorted(self.sorted_values, value, 'left'):self.n_valid]
+        if operator == 'gt':
+            return self.order[np.searchsorted(self.sorted_values, value, 'right'):self.n_valid]
+        if operator == 'lte':
+            return self.order[:np.searchsorted(self.sorted_values, value, 'right')]
+        if operator == 'lt':
+            return self.order[:np.searchsorted(self.sorted_values, value, 'left')]
+        if operator == 'eq':
+            lo = np.searchsorted(self.sorted_values, value, 'left')
+            hi = np.searchsorted(self.sorted_values, value, 'right')
+            return self.order[lo:hi]
+        raise FilterError(f"Unsupported numeric operator '{operator}'.")
+
+
+class StringIndex:
+    def __init__(self, values):
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+        self.values = [str(value) for value in uniques]
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+        # Row postings per distinct value: rows sorted by code, sliced by boundaries
+        self.rows = np.argsort(codes, kind='stable')
+        self.bounds = np.searchsorted(codes[self.rows], np.arange(len(self.values) + 1), 'left')
+
+        # Substring and prefix search over the distinct values, see search.py
+        self.text = TextIndex(self.values)
+
+    def postings(self, code):
+        return self.rows[self.bounds[code]:self.bounds[code + 1]]
+
+    def rows_for_codes(self, codes):
+        if len(codes) == 0:
+            return self.rows[:0]
+        return np.concatenate([self.postings(code) for code in codes])
+
+    def eq(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            return self.rows[:0]
+        return self.postings(code)
+
+    def contains(self, value):
+        return self.rows_for_codes(self.text.contains(value))
+
+    def startswith(self, value):
+        return self.rows_for_codes(self.text.prefix(value))
+
+
+class SortOrder:
+    """Row permutation for a list of ``(column, descending)`` keys.
+
+    Missing values go last whatever the direction and ties are broken by
+    ``id`` (and row position for duplicated ids), so ``(key values, id)`` of
+    a row is a stable keyset cursor.
+    """
+
+    def __init__(self, columns, ids, spec):
+        self.spec = spec
+        self.ids = ids
+        self.values = [columns[column] * (-1.0 if descending else 1.0) for column, descending in spec]
+        # lexsort is stable, sorts by the last key first and puts NaNs at the end
+        self.perm = np.lexsort([ids] + self.values[::-1])
+
+    def row_key(self, row):
+        key = []
+        for values in self.values:
+            value = values[row]
+            key.append((1, 0.0) if math.isnan(value) else (0, float(value)))
+        return tuple(key) + (int(self.ids[row]), int(row))
+
+    def cursor(self, row):
+        values = [None if math.isnan(values[row]) else float(values[row]) * (-1.0 if descending else 1.0)
+                  for values, (_, descending) in zip(self.values, self.spec)]
+        return {'values': values, 'id': int(self.ids[row]), 'row': int(row)}
+
+    def seek(self, cursor):
+        """Position in ``perm`` right after the row described by ``cursor``."""
+        key = []
+        for value, (_, descending) in zip(cursor['values'], self.spec):
+            key.append((1, 0.0) if value is None else (0, float(value) * (-1.0 if descending else 1.0)))
+        key = tuple(key) + (int(cursor['id']), int(cursor.get('row', -1)))
+        return bisect.bisect_right(range(len(self.perm)), key, key=lambda i: self.row_key(self.perm[i]))
+
+    def ordered(self, bitmap):
+        """Matching rows in sort order, a take on the precomputed permutation."""
+        return self.perm[bitmap[self.perm]]
+
+    def scan(self, bitmap, start, limit):
+        """First ``limit`` matching rows from ``start`` on, and whether more follow."""
+        found = []
+        count = 0
+        position = start
+        step = max(limit * 4, 256)
+        while position < len(self.perm) and count <= limit:
+            chunk = self.perm[position:position + step]
+            hits = chunk[bitmap[chunk]]
+            found.append(hits)
+            count += len(hits)
+            position += step
+            step *= 2
+        rows = np.concatenate(found)[:limit + 1] if found else self.perm[:0]
+        return rows[:limit], len(rows) > limit
+
+
+class MovieIndex:
+    def __init__(self, dataset):
+        self.size = len(dataset)
+        self.numeric = {}
+        self.strings = {}
+        self.sort_columns = {}
+        for column, col_type in COLUMN_TYPES.items():
+            if col_type == 'numeric':
+                values = np.asarray(dataset.column(column), dtype=np.float64)
+                self.sort_columns[column] = values
+                self.numeric[column] = NumericIndex(values)
+            else:
+                self.strings[column] = StringIndex(dataset.column(column))
+        self.ids = np.asarray(dataset.column('id'))
+        self._sort_orders = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Permutations are computed once per dataset and sort spec, then only taken from
+    SORT_ORDER_CACHE_SIZE = 64
+
+    def has_sort_order(self, spec):
+        with self._lock:
+            return tuple(spec) in self._sort_orders
+
+    def sort_order(self, spec):
+        spec = tuple(spec)
+        with self._lock:
+            order = self._sort_orders.get(spec)
+            if order is not None:
+                self._sort_orders.move_to_end(spec)
+                return order
+        order = SortOrder(self.sort_columns, self.ids, spec)
+        with self._lock:
+            self._sort_orders[spec] = order
+            if len(self._sort_orders) > self.SORT_ORDER_CACHE_SIZE:
+                self._sort_orders.popitem(last=False)
+        return order
+
+    def match(self, column, operator, value):
+        """Row positions matching one filter."""
+        if COLUMN_TYPES[column] == 'string':
+            if operator == 'contains':
+                return self.strings[column].contains(str(value))
+            if operator == 'startswith':
+                return self.strings[column].startswith(str(value))
+            if operator == 'eq':
+                return self.strings[column].eq(str(value))
+            raise FilterError(f"Unsupported string operator '{operator}'.")
+
+        return self.numeric[column].lookup(operator, float(value))
+
+    @timed('filter')
+    def filter(self, filters):
+        """Bitmap of rows matching all ``filters`` (checked by ``parse_filters``)."""
+        bitmap = np.ones(self.size, dtype=bool)
+        for f in filters:
+            matched = np.zeros(self.size, dtype=bool)
+            matched[self.match(f['column'], f['operator'], f['value'])] = True
+            bitmap &= matched
+        return bitmap
+
+    def positions(self, filters):
+        return np.flatnonzero(self.filter(filters))
+
+    @timed('search')
+    def autocomplete(self, value, count):
+        """Rows of up to ``count`` titles matching ``value``, most popular first within each rank.
+
+        Titles starting with ``value`` rank first, then titles with a word
+        starting with it, then any other title containing it.
+        """
+        titles = self.strings['title']
+        codes = titles.text.contains(value)
+        if len(codes) == 0:
+            return titles.rows[:0]
+        rank = np.full(len(codes), 2, dtype=np.int64)
+        rank[np.isin(codes, titles.text.word_prefix(value), assume_unique=True)] = 1
+        rank[np.isin(codes, titles.text.prefix(value), assume_unique=True)] = 0
+
+        rows = titles.rows_for_codes(codes)
+        row_rank = np.repeat(rank, titles.bounds[codes + 1] - titles.bounds[codes])
+        popularity = np.nan_to_num(self.sort_columns['popularity'][rows], nan=-np.inf)
+        rows = rows[np.lexsort((-popularity, row_rank))]
+        # A movie listed more than once is suggested once
+        _, first = np.unique(self.ids[rows], return_index=True)
+        return rows[np.sort(first)[:count]]
+
+
+OPERATORS = {
+    'numeric': ('gte', 'gt', 'lte', 'lt', 'eq'),
+    'string': ('contains', 'startswith', 'eq'),
+}
+
+
+def parse_filters(filters):
+    """Checked copy of the ``filters`` list of the movie list.
+
+    Filters with a missing part are skipped, the client sends them while a
+    filter is being edited. Anything else that cannot be evaluated raises
+    FilterError.
+    """
+    parsed = []
+    for f in filters:
+        if not isinstance(f, dict):
+            raise FilterError("Every filter must be an object.")
+        column = f.get('column')
+        operator = f.get('operator')
+        value = f.get('value')
+        if not all([column, operator, value is not None and value != '']):
+            continue
+
+        if not isinstance(column, str) or column not in COLUMN_TYPES:
+            raise FilterError(f"Unknown filter column {json.dumps(column)}.")
+        col_type = COLUMN_TYPES[column]
+        if operator not in OPERATORS[col_type]:
+            raise FilterError(f"Unsupported operator {json.dumps(operator)} for column '{column}'.")
+        if isinstance(value, (list, dict, bool)):
+            raise FilterError(f"Invalid value for column '{column}'.")
+        if col_type == 'numeric':
+            try:
+                value = float(value)
+            except ValueError:
+                raise FilterError(f"Value for column '{column}' must be a number.")
+        else:
+            value = str(value)
+        parsed.append({'column': column, 'operator': operator, 'value': value})
+    return parsed
+
+
+def parse_sort(sort):
+    """``"-popularity,vote_average"`` -> ``(("popularity", True), ("vote_average", False))``."""
+    spec = []
+    for item in sort.split(','):
+        item = item.strip()
+        column = item.lstrip('-')
+        if COLUMN_TYPES.get(column) != 'numeric':
+            raise FilterError(f"Cannot sort by '{column}'.")
+        if column in dict(spec):
+            raise FilterError(f"Column '{column}' is listed twice in sort.")
+        spec.append((column, item.startswith('-')))
+    return tuple(spec)
+
+
+def encode_cursor(sort, position):
+    payload = json.dumps({'sort': sort, **position}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if payload['sort'] != sort or not isinstance(payload['values'], list):
+            raise ValueError()
+        int(payload['id'])
+        return payload
+    except (ValueError, TypeError, KeyError):
+        raise FilterError("Invalid cursor.")
+
+
+def get_movie_index(dataset):
+    return dataset.cached('movie_index', timed('movie_index')(MovieIndex))
+
+
+def movie_index_missing(request):
+    """True until the current dataset, its ``MovieIndex`` and the sort order of ``request`` are built, see ``async_view``."""
+    dataset = dataset_module.store.current()
+    if dataset is None or not dataset.is_cached('movie_index'):
+        return True
+    # Keyset pages are sorted by id when no sort is given
+    sort = request.GET.get('sort') or ('id' if 'cursor' in request.GET else None)
+    if not sort:
+        return False
+    try:
+        spec = parse_sort(sort)
+    except FilterError:
+        # Answered with a 400 right away
+        return False
+    return not get_movie_index(dataset).has_sort_order(spec)
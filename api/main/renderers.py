@@ -0,0 +1,120 @@
+"""Encodings of clustering responses.
+
+Plain JSON stays the default. Clients that ask for it (``Accept`` header or
+``?format=``) can get the per-movie data as parallel arrays instead of one
+object per movie:
+
+* ``columnar`` (``application/vnd.filmy.columnar+json``) - JSON arrays per column,
+* ``msgpack`` (``application/x-msgpack``, needs the optional ``msgpack``
+  package) - numeric columns as typed little-endian buffers
+  ``{"dtype": "<f4", "data": <bytes>}``: float32 for ``PC1``/``PC2``, int32
+  for cluster labels.
+
+Each encoding writes the frames in a single pass, without the
+``to_json`` -> ``json.loads`` -> re-encode round trip.
+
+With ``labels_only`` the per-movie frames are replaced by ``labels``, the
+cluster of every movie in the order of ``movies_with_cluster``. A client that
+already has the movies and the PCA coordinates of the same ``projection``
+only needs that when k, eps or minPts change.
+"""
+import json
+
+import numpy as np
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .timing import timed
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_PRECISION = 15
+
+
+def _json_rows(df):
+    return df.to_json(orient='records', double_precision=JSON_PRECISION)
+
+
+def _json_columns(df):
+    return '{' + ','.join(
+        json.dumps(str(column)) + ':' + df[column].to_json(orient='records', double_precision=JSON_PRECISION)
+        for column in df.columns
+    ) + '}'
+
+
+def _typed(values, dtype):
+    values = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': values.dtype.str, 'data': values.tobytes()}
+
+
+def encode_json(result, columnar=False, labels_only=False):
+    frame = _json_columns if columnar else _json_rows
+    parts = [json.dumps(key) + ':' + json.dumps(value) for key, value in result.meta.items()]
+    parts.append('"cluster_summary":' + _json_rows(result.cluster_summary))
+    if labels_only:
+        parts.append('"labels":' + json.dumps(result.movies['cluster'].tolist()))
+    else:
+        parts.append('"movies_with_cluster":' + frame(result.movies))
+        parts.append('"pca_data":' + frame(result.pca))
+    return ('{' + ','.join(parts) + '}').encode('utf-8')
+
+
+def encode_msgpack(result, labels_only=False):
+    if labels_only:
+        return msgpack.packb({
+            **result.meta,
+            'cluster_summary': json.loads(_json_rows(result.cluster_summary)),
+            'labels': _typed(result.movies['cluster'].to_numpy(), np.int32),
+        }, use_bin_type=True)
+
+    movies = {}
+    for column in result.movies.columns:
+        values = result.movies[column].to_numpy()
+        if column == 'title':
+            movies[column] = [value if isinstance(value, str) else None for value in values]
+        elif column == 'id':
+            movies[column] = _typed(values, np.int64)
+        elif column == 'cluster':
+            movies[column] = _typed(values, np.int32)
+        else:
+            movies[column] = _typed(values, np.float64)
+
+    return msgpack.packb({
+        **result.meta,
+        'cluster_summary': json.loads(_json_rows(result.cluster_summary)),
+        'movies_with_cluster': movies,
+        'pca_data': {
+            'PC1': _typed(result.pca['PC1'].to_numpy(), np.float32),
+            'PC2': _typed(result.pca['PC2'].to_numpy(), np.float32),
+            'cluster': _typed(result.pca['cluster'].to_numpy(), np.int32),
+        },
+    }, use_bin_type=True)
+
+
+@timed('encode')
+def encode_result(result, encoding, labels_only=False):
+    if encoding == 'msgpack':
+        return encode_msgpack(result, labels_only)
+    return encode_json(result, columnar=encoding == 'columnar', labels_only=labels_only)
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    media_type = 'application/vnd.filmy.columnar+json'
+    format = 'columnar'
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True)
+
+
+CLUSTERING_RENDERERS = (JSONRenderer, ColumnarJSONRenderer) + ((MessagePackRenderer,) if msgpack is not None else ())
@@ -0,0 +1,107 @@
+"""Case- and accent-insensitive search over the distinct values of a string column.
+
+Values are folded (NFKD without combining marks, casefolded), so "amelie"
+finds "Amélie". Three structures answer the queries without scanning every
+value:
+
+* a trigram index: a substring of 3+ characters can only be in values having
+  all of its trigrams, the intersected postings are then checked directly,
+* the folded values in sorted order: a prefix is a range found by bisection,
+* the words of the values in sorted order: a word prefix is a range too.
+
+Needles shorter than a trigram are checked against every value; their
+results, like all substring results, are kept in a small LRU since the
+React filter asks again on every keystroke.
+"""
+import bisect
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+WORD_RE = re.compile(r'\w+')
+GRAM = 3
+
+# Sorts after every character that can follow a prefix
+PREFIX_END = '\U0010ffff'
+
+
+def fold(text):
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def _postings(pairs):
+    return {key: np.array(codes, dtype=np.int64) for key, codes in pairs.items()}
+
+
+class TextIndex:
+    CACHE_SIZE = 256
+
+    def __init__(self, values):
+        self.folded = [fold(value) for value in values]
+
+        grams = {}
+        words = {}
+        for code, text in enumerate(self.folded):
+            for gram in {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}:
+                grams.setdefault(gram, []).append(code)
+            for word in set(WORD_RE.findall(text)):
+                words.setdefault(word, []).append(code)
+        self.grams = _postings(grams)
+        self.words = sorted(words)
+        self.word_codes = [np.array(words[word], dtype=np.int64) for word in self.words]
+
+        self.order = np.array(sorted(range(len(self.folded)), key=self.folded.__getitem__), dtype=np.int64)
+        self.sorted_folded = [self.folded[code] for code in self.order]
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def contains(self, value):
+        """Codes of the values containing ``value``, in code order."""
+        needle = fold(value)
+        with self._lock:
+            cached = self._cache.get(needle)
+            if cached is not None:
+                self._cache.move_to_end(needle)
+                return cached
+
+        if len(needle) >= GRAM:
+            postings = [self.grams.get(needle[i:i + GRAM]) for i in range(len(needle) - GRAM + 1)]
+            if any(codes is None for codes in postings):
+                candidates = []
+            else:
+                postings.sort(key=len)
+                candidates = postings[0]
+                for codes in postings[1:]:
+                    if len(candidates) == 0:
+                        break
+                    candidates = np.intersect1d(candidates, codes, assume_unique=True)
+        else:
+            candidates = range(len(self.folded))
+        codes = np.array([code for code in candidates if needle in self.folded[code]], dtype=np.int64)
+
+        with self._lock:
+            self._cache[needle] = codes
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return codes
+
+    def prefix(self, value):
+        """Codes of the values starting with ``value``."""
+        needle = fold(value)
+        start = bisect.bisect_left(self.sorted_folded, needle)
+        end = bisect.bisect_left(self.sorted_folded, needle + PREFIX_END, start)
+        return np.sort(self.order[start:end])
+
+    def word_prefix(self, value):
+        """Codes of the values having a word that starts with ``value``."""
+        needle = fold(value)
+        start = bisect.bisect_left(self.words, needle)
+        end = bisect.bisect_left(self.words, needle + PREFIX_END, start)
+        if start == end:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(self.word_codes[start:end]))
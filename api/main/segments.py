@@ -0,0 +1,147 @@
+"""Append-only segmented storage of the movie CSV.
+
+New movies are never written into ``tmdb_movie_data.csv``. Every download
+run adds an immutable segment file to ``tmdb_movie_data.segments/`` and then
+atomically replaces ``manifest.json``, which lists the files making up the
+current data::
+
+    {"generation": 3, "base": null, "segments": ["seg-000002.csv", "seg-000003.csv"]}
+
+``base`` is null for the original CSV or the name of a compacted base in
+the segment directory. Readers only ever see files a manifest points to, so
+they get either the old or the new data, never a half-written file.
+Compaction concatenates the base and the segments into a new base (the
+segments share the base header, so it is a plain byte copy) and swaps the
+manifest the same way.
+
+The module has no Django dependency, ``download_data.py`` and
+``train_kmeans.py`` use it directly. ``dataset.py`` builds on it.
+"""
+import contextlib
+import json
+import os
+import shutil
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows, writers are not expected to run concurrently there
+    fcntl = None
+
+MANIFEST_FILENAME = 'manifest.json'
+LOCK_FILENAME = '.lock'
+
+
+def file_version(path):
+    """(mtime_ns, size) of a file, or None when it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class SegmentStore:
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.directory = os.path.splitext(base_path)[0] + '.segments'
+        self.manifest_path = os.path.join(self.directory, MANIFEST_FILENAME)
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {'generation': 0, 'base': None, 'segments': []}
+
+    def version(self):
+        """(mtime_ns, size) of the manifest, or of the base CSV before the first segment."""
+        return file_version(self.manifest_path) or file_version(self.base_path)
+
+    def files(self, manifest=None):
+        manifest = manifest or self.read_manifest()
+        base = os.path.join(self.directory, manifest['base']) if manifest['base'] else self.base_path
+        return [base] + [os.path.join(self.directory, name) for name in manifest['segments']]
+
+    def read(self):
+        """Raw (uncleaned) frame of all segments."""
+        return pd.concat([pd.read_csv(path) for path in self.files()], ignore_index=True)
+
+    def columns(self):
+        with open(self.files()[0], encoding='utf-8') as file:
+            return list(pd.read_csv(file, nrows=0).columns)
+
+    @contextlib.contextmanager
+    def _writer_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, LOCK_FILENAME), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _write_manifest(self, manifest):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    def _write_file(self, name, write):
+        path = os.path.join(self.directory, name)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+    def append(self, df):
+        """Writes ``df`` as a new segment, returns its file name."""
+        with self._writer_lock():
+            manifest = self.read_manifest()
+            generation = manifest['generation'] + 1
+            name = f'seg-{generation:06d}.csv'
+            # Same columns in the same order as the base, compaction relies on it
+            self._write_file(name, lambda file: df.reindex(columns=self.columns()).to_csv(file, index=False))
+            self._write_manifest({**manifest, 'generation': generation, 'segments': manifest['segments'] + [name]})
+        return name
+
+    def compact(self, min_segments=1):
+        """Merges the base and all segments into a new base, returns the manifest or None when nothing was done."""
+        with self._writer_lock():
+            manifest = self.read_manifest()
+            if len(manifest['segments']) < min_segments:
+                return None
+            files = self.files(manifest)
+            generation = manifest['generation'] + 1
+            name = f'base-{generation:06d}.csv'
+
+            def write(output):
+                for index, path in enumerate(files):
+                    with open(path, encoding='utf-8', newline='') as source:
+                        if index:
+                            source.readline()  # header
+                        shutil.copyfileobj(source, output)
+                        if output.tell() and not _ends_with_newline(path):
+                            output.write('\n')
+
+            self._write_file(name, write)
+            compacted = {'generation': generation, 'base': name, 'segments': []}
+            self._write_manifest(compacted)
+
+            # Readers that still hold the old manifest retry on FileNotFoundError
+            for path in files:
+                if path != self.base_path:
+                    os.remove(path)
+        return compacted
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as file:
+        file.seek(0, os.SEEK_END)
+        if file.tell() == 0:
+            return True
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b'\n'
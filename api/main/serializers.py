@@ -7,8 +7,8 @@ class MovieSerializer(serializers.Serializer):
     vote_average = serializers.FloatField()
     vote_count = serializers.IntegerField()
     popularity = serializers.FloatField()
-    budget = serializers.IntegerField()
-    revenue = serializers.IntegerField()
+    budget = serializers.IntegerField(allow_null=True)
+    revenue = serializers.IntegerField(allow_null=True)
     runtime = serializers.FloatField(allow_null=True)
     genres = serializers.CharField(max_length=500)
     spoken_languages = serializers.CharField(max_length=500)
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""Movies nearest to a movie or a feature row in the space of the K-Means model.
+
+Movies are placed with the preprocessing steps of ``kmeans_pipeline.pkl``, so
+"similar" means close where the clusters were fitted. The KD-tree is built
+once per model and dataset version (see ``PipelineStore.for_dataset``).
+
+Genre and language filters become boolean row masks through the ``contains``
+index of the movie list and are cached per value. A filter that leaves few
+movies is answered by brute force over them, otherwise the tree is asked for
+more neighbours until enough of them pass the mask.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+
+from .prediction import PREDICTION_FEATURES, pipeline_store
+from .query import get_movie_index
+from .timing import timed
+
+SIMILAR_COUNT = 10
+MAX_SIMILAR_COUNT = 100
+
+# Masks selecting at most this many movies are searched without the tree
+BRUTE_FORCE_ROWS = 4096
+
+
+class SimilarMovies:
+    MASK_CACHE_SIZE = 256
+
+    def __init__(self, pipeline, dataset):
+        # Every step but the final KMeans, on the rows ClusterAssignments clusters (unknown values as 0, not the medians)
+        self.preprocessor = pipeline[:-1]
+        self.X = np.ascontiguousarray(
+            self.preprocessor.transform(dataset.df[PREDICTION_FEATURES].fillna(0)), dtype=np.float64
+        )
+        self.tree = KDTree(self.X)
+        self.ids = np.asarray(dataset.column('id'))
+        # Duplicate ids resolve to their first row
+        self.rows = pd.Series(np.arange(len(self.ids)), index=self.ids)
+        self.rows = self.rows[~self.rows.index.duplicated()]
+        self.index = get_movie_index(dataset)
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def point(self, features):
+        """Position of a feature row (``parse_movie_features``) in the model space."""
+        return self.preprocessor.transform(pd.DataFrame([features], columns=PREDICTION_FEATURES))[0]
+
+    def row(self, movie_id):
+        return self.rows.get(movie_id)
+
+    def mask(self, column, value):
+        key = (column, value.lower())
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+
+        mask = np.zeros(len(self.ids), dtype=bool)
+        mask[self.index.strings[column].contains(value)] = True
+        with self._lock:
+            self._masks[key] = mask
+            if len(self._masks) > self.MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+        return mask
+
+    @timed('neighbors')
+    def nearest(self, point, count, mask=None, exclude_id=None):
+        """``(rows, distances)`` of the ``count`` nearest movies allowed by ``mask``, one row per id."""
+        n = len(self.ids)
+        allowed = n if mask is None else int(np.count_nonzero(mask))
+        if allowed == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        if mask is not None and allowed <= BRUTE_FORCE_ROWS:
+            rows = np.flatnonzero(mask)
+            distances = np.sqrt(((self.X[rows] - point) ** 2).sum(axis=1))
+            order = np.argsort(distances, kind='stable')
+            return self._select(rows[order], distances[order], count, exclude_id)
+
+        # Expected number of neighbours to look at before ``count`` of them pass the mask
+        k = min(n, (count + 1) * -(-n // allowed))
+        while True:
+            distances, rows = self.tree.query(point[np.newaxis], k=k)
+            rows, distances = rows[0], distances[0]
+            if mask is not None:
+                keep = mask[rows]
+                rows, distances = rows[keep], distances[keep]
+            rows, distances = self._select(rows, distances, count, exclude_id)
+            if len(rows) >= count or k == n:
+                return rows, distances
+            k = min(n, k * 4)
+
+    def _select(self, rows, distances, count, exclude_id):
+        """First ``count`` of distance-sorted ``rows``, without ``exclude_id`` and repeated ids."""
+        ids = self.ids[rows]
+        keep = ids != exclude_id if exclude_id is not None else np.ones(len(rows), dtype=bool)
+        _, first = np.unique(ids, return_index=True)
+        unique = np.zeros(len(rows), dtype=bool)
+        unique[first] = True
+        keep &= unique
+        return rows[keep][:count], distances[keep][:count]
+
+
+def get_similar_movies(dataset):
+    return pipeline_store.for_dataset('similar_movies', SimilarMovies, dataset)
@@ -0,0 +1,141 @@
+"""Columnar binary snapshot of the movie dataset.
+
+The snapshot is built from the base CSV (``python manage.py build_snapshot``,
+segments appended later are still read as CSV on top of it) and lets
+workers map the data instead of parsing text at startup. Layout::
+
+    MAGIC | header length (uint64 LE) | JSON header | 64-byte aligned buffers
+
+Numeric columns are stored as raw little-endian arrays and are memory-mapped
+on load, so forked workers share the same pages. String columns are
+dictionary-encoded: an int32 code per row (-1 for missing) plus a UTF-8 blob
+of the distinct values with their offsets.
+"""
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+from .dataset import STRING_COLUMNS, clean_dataframe, file_version, store
+
+MAGIC = b'FILMSNP1'
+ALIGNMENT = 64
+SNAPSHOT_FILE_PATH = store.snapshot_path
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _encode_strings(values):
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    encoded = [str(value).encode('utf-8') for value in uniques]
+    offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return codes.astype('<i4'), offsets, blob
+
+
+def build_snapshot(csv_path=None, snapshot_path=SNAPSHOT_FILE_PATH):
+    """Snapshot of ``csv_path``, by default the current base of the segment store."""
+    csv_path = csv_path or store.segments.files()[0]
+    source_version = file_version(csv_path)
+    if source_version is None:
+        raise SnapshotError(f"Source file '{csv_path}' not found.")
+
+    df = clean_dataframe(pd.read_csv(csv_path))
+
+    buffers = []
+    columns = []
+    for name in df.columns:
+        if name in STRING_COLUMNS:
+            codes, offsets, blob = _encode_strings(df[name].to_numpy())
+            columns.append({'name': name, 'kind': 'dictionary', 'buffers': [len(buffers), len(buffers) + 1, len(buffers) + 2]})
+            buffers += [codes, offsets, blob]
+        else:
+            values = np.ascontiguousarray(df[name].to_numpy())
+            values = values.astype(values.dtype.newbyteorder('<'), copy=False)
+            columns.append({'name': name, 'kind': 'numeric', 'buffers': [len(buffers)]})
+            buffers.append(values)
+
+    # Offsets are relative to the start of the data section, which is itself aligned
+    buffer_specs = []
+    position = 0
+    for values in buffers:
+        position = -(-position // ALIGNMENT) * ALIGNMENT
+        buffer_specs.append({'offset': position, 'dtype': values.dtype.str, 'length': len(values)})
+        position += values.nbytes
+
+    header = json.dumps({
+        'source': {'mtime_ns': source_version[0], 'size': source_version[1]},
+        'rows': len(df),
+        'columns': columns,
+        'buffers': buffer_specs,
+    }).encode('utf-8')
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = snapshot_path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(struct.pack('<Q', len(header)))
+        file.write(header)
+        for spec, values in zip(buffer_specs, buffers):
+            file.write(b'\0' * (data_start + spec['offset'] - file.tell()))
+            file.write(values.tobytes())
+    os.replace(tmp_path, snapshot_path)
+    return len(df)
+
+
+def read_header(snapshot_path=SNAPSHOT_FILE_PATH):
+    with open(snapshot_path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise SnapshotError(f"'{snapshot_path}' is not a movie snapshot.")
+        (header_length,) = struct.unpack('<Q', file.read(8))
+        header = json.loads(file.read(header_length))
+    header['data_start'] = -(-(len(MAGIC) + 8 + header_length) // ALIGNMENT) * ALIGNMENT
+    return header
+
+
+def load_snapshot(snapshot_path=SNAPSHOT_FILE_PATH, source_version=None):
+    """Map the snapshot into a DataFrame.
+
+    Returns None when the snapshot is missing or was built from a different
+    version of the CSV than ``source_version``, so callers fall back to the CSV.
+    """
+    try:
+        header = read_header(snapshot_path)
+    except (FileNotFoundError, SnapshotError, ValueError, struct.error):
+        return None
+    if source_version is not None and tuple(header['source'].values()) != tuple(source_version):
+        return None
+
+    with open(snapshot_path, 'rb') as file:
+        mapped = np.frombuffer(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ), dtype=np.uint8)
+    data_start = header['data_start']
+
+    def buffer(index):
+        spec = header['buffers'][index]
+        dtype = np.dtype(spec['dtype'])
+        start = data_start + spec['offset']
+        return mapped[start:start + spec['length'] * dtype.itemsize].view(dtype)
+
+    data = {}
+    for column in header['columns']:
+        if column['kind'] == 'numeric':
+            data[column['name']] = buffer(column['buffers'][0])
+        else:
+            codes, offsets, blob = (buffer(index) for index in column['buffers'])
+            raw = blob.tobytes()
+            dictionary = np.array(
+                [raw[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])] + [np.nan],
+                dtype=object,
+            )
+            # Code -1 (missing) picks the trailing NaN
+            data[column['name']] = dictionary[codes]
+
+    # copy=False keeps one block per column, backed directly by the mapping
+    return pd.DataFrame(data, copy=False)
+
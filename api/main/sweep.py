@@ -0,0 +1,112 @@
+"""K-Means over a range of k for an elbow chart.
+
+Every k is fitted on the same preprocessed matrix (``FeatureMatrices.scaled``)
+in a pool of worker processes, created on the first sweep and kept for the
+later ones. The k values are split into one task per worker, so the matrix
+is sent to each worker once rather than with every k. Each k reports
+inertia, silhouette (on a fixed random sample, it is quadratic in the number
+of rows) and Davies-Bouldin.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+
+from django.conf import settings
+from sklearn.cluster import KMeans
+from sklearn.metrics import davies_bouldin_score, silhouette_score
+
+from .clustering import ClusteringError, _number, parse_features, parse_scaler
+from .features import get_feature_matrices
+from .jobs import START_METHOD
+from .timing import timed
+
+MAX_K = getattr(settings, 'KMEANS_SWEEP_MAX_K', 20)
+SILHOUETTE_SAMPLE = getattr(settings, 'KMEANS_SWEEP_SILHOUETTE_SAMPLE', 2000)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def parse_sweep_params(params):
+    k_min = _number(params, 'k_min', 2, int)
+    k_max = _number(params, 'k_max', 10, int)
+    if k_min < 2:
+        raise ValueError("k_min must be at least 2")
+    if k_max < k_min or k_max > MAX_K:
+        raise ValueError(f"k_max must be between k_min and {MAX_K}")
+    return {
+        'k_min': k_min,
+        'k_max': k_max,
+        'features': parse_features(params.get('features')),
+        'tf': parse_scaler(params.get('tf')),
+    }
+
+
+def _fit(X, k):
+    # Same seed and n_init as the K-Means endpoint, so the chart matches its clusterings
+    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
+    labels = kmeans.fit_predict(X)
+    sample = min(len(X), SILHOUETTE_SAMPLE)
+    return {
+        'k': k,
+        'inertia': float(kmeans.inertia_),
+        'silhouette': float(silhouette_score(X, labels, sample_size=sample, random_state=42)),
+        'davies_bouldin': float(davies_bouldin_score(X, labels)),
+    }
+
+
+def _fit_all(X, k_values):
+    return [_fit(X, k) for k in k_values]
+
+
+def _pool_size():
+    return max(1, getattr(settings, 'KMEANS_SWEEP_WORKERS', None) or os.cpu_count() or 1)
+
+
+def _get_executor():
+    """The worker pool, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=_pool_size(), mp_context=multiprocessing.get_context(START_METHOD))
+        return _executor
+
+
+def _discard_executor(executor):
+    """Forget a broken pool, the next sweep starts a new one."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+@timed('sweep')
+def kmeans_sweep(dataset, k_min, k_max, numeric_features, scaler_name):
+    X = get_feature_matrices(dataset).scaled(numeric_features, scaler_name)
+    k_values = range(k_min, k_max + 1)
+
+    workers = min(_pool_size(), len(k_values))
+    executor = None
+    try:
+        if workers == 1:
+            scores = _fit_all(X, k_values)
+        else:
+            executor = _get_executor()
+            # Largest k first, they take longest, dealt out so every worker gets a similar share
+            k_values = sorted(k_values, reverse=True)
+            shares = [k_values[i::workers] for i in range(workers)]
+            results = executor.map(_fit_all, [X] * workers, shares)
+            scores = sorted((score for share in results for score in share), key=lambda score: score['k'])
+    except Exception as e:
+        if isinstance(e, BrokenExecutor):
+            _discard_executor(executor)
+        raise ClusteringError(f"Error while K-Means sweep: {e}")
+
+    return {
+        'features': numeric_features,
+        'tf': scaler_name,
+        'silhouette_sample': min(len(X), SILHOUETTE_SAMPLE),
+        'scores': scores,
+    }
@@ -1,3 +1,1027 @@
-from django.test import TestCase
+import io
+import json
+import os
+import pickle
+import tempfile
+import unittest
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from csv import DictReader
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.test import AsyncClient, Client, SimpleTestCase, override_settings
+from sklearn.cluster import DBSCAN, KMeans
+from sklearn.impute import SimpleImputer
+from sklearn.metrics import davies_bouldin_score, silhouette_score
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from . import dataset as dataset_module
+from .aggregate import aggregate, parse_aggregate_params
+from .benchmark import compare_dbscan
+from .cache import ResultCache, clustering_cache
+from .dataset import Dataset, clean_dataframe
+from .features import get_feature_matrices
+from .genres import get_genre_matrix, split_genres
+from . import asyncviews, jobs, neighbors, timing, views
+from .clustering import parse_dbscan_params, parse_kmeans_params
+from .neighbors import EDGE_BYTES, NeighborGraph, NeighborSearch, dbscan, dbscan_labels, get_neighbor_index
+from .prediction import FEATURE_DEFAULTS, PREDICTION_FEATURES, ClusterAssignments, ModelNotFound, PipelineStore
+from .query import FilterError, get_movie_index, parse_filters
+from .segments import SegmentStore, file_version
+from .snapshot import build_snapshot, load_snapshot
+from . import similar as similar_module
+from .similar import SimilarMovies
+from . import sweep as sweep_module
+from .sweep import kmeans_sweep, parse_sweep_params
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+GENRES = ['Action', 'Comedy', 'Drama', 'Science Fiction', 'Thriller']
+LANGUAGES = ['English', 'French', 'Czech', 'Japanese']
+TITLES = ['Star Wars', 'The Star', 'Dark Star', 'Amélie', 'Alien', 'Aliens', 'The Matrix', 'Up', 'Starship', 'Heat']
+
+
+def make_movies(n=600, seed=0):
+    """Raw TMDB-shaped rows with repeated values, missing values and duplicated ids."""
+    rng = np.random.default_rng(seed)
+    ids = rng.integers(1, n, n)
+    zero_or = lambda values: np.where(rng.random(n) < 0.2, 0, values)
+    return pd.DataFrame({
+        'id': ids,
+        'title': [f'{TITLES[i % len(TITLES)]} {i // len(TITLES)}' if i % 3 else TITLES[i % len(TITLES)]
+                  for i in rng.integers(0, 100, n)],
+        'release_date': [None if i % 17 == 0 else f'{1950 + i % 70}-0{1 + i % 9}-1{i % 10}'
+                         for i in rng.integers(0, 1000, n)],
+        'vote_average': np.where(rng.random(n) < 0.05, np.nan, rng.integers(0, 20, n) / 2),
+        'vote_count': rng.integers(0, 50, n) * 10,
+        'popularity': rng.lognormal(1, 1, n).round(3),
+        'budget': zero_or(rng.integers(1, 20, n) * 1_000_000),
+        'revenue': zero_or(rng.integers(1, 60, n) * 1_000_000),
+        'runtime': zero_or(rng.integers(80, 160, n)),
+        'genres': [None if i == 0 else ', '.join(GENRES[j] for j in range(len(GENRES)) if i >> j & 1)
+                   for i in rng.integers(0, 2 ** len(GENRES), n)],
+        'spoken_languages': [', '.join(LANGUAGES[j] for j in range(len(LANGUAGES)) if i >> j & 1)
+                             for i in rng.integers(1, 2 ** len(LANGUAGES), n)],
+    })
+
+
+def make_dataset(n=600, seed=0):
+    return Dataset(clean_dataframe(make_movies(n, seed)), (seed, n))
+
+
+def make_pipeline(dataset, k=3, seed=0):
+    """K-Means pipeline shaped like the one of train_kmeans.py, fitted on ``dataset``."""
+    return Pipeline([
+        ('imputer', SimpleImputer(strategy='median')),
+        ('scaler', StandardScaler()),
+        ('cluster', KMeans(n_clusters=k, random_state=seed, n_init=3)),
+    ]).fit(dataset.df[PREDICTION_FEATURES])
+
+
+def pandas_filter(df, filters):
+    """The filtering of the original pandas MovieListView."""
+    for f in filters:
+        column, operator, value = f['column'], f['operator'], f['value']
+        if column in ('title', 'release_date', 'genres', 'spoken_languages'):
+            data = df[column].astype(str)
+            if operator == 'contains':
+                df = df[data.str.contains(str(value), case=False, na=False, regex=False)]
+            else:
+                df = df[data == str(value)]
+        else:
+            numeric = pd.to_numeric(df[column], errors='coerce')
+            df = df[{'gte': numeric >= value, 'lte': numeric <= value, 'gt': numeric > value,
+                     'lt': numeric < value, 'eq': numeric == value}[operator]]
+    return df
+
+
+class FilterTests(SimpleTestCase):
+    FILTERS = [
+        [],
+        [{'column': 'title', 'operator': 'contains', 'value': 'star'}],
+        [{'column': 'title', 'operator': 'contains', 'value': 'ALIEN'}],
+        [{'column': 'title', 'operator': 'eq', 'value': 'Up'}],
+        [{'column': 'genres', 'operator': 'contains', 'value': 'drama'},
+         {'column': 'vote_average', 'operator': 'gte', 'value': 6}],
+        [{'column': 'spoken_languages', 'operator': 'contains', 'value': 'French'},
+         {'column': 'budget', 'operator': 'gt', 'value': 5_000_000}],
+        [{'column': 'runtime', 'operator': 'gte', 'value': 90}, {'column': 'runtime', 'operator': 'lt', 'value': 120}],
+        [{'column': 'vote_count', 'operator': 'eq', 'value': 100}],
+        [{'column': 'popularity', 'operator': 'lte', 'value': '2.5'}],
+        [{'column': 'release_date', 'operator': 'contains', 'value': '199'}],
+    ]
+
+    def setUp(self):
+        self.dataset = make_dataset()
+        self.index = get_movie_index(self.dataset)
+
+    def test_bitmap_filters_match_pandas(self):
+        for filters in self.FILTERS:
+            with self.subTest(filters=filters):
+                parsed = parse_filters(filters)
+                expected = pandas_filter(self.dataset.df, parsed).index.to_numpy()
+                np.testing.assert_array_equal(self.index.positions(parsed), expected)
+
+    def test_contains_ignores_accents(self):
+        rows = self.index.positions(parse_filters([{'column': 'title', 'operator': 'contains', 'value': 'amelie'}]))
+        self.assertTrue(len(rows))
+        self.assertTrue(all(self.dataset.df['title'].iloc[rows].str.startswith('Amélie')))
+
+    def test_incomplete_filters_are_skipped(self):
+        self.assertEqual(parse_filters([{'column': 'title', 'operator': 'contains', 'value': ''},
+                                        {'column': 'runtime', 'operator': 'gte'}]), [])
+
+    def test_malformed_filters_raise(self):
+        for filters in ([{'column': ['title'], 'operator': 'eq', 'value': 'Up'}],
+                        [{'column': 'nope', 'operator': 'eq', 'value': 'Up'}],
+                        [{'column': 'title', 'operator': 'gte', 'value': 'Up'}],
+                        [{'column': 'runtime', 'operator': 'gte', 'value': 'long'}],
+                        [{'column': 'runtime', 'operator': 'gte', 'value': [90]}],
+                        ['title']):
+            with self.subTest(filters=filters), self.assertRaises(FilterError):
+                parse_filters(filters)
+
+
+class DatasetViewTestCase(SimpleTestCase):
+    """Views served from a generated dataset instead of the CSV."""
+
+    def setUp(self):
+        self.dataset = make_dataset()
+        patcher = mock.patch.object(dataset_module, 'store')
+        store = patcher.start()
+        store.get.return_value = store.current.return_value = self.dataset
+        self.addCleanup(patcher.stop)
+        self.client = Client()
+
+    def get_json(self, path, params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return json.loads(response.content)
+
+
+class KeysetPaginationTests(DatasetViewTestCase):
+    def pages(self, sort, filters, limit):
+        params = {'sort': sort, 'limit': limit, 'filters': json.dumps(filters), 'cursor': ''}
+        while True:
+            page = self.get_json('/api/movies/', params)
+            yield page
+            if not page['next']:
+                return
+            params['cursor'] = page['next_cursor']
+
+    def test_pages_follow_the_offset_order(self):
+        filters = [{'column': 'genres', 'operator': 'contains', 'value': 'Comedy'}]
+        for sort in ('id', '-popularity', 'vote_average,-runtime', '-budget,id'):
+            with self.subTest(sort=sort):
+                # Ties and missing values included, every matching row comes exactly once
+                keyset = [movie for page in self.pages(sort, filters, 7) for movie in page['results']]
+                offset = self.get_json('/api/movies/', {'sort': sort, 'limit': 1000, 'filters': json.dumps(filters)})
+                self.assertEqual(len(keyset), offset['total_count'])
+                self.assertEqual([movie['id'] for movie in keyset], [movie['id'] for movie in offset['results']])
+
+    def test_cursor_of_another_sort_is_rejected(self):
+        page = next(self.pages('id', [], 5))
+        response = self.client.get('/api/movies/', {'sort': '-popularity', 'cursor': page['next_cursor']})
+        self.assertEqual(response.status_code, 400)
+
+
+class ResultCacheTests(SimpleTestCase):
+    def test_least_recently_used_bodies_are_evicted_by_size(self):
+        cache = ResultCache(max_bytes=10)
+        cache.set('a', b'aaaa')
+        cache.set('b', b'bbbb')
+        self.assertEqual(cache.get('a'), b'aaaa')
+        cache.set('c', b'cccc')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c'), cache.size), (b'aaaa', b'cccc', 8))
+
+        cache.set('a', b'a')
+        self.assertEqual(cache.size, 5)
+        cache.set('huge', b'x' * 11)
+        self.assertIsNone(cache.get('huge'))
+        self.assertEqual(cache.size, 5)
+
+    def test_alias_shares_bodies_between_workers(self):
+        backend = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'result-cache-tests'}
+        with override_settings(CACHES={'default': backend, 'shared': backend}):
+            caches['shared'].clear()
+            first, second = ResultCache(1024, alias='shared'), ResultCache(1024, alias='shared')
+            first.set('key', b'body')
+            self.assertEqual(caches['shared'].get('key'), b'body')
+            # Another worker's cache misses locally and keeps the body once read
+            self.assertEqual(second.get('key'), b'body')
+            caches['shared'].clear()
+            self.assertEqual(second.get('key'), b'body')
+            self.assertIsNone(ResultCache(1024).get('key'))
+
+
+class PipelineStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'kmeans_pipeline.pkl')
+        self.dataset = make_dataset()
+        self.store = PipelineStore(self.path)
+
+    def write(self, pipeline, mtime):
+        with open(self.path, 'wb') as file:
+            pickle.dump(pipeline, file)
+        os.utime(self.path, ns=(mtime, mtime))
+
+    def test_pipeline_is_reloaded_when_the_artifact_changes(self):
+        with self.assertRaises(ModelNotFound):
+            self.store.get()
+
+        self.write(make_pipeline(self.dataset, k=3), 1_000_000_000)
+        pipeline = self.store.get()
+        assignments = self.store.assignments(self.dataset)
+        self.assertIs(self.store.get(), pipeline)
+        self.assertIs(self.store.assignments(self.dataset), assignments)
+        self.assertEqual(pipeline[-1].n_clusters, 3)
+
+        self.write(make_pipeline(self.dataset, k=4), 2_000_000_000)
+        self.assertEqual(self.store.get()[-1].n_clusters, 4)
+        self.assertIsNot(self.store.assignments(self.dataset), assignments)
+        self.assertEqual(self.store.assignments(self.dataset).labels.max(), 3)
+
+        # A new dataset version gets its own assignments under the same model
+        other = make_dataset(seed=1)
+        self.assertIs(self.store.assignments(other).dataset, other)
+
+    def test_assignments_index_the_clusters_by_genre(self):
+        pipeline = make_pipeline(self.dataset)
+        assignments = ClusterAssignments(pipeline, self.dataset)
+        labels = pipeline.predict(self.dataset.df[PREDICTION_FEATURES].fillna(0))
+        np.testing.assert_array_equal(assignments.labels, labels)
+
+        genres = [split_genres(value) for value in self.dataset.df['genres']]
+        for cluster in range(3):
+            for genre in ('Drama', 'Science Fiction', 'Sci', 'Western'):
+                with self.subTest(cluster=cluster, genre=genre):
+                    expected = [row for row, label in enumerate(labels)
+                                if label == cluster and any(genre in name for name in genres[row])]
+                    self.assertEqual(assignments.candidates(cluster, genre).tolist(), expected)
+
+        recommendations = assignments.recommend(1, 'Drama', rng=np.random.default_rng(0))
+        self.assertEqual(len(recommendations), 3)
+        rows = assignments.candidates(1, 'Drama')
+        self.assertLessEqual({movie['title'] for movie in recommendations},
+                             set(self.dataset.df['title'].take(rows)))
+        self.assertEqual(assignments.recommend(1, 'Western'), [])
+
+
+class PredictionBatchTests(DatasetViewTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'kmeans_pipeline.pkl')
+        self.pipeline = make_pipeline(self.dataset)
+        with open(path, 'wb') as file:
+            pickle.dump(self.pipeline, file)
+        patcher = mock.patch.object(views, 'pipeline_store', PipelineStore(path))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, body, content_type='application/json', **headers):
+        return self.client.post('/api/clustering/predict/batch/', body, content_type=content_type, headers=headers)
+
+    def expected_cluster(self, movie):
+        row = dict(FEATURE_DEFAULTS, **movie)
+        return int(self.pipeline.predict(pd.DataFrame([row], columns=PREDICTION_FEATURES))[0])
+
+    def test_results_follow_the_input_with_defaults_and_errors(self):
+        movies = [{'vote_average': 7, 'budget': 1e7},
+                  {'vote_average': 'seven', 'budget': 1e7},
+                  {'vote_average': 5.5, 'budget': 9e7, 'runtime': 150, 'revenue': 3e8, 'genre': 'Drama'}]
+        response = self.post(json.dumps(movies))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        results = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([result['index'] for result in results], [0, 1, 2])
+        self.assertEqual(results[1], {'index': 1, 'error': "Invalid format of numeric inputs."})
+        for position in (0, 2):
+            movie = {key: value for key, value in movies[position].items() if key != 'genre'}
+            self.assertEqual(results[position]['predicted_cluster'], self.expected_cluster(movie))
+        drama = self.dataset.df['genres'].fillna('').str.contains('Drama')
+        for recommendation in results[2]['recommendations']:
+            self.assertTrue(drama[self.dataset.df['title'] == recommendation['title']].any())
+
+    def test_ndjson_in_and_out(self):
+        body = '{"vote_average": 7, "budget": 1e7}\n\n{"vote_average": 4, "budget": 5e6, "popularity": 3}\n'
+        response = self.post(body, content_type='application/x-ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['predicted_cluster'] for line in lines],
+                         [self.expected_cluster({'vote_average': 7, 'budget': 1e7}),
+                          self.expected_cluster({'vote_average': 4, 'budget': 5e6, 'popularity': 3})])
+
+        response = self.post('{"vote_average": 7}\n{"vote_average": \n', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('line 2', json.loads(response.content)['detail'])
+
+    def test_batches_must_be_lists_within_the_limit(self):
+        self.assertEqual(self.post(json.dumps({'vote_average': 7, 'budget': 1e7})).status_code, 400)
+        with override_settings(PREDICTION_BATCH_MAX_ITEMS=2):
+            self.assertEqual(self.post(json.dumps([{'vote_average': 7, 'budget': 1e7}] * 3)).status_code, 400)
+            self.assertEqual(self.post(json.dumps([{'vote_average': 7, 'budget': 1e7}] * 2)).status_code, 200)
+
+
+def unpack_column(column):
+    """Values of a msgpack column, typed buffers decoded with their dtype."""
+    if isinstance(column, dict):
+        return np.frombuffer(column['data'], dtype=column['dtype'])
+    return column
+
+
+class ClusteringEncodingTestCase(DatasetViewTestCase):
+    def setUp(self):
+        super().setUp()
+        clustering_cache.clear()
+        self.addCleanup(clustering_cache.clear)
+
+
+class ClusteringEncodingTests(ClusteringEncodingTestCase):
+    def test_columnar_json_has_the_rows_as_columns(self):
+        rows = self.get_json('/api/clustering/kmeans/', {'k': 3})
+        columns = self.get_json('/api/clustering/kmeans/', {'k': 3, 'format': 'columnar'})
+        self.assertEqual(columns['cluster_summary'], rows['cluster_summary'])
+        for frame in ('movies_with_cluster', 'pca_data'):
+            with self.subTest(frame=frame):
+                self.assertEqual(list(columns[frame]), list(rows[frame][0]))
+                for name, values in columns[frame].items():
+                    self.assertEqual(values, [row[name] for row in rows[frame]])
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack_keeps_the_values_and_types(self):
+        rows = self.get_json('/api/clustering/kmeans/', {'k': 3})
+        response = self.client.get('/api/clustering/kmeans/', {'k': 3}, headers={'Accept': 'application/x-msgpack'})
+        self.assertEqual(response['Content-Type'], 'application/x-msgpack')
+        packed = msgpack.unpackb(response.content, raw=False)
+        self.assertEqual((packed['n_clusters'], packed['projection']), (rows['n_clusters'], rows['projection']))
+        self.assertEqual(packed['cluster_summary'], rows['cluster_summary'])
+
+        movies, pca = packed['movies_with_cluster'], packed['pca_data']
+        self.assertEqual({name: column['dtype'] for name, column in movies.items() if isinstance(column, dict)},
+                         {'id': '<i8', 'cluster': '<i4', 'vote_average': '<f8', 'vote_count': '<f8',
+                          'popularity': '<f8', 'budget': '<f8', 'revenue': '<f8', 'runtime': '<f8'})
+        self.assertEqual({name: column['dtype'] for name, column in pca.items()}, {'PC1': '<f4', 'PC2': '<f4', 'cluster': '<i4'})
+        for frame, columns in (('movies_with_cluster', movies), ('pca_data', pca)):
+            for name, column in columns.items():
+                with self.subTest(frame=frame, column=name):
+                    expected = [row[name] for row in rows[frame]]
+                    values = unpack_column(column)
+                    if name == 'title':
+                        self.assertEqual(values, expected)
+                    else:
+                        expected = np.array([np.nan if value is None else value for value in expected], dtype=np.float64)
+                        np.testing.assert_allclose(values.astype(np.float64), expected, rtol=1e-6)
+
+
+class LabelsOnlyTests(ClusteringEncodingTestCase):
+    def test_labels_follow_the_full_response(self):
+        for path, params in (('/api/clustering/kmeans/', {'k': 3}), ('/api/clustering/kmeans/', {'k': 5}),
+                             ('/api/clustering/dbscan/', {'eps': 1.0, 'minPts': 5})):
+            with self.subTest(path=path, params=params):
+                full = self.get_json(path, params)
+                labels = self.get_json(path, {**params, 'labels_only': '1'})
+                self.assertNotIn('movies_with_cluster', labels)
+                self.assertNotIn('pca_data', labels)
+                self.assertEqual(labels['labels'], [movie['cluster'] for movie in full['movies_with_cluster']])
+                self.assertEqual(labels['cluster_summary'], full['cluster_summary'])
+                self.assertEqual(labels['projection'], full['projection'])
+
+    def test_projection_is_shared_by_the_clusterings_of_one_feature_set(self):
+        projections = {self.get_json('/api/clustering/kmeans/', {'k': k, 'labels_only': '1'})['projection'] for k in (3, 4)}
+        projections.add(self.get_json('/api/clustering/dbscan/', {'eps': 1.0, 'labels_only': '1'})['projection'])
+        self.assertEqual(len(projections), 1)
+        other = self.get_json('/api/clustering/kmeans/', {'k': 3, 'features': 'budget,revenue', 'labels_only': '1'})
+        self.assertNotIn(other['projection'], projections)
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack_labels_are_int32(self):
+        full = self.get_json('/api/clustering/kmeans/', {'k': 3})
+        response = self.client.get('/api/clustering/kmeans/', {'k': 3, 'labels_only': '1', 'format': 'msgpack'})
+        labels = msgpack.unpackb(response.content, raw=False)['labels']
+        self.assertEqual(labels['dtype'], '<i4')
+        self.assertEqual(unpack_column(labels).tolist(), [movie['cluster'] for movie in full['movies_with_cluster']])
+
+
+def pandas_dominant_genre(genres):
+    """Dominant genre the way the original clustering views found it, missing values skipped."""
+    genres = genres.dropna()
+    all_genres = ', '.join(genres.astype(str).str.replace(r'[\[\]\"]', '', regex=True)).split(', ')
+    all_genres = [g.strip() for g in all_genres if g.strip()]
+    return pd.Series(all_genres).mode()[0] if all_genres else "N/A"
+
+
+class GenreMatrixTests(SimpleTestCase):
+    def setUp(self):
+        self.dataset = make_dataset()
+        self.genres = self.dataset.df['genres']
+        self.labels = np.random.default_rng(0).integers(-1, 6, len(self.dataset))
+
+    def test_dominant_genre_matches_pandas_mode(self):
+        # Cluster 6 has no movies, noise (-1) is left out
+        clusters = np.arange(7)
+        dominant, _ = get_genre_matrix(self.dataset).summary(self.labels, clusters)
+        self.assertEqual(dominant, [pandas_dominant_genre(self.genres[self.labels == cluster]) for cluster in clusters])
+        self.assertEqual(dominant[6], "N/A")
+
+    def test_distribution_counts_every_genre_of_the_cluster(self):
+        matrix = get_genre_matrix(self.dataset)
+        self.assertEqual(matrix.names, sorted(GENRES))
+        clusters = np.arange(6)
+        _, distributions = matrix.summary(self.labels, clusters, top_n=3)
+        for cluster, distribution in zip(clusters, distributions):
+            with self.subTest(cluster=cluster):
+                members = self.genres[self.labels == cluster]
+                counts = pd.Series([genre for value in members for genre in split_genres(value)]).value_counts()
+                # Most frequent first, ties alphabetical
+                expected = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:3]
+                self.assertEqual([(entry['genre'], entry['count']) for entry in distribution], expected)
+                for entry in distribution:
+                    self.assertEqual(entry['share'], round(entry['count'] / len(members), 4))
+
+    def test_missing_and_bracketed_genres(self):
+        df = make_dataset(4).df.copy()
+        df['genres'] = [None, '["Drama", "Comedy"]', 'Drama', 'Comedy,Drama']
+        dataset = Dataset(df, (1, 4))
+        counts, sizes = get_genre_matrix(dataset).cluster_counts(np.array([0, 0, 1, 1]), np.array([0, 1]))
+        self.assertEqual(get_genre_matrix(dataset).names, ['Comedy', 'Drama'])
+        self.assertEqual(counts.tolist(), [[1, 1], [1, 2]])
+        self.assertEqual(sizes.tolist(), [2, 2])
+
+
+class KMeansSweepTests(SimpleTestCase):
+    FEATURES = ['vote_average', 'budget', 'revenue']
+
+    def setUp(self):
+        self.dataset = make_dataset()
+        self.X = get_feature_matrices(self.dataset).scaled(self.FEATURES, 'standardScaler')
+
+    def sweep(self, workers):
+        with override_settings(KMEANS_SWEEP_WORKERS=workers):
+            return kmeans_sweep(self.dataset, 2, 5, self.FEATURES, 'standardScaler')
+
+    def test_scores_match_direct_fits(self):
+        sweep = self.sweep(1)
+        self.assertEqual([score['k'] for score in sweep['scores']], [2, 3, 4, 5])
+        for score in sweep['scores']:
+            with self.subTest(k=score['k']):
+                kmeans = KMeans(n_clusters=score['k'], random_state=42, n_init=10).fit(self.X)
+                self.assertAlmostEqual(score['inertia'], kmeans.inertia_)
+                self.assertAlmostEqual(score['silhouette'], silhouette_score(self.X, kmeans.labels_))
+                self.assertAlmostEqual(score['davies_bouldin'], davies_bouldin_score(self.X, kmeans.labels_))
+
+    def test_worker_pool_gives_the_same_scores_and_is_kept(self):
+        def shutdown():
+            if sweep_module._executor is not None:
+                sweep_module._discard_executor(sweep_module._executor)
+        self.addCleanup(shutdown)
+        expected = self.sweep(1)
+        self.assertEqual(self.sweep(2), expected)
+        executor = sweep_module._executor
+        self.assertIsNotNone(executor)
+        self.assertEqual(self.sweep(2), expected)
+        self.assertIs(sweep_module._executor, executor)
+
+
+class SimilarMoviesTests(SimpleTestCase):
+    def setUp(self):
+        self.dataset = make_dataset()
+        self.similar = SimilarMovies(make_pipeline(self.dataset), self.dataset)
+        self.df = self.dataset.df
+
+    def brute_force(self, point, count, mask=None, exclude_id=None):
+        distances = np.sqrt(((self.similar.X - point) ** 2).sum(axis=1))
+        rows = [row for row in np.argsort(distances, kind='stable') if mask is None or mask[row]]
+        seen = {exclude_id}
+        nearest = []
+        for row in rows:
+            if self.df['id'].iloc[row] not in seen:
+                seen.add(self.df['id'].iloc[row])
+                nearest.append(row)
+        return nearest[:count], distances[nearest[:count]]
+
+    def test_nearest_matches_brute_force(self):
+        genre = self.df['genres'].fillna('').str.contains('drama', case=False).to_numpy()
+        czech = self.df['spoken_languages'].str.contains('Czech').to_numpy()
+        np.testing.assert_array_equal(self.similar.mask('genres', 'drama'), genre)
+        movie_id = int(self.df['id'].iloc[7])
+        for brute_force_rows in (similar_module.BRUTE_FORCE_ROWS, 0):
+            for mask in (None, genre, genre & czech):
+                with self.subTest(brute_force_rows=brute_force_rows, mask=None if mask is None else int(mask.sum())), \
+                        mock.patch.object(similar_module, 'BRUTE_FORCE_ROWS', brute_force_rows):
+                    point = self.similar.X[self.similar.row(movie_id)]
+                    rows, distances = self.similar.nearest(point, 10, mask, exclude_id=movie_id)
+                    expected_rows, expected_distances = self.brute_force(point, 10, mask, exclude_id=movie_id)
+                    self.assertEqual(rows.tolist(), expected_rows)
+                    np.testing.assert_allclose(distances, expected_distances)
+
+    def test_repeated_ids_are_listed_once_and_resolve_to_their_first_row(self):
+        ids = self.df['id']
+        repeated = int(ids[ids.duplicated()].iloc[0])
+        self.assertEqual(self.similar.row(repeated), int(np.flatnonzero(ids == repeated)[0]))
+        rows, _ = self.similar.nearest(self.similar.X[0], 100)
+        self.assertEqual(len(set(ids.take(rows))), 100)
+
+    def test_empty_mask_finds_nothing(self):
+        rows, distances = self.similar.nearest(self.similar.X[0], 5, np.zeros(len(self.df), dtype=bool))
+        self.assertEqual((len(rows), len(distances)), (0, 0))
+
+
+class AutocompleteTests(DatasetViewTestCase):
+    MOVIES = [  # id, title, popularity
+        (10, 'Starship', 5.0),
+        (11, 'Star Wars', 1.0),
+        (11, 'Star Wars', 1.0),
+        (12, 'Stargate', np.nan),
+        (13, 'The Star', 10.0),
+        (14, 'Dark Star', 2.0),
+        (15, 'Mustard', 100.0),
+        (13, 'Mustard 2', 50.0),
+        (16, 'Stárry Night', 3.0),
+        (17, 'Alien', 80.0),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        df = make_movies(len(self.MOVIES))
+        df['id'], df['title'], df['popularity'] = map(list, zip(*self.MOVIES))
+        self.dataset = Dataset(clean_dataframe(df), (2, len(df)))
+        dataset_module.store.get.return_value = dataset_module.store.current.return_value = self.dataset
+
+    def titles(self, query, count=10):
+        return [self.dataset.df['title'].iloc[row] for row in get_movie_index(self.dataset).autocomplete(query, count)]
+
+    def test_prefixes_rank_before_words_before_substrings(self):
+        # Most popular first within a rank, unknown popularity last; 13 is suggested once, as its best title
+        self.assertEqual(self.titles('star'),
+                         ['Starship', 'Stárry Night', 'Star Wars', 'Stargate', 'The Star', 'Dark Star', 'Mustard'])
+        self.assertEqual(self.titles('STAR', 2), ['Starship', 'Stárry Night'])
+        self.assertEqual(self.titles('st'), self.titles('star'))
+        self.assertEqual(self.titles('starr'), ['Stárry Night'])
+        self.assertEqual(self.titles('xyz'), [])
+
+    def test_endpoint_returns_the_ranked_movies(self):
+        body = self.get_json('/api/movies/autocomplete/', {'q': 'star', 'n': 3})
+        self.assertEqual([movie['id'] for movie in body['results']], [10, 16, 11])
+        self.assertEqual(set(body['results'][0]), {'id', 'title', 'release_date', 'vote_average', 'popularity'})
+        self.assertEqual(self.get_json('/api/movies/autocomplete/', {'q': ' '})['results'], [])
+        self.assertEqual(self.client.get('/api/movies/autocomplete/', {'q': 'star', 'n': 0}).status_code, 400)
+
+
+class DBScanEngineTests(SimpleTestCase):
+    FEATURES = ['vote_average', 'vote_count', 'popularity', 'budget', 'revenue', 'runtime']
+
+    def setUp(self):
+        self.dataset = make_dataset(800)
+        self.X = get_feature_matrices(self.dataset).scaled(self.FEATURES, 'standardScaler')
+
+    def test_engines_label_like_sklearn(self):
+        for eps, min_samples in ((0.3, 3), (0.5, 5), (0.8, 10)):
+            expected = DBSCAN(eps=eps, min_samples=min_samples).fit_predict(self.X)
+            for engine in ('graph', 'chunked'):
+                with self.subTest(eps=eps, min_samples=min_samples, engine=engine):
+                    labels, used, _ = dbscan(self.dataset, self.FEATURES, eps, min_samples, engine)
+                    self.assertEqual(used, engine)
+                    np.testing.assert_array_equal(labels, expected)
+
+    def test_slider_increase_reuses_the_graph(self):
+        search = get_neighbor_index(self.dataset).search(self.FEATURES)
+        # Room for a graph somewhat larger than the one at eps, not for the one at DBSCAN_GRAPH_RADIUS
+        max_bytes = int(search.counts(0.3).sum() * EDGE_BYTES * 3)
+        self.assertGreater(search.counts(neighbors.GRAPH_RADIUS).sum() * EDGE_BYTES, max_bytes)
+
+        with mock.patch.object(neighbors, 'GRAPH_MAX_BYTES', max_bytes):
+            _, _, reused = dbscan(self.dataset, self.FEATURES, 0.3, 5, 'graph')
+            self.assertFalse(reused)
+            graph, reused = get_neighbor_index(self.dataset).graph(self.FEATURES, 0.3)
+            self.assertTrue(reused)
+            self.assertGreater(graph.radius, 0.3)
+            self.assertLessEqual(graph.nbytes - graph.indptr.nbytes, max_bytes)
+
+            for eps in (0.3 + (graph.radius - 0.3) / 2, graph.radius, 0.2):
+                with self.subTest(eps=eps):
+                    labels, engine, reused = dbscan(self.dataset, self.FEATURES, eps, 5, 'auto')
+                    self.assertEqual((engine, reused), ('graph', True))
+                    np.testing.assert_array_equal(labels, DBSCAN(eps=eps, min_samples=5).fit_predict(self.X))
+
+    def test_auto_keeps_the_graph_at_eps(self):
+        labels, engine, reused = dbscan(self.dataset, self.FEATURES, 0.5, 5, 'auto')
+        self.assertEqual((engine, reused), ('graph', False))
+        np.testing.assert_array_equal(labels, DBSCAN(eps=0.5, min_samples=5).fit_predict(self.X))
+        self.assertEqual(get_neighbor_index(self.dataset).cached_graph(self.FEATURES, 0.5).radius, 0.5)
+
+        for eps, min_samples in ((0.5, 10), (0.3, 5)):
+            with self.subTest(eps=eps, min_samples=min_samples):
+                labels, engine, reused = dbscan(self.dataset, self.FEATURES, eps, min_samples, 'auto')
+                self.assertEqual((engine, reused), ('graph', True))
+                np.testing.assert_array_equal(labels, DBSCAN(eps=eps, min_samples=min_samples).fit_predict(self.X))
+
+    def test_auto_streams_when_the_graph_does_not_fit(self):
+        with mock.patch.object(neighbors, 'GRAPH_MAX_BYTES', 1024):
+            labels, engine, reused = dbscan(self.dataset, self.FEATURES, 0.8, 5, 'auto')
+        self.assertEqual((engine, reused), ('chunked', False))
+        np.testing.assert_array_equal(labels, DBSCAN(eps=0.8, min_samples=5).fit_predict(self.X))
+        self.assertIsNone(get_neighbor_index(self.dataset).cached_graph(self.FEATURES, 0.8))
+
+    def test_auto_is_not_slower_than_sklearn(self):
+        # Cold requests, best of three; the margin only absorbs timer noise
+        for eps, timing in compare_dbscan(make_dataset(4000).df, eps_values=(0.3, 1.0)).items():
+            with self.subTest(eps=eps):
+                self.assertLessEqual(timing['auto_ms'], timing['sklearn_ms'] * 1.2)
+
+    def test_eps_must_be_finite(self):
+        for eps in ('nan', 'inf', '0', '-1'):
+            with self.subTest(eps=eps), self.assertRaises(ValueError):
+                parse_dbscan_params({'eps': eps})
+
+    def test_small_chunks_label_like_sklearn(self):
+        search = NeighborSearch(self.X, chunk_max_bytes=4096)
+        graph = NeighborGraph.build(search, 0.8, 64 * 1024 * 1024)
+        for eps in (0.4, 0.8):
+            expected = DBSCAN(eps=eps, min_samples=4).fit_predict(self.X)
+            with self.subTest(eps=eps):
+                np.testing.assert_array_equal(dbscan_labels(len(self.X), 4, search.edges(eps)), expected)
+                np.testing.assert_array_equal(dbscan_labels(len(self.X), 4, graph.edges(eps)), expected)
+
+
+class ClusteringParamsTests(SimpleTestCase):
+    def test_json_body_values_of_the_wrong_type_raise_value_error(self):
+        for parse, params in ((parse_kmeans_params, {'k': [1]}),
+                              (parse_kmeans_params, {'k': True}),
+                              (parse_kmeans_params, {'features': ['vote_average', 1]}),
+                              (parse_kmeans_params, {'features': {'a': 1}}),
+                              (parse_kmeans_params, {'tf': ['standardScaler']}),
+                              (parse_dbscan_params, {'eps': None}),
+                              (parse_dbscan_params, {'minPts': {}}),
+                              (parse_dbscan_params, {'engine': ['graph']}),
+                              (parse_sweep_params, {'k_min': 'two'}),
+                              (parse_sweep_params, {'k_max': [10]})):
+            with self.subTest(params=params), self.assertRaises(ValueError):
+                parse(params)
+
+    def test_json_lists_of_features_are_accepted(self):
+        self.assertEqual(parse_kmeans_params({'k': 4, 'features': ['runtime', 'budget']})['features'],
+                         ['runtime', 'budget'])
+
+
+class ExportTests(DatasetViewTestCase):
+    def test_csv_matches_the_filtered_rows(self):
+        filters = [{'column': 'vote_count', 'operator': 'gte', 'value': 50}]
+        response = self.client.get('/api/movies/export/', {'filters': json.dumps(filters)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        exported = pd.read_csv(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(exported['id'].tolist(), pandas_filter(self.dataset.df, filters)['id'].tolist())
+
+    def test_ndjson_numbers_are_the_csv_numbers(self):
+        # Written with 15 digits these become 8.204000000000001 and 32.985762999999999
+        self.dataset.df.loc[:1, 'popularity'] = [8.204, 32.985763]
+        csv = self.client.get('/api/movies/export/', {'filters': '[]', 'format': 'csv'})
+        rows = list(DictReader(io.StringIO(b''.join(csv.streaming_content).decode())))
+        ndjson = self.client.get('/api/movies/export/', {'filters': '[]', 'format': 'ndjson'})
+        records = [json.loads(line, parse_float=Decimal) for line in b''.join(ndjson.streaming_content).decode().splitlines()]
+        self.assertEqual(len(records), len(rows))
+        for column in ('vote_average', 'popularity', 'budget', 'revenue', 'runtime'):
+            with self.subTest(column=column):
+                self.assertEqual([record[column] for record in records],
+                                 [Decimal(row[column]) if row[column] else None for row in rows])
+
+    def test_errors_are_json_whatever_the_format(self):
+        for params in ({'filters': '[{"column": "nope", "operator": "eq", "value": 1}]'},
+                       {'filters': '[]', 'format': 'ndjson', 'clusters': 'spectral'},
+                       {'filters': '[]', 'format': 'xlsx'}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/movies/export/', params)
+                self.assertIn(response.status_code, (400, 404))
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertIn('detail', json.loads(response.content))
+
+
+class ColdIndexOffloadTests(DatasetViewTestCase):
+    def test_movie_list_is_offloaded_until_the_index_is_built(self):
+        with mock.patch.object(asyncviews, '_offloaded', wraps=asyncviews._offloaded) as offloaded:
+            self.get_json('/api/movies/', {'limit': 5})
+            self.assertEqual(offloaded.call_count, 1)
+            self.assertTrue(self.dataset.is_cached('movie_index'))
+            self.get_json('/api/movies/autocomplete/', {'q': 'the'})
+            self.get_json('/api/movies/', {'limit': 5})
+            self.assertEqual(offloaded.call_count, 1)
+
+    def test_new_sort_orders_are_offloaded(self):
+        self.get_json('/api/movies/', {'limit': 5})
+        with mock.patch.object(asyncviews, '_offloaded', wraps=asyncviews._offloaded) as offloaded:
+            for params, calls in (({'sort': '-popularity'}, 1),
+                                  ({'sort': '-popularity', 'page': 2}, 1),
+                                  ({'sort': '-popularity', 'cursor': ''}, 1),
+                                  # Keyset pages default to the id order
+                                  ({'cursor': ''}, 2),
+                                  ({'cursor': '', 'sort': 'id'}, 2),
+                                  ({'sort': 'runtime,-budget'}, 3)):
+                with self.subTest(params=params):
+                    self.get_json('/api/movies/', {'limit': 5, **params})
+                    self.assertEqual(offloaded.call_count, calls)
+            self.assertEqual(self.client.get('/api/movies/', {'sort': 'title'}).status_code, 400)
+            self.assertEqual(offloaded.call_count, 3)
+
+
+class TimingTests(DatasetViewTestCase):
+    def test_server_timing_lists_the_stages_and_the_total(self):
+        response = self.client.get('/api/movies/', {'limit': 5})
+        parts = response['Server-Timing'].split(', ')
+        self.assertEqual(parts[-1].split(';')[0], 'total')
+        self.assertIn('records', [part.split(';')[0] for part in parts])
+        for part in parts:
+            self.assertRegex(part, r'^[a-z_]+;dur=\d+\.\d{3}$')
+
+    def test_metrics_are_prometheus_histograms(self):
+        self.client.get('/api/movies/', {'limit': 5})
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE filmy_request_duration_seconds histogram', lines)
+        self.assertIn('# TYPE filmy_stage_duration_seconds histogram', lines)
+
+        labels = 'endpoint="movie-list",method="GET",status="200"'
+        buckets = [line for line in lines if line.startswith(f'filmy_request_duration_seconds_bucket{{{labels},')]
+        self.assertEqual(len(buckets), len(timing.BUCKETS) + 1)
+        self.assertTrue(buckets[-1].startswith(f'filmy_request_duration_seconds_bucket{{{labels},le="+Inf"}} '))
+        cumulative = [int(line.rsplit(' ', 1)[1]) for line in buckets]
+        self.assertEqual(cumulative, sorted(cumulative))
+        self.assertIn(f'filmy_request_duration_seconds_count{{{labels}}} {cumulative[-1]}', lines)
+        self.assertRegex('\n'.join(lines), rf'filmy_request_duration_seconds_sum{{{labels}}} \d+\.\d{{6}}')
+
+    def test_each_request_is_profiled_once(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with mock.patch.multiple(timing, PROFILE_SLOW_REQUESTS_MS=0, PROFILE_SAMPLE_RATE=1.0, PROFILE_DIR=directory.name):
+            # Sync middleware (WSGI), then async middleware (ASGI) with the view in the executor
+            self.client.get('/api/movies/aggregate/', {'x': 'runtime'})
+            self.assertEqual(len(os.listdir(directory.name)), 1)
+            async_to_sync(AsyncClient().get)('/api/movies/aggregate/', {'x': 'runtime'})
+            self.assertEqual(len(os.listdir(directory.name)), 2)
+
+
+class BrokenExecutor:
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("A child process terminated abruptly")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class LocalJobBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = jobs.LocalJobBackend(max_workers=1, max_pending=2, max_finished=4)
+
+    def test_broken_pool_fails_the_job_and_is_replaced(self):
+        broken = self.backend._executor = BrokenExecutor()
+        job = self.backend.submit('kmeans', {'k': 3}, 'key')
+        self.assertEqual(job.status, jobs.FAILED)
+        self.assertEqual(self.backend._in_flight, {})
+        self.assertIsNone(self.backend._executor)
+
+        # The same request gets a new job, not the dead one
+        self.backend._executor = broken
+        self.assertNotEqual(self.backend.submit('kmeans', {'k': 3}, 'key').id, job.id)
+
+    def test_failing_on_result_still_finishes_the_job(self):
+        job = jobs.Job('kmeans', {'k': 3}, 'key')
+        self.backend._in_flight['key'] = job.id
+        future = Future()
+        future.set_result('result')
+
+        def on_result(result):
+            raise ConnectionError("cache is down")
+
+        with self.assertLogs('main.jobs', 'ERROR'):
+            self.backend._complete(job, None, future, on_result)
+        self.assertEqual((job.status, job.result), (jobs.FINISHED, 'result'))
+        self.assertEqual(self.backend._in_flight, {})
+
+    def test_late_progress_leaves_a_done_job_alone(self):
+        done = Future()
+        done.set_result('result')
+        failed = Future()
+        failed.set_exception(ValueError("bad params"))
+        for future, status in ((done, jobs.FINISHED), (failed, jobs.FAILED)):
+            with self.subTest(status=status):
+                job = jobs.Job('kmeans', {'k': 3}, 'key')
+                self.backend._remember(job)
+                # The listener checks the status under the lock, so the job must change under it too
+                locked = []
+                for name in ('finish', 'fail'):
+                    method = getattr(job, name)
+                    setattr(job, name, lambda *args, method=method: locked.append(self.backend._lock.locked()) or method(*args))
+                self.backend._complete(job, None, future, None)
+                self.assertEqual(locked, [True])
+
+                progress = mock.Mock()
+                progress.get.side_effect = [(job.id, 'fit', 0.5), EOFError]
+                self.backend._listen(progress)
+                self.assertEqual((job.status, job.stage), (status, None))
+
+
+class SegmentStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.base_path = os.path.join(directory.name, 'movies.csv')
+        self.movies = make_movies(90)
+        self.movies.iloc[:50].to_csv(self.base_path, index=False)
+        self.store = SegmentStore(self.base_path)
+
+    def test_append_and_compact_round_trip(self):
+        self.store.append(self.movies.iloc[50:70])
+        # Columns in another order are written in the order of the base
+        self.store.append(self.movies.iloc[70:][self.movies.columns[::-1]])
+        self.assertEqual(len(self.store.read_manifest()['segments']), 2)
+        pd.testing.assert_frame_equal(self.store.read(), pd.read_csv(self._csv(self.movies)))
+
+        with open(self.base_path, 'rb') as file:
+            base = file.read()
+        manifest = self.store.compact()
+        self.assertEqual(manifest['segments'], [])
+        self.assertEqual(self.store.files(), [os.path.join(self.store.directory, manifest['base'])])
+        pd.testing.assert_frame_equal(self.store.read(), pd.read_csv(self._csv(self.movies)))
+        # The original CSV is never written to
+        with open(self.base_path, 'rb') as file:
+            self.assertEqual(file.read(), base)
+        self.assertEqual(sorted(os.listdir(self.store.directory)), sorted(['.lock', 'manifest.json', manifest['base']]))
+
+    def test_version_changes_with_every_write(self):
+        versions = [self.store.version()]
+        self.store.append(self.movies.iloc[50:])
+        versions.append(self.store.version())
+        self.store.compact()
+        versions.append(self.store.version())
+        self.assertEqual(len(set(versions)), 3)
+
+    def _csv(self, df):
+        path = self.base_path + '.expected'
+        df.to_csv(path, index=False)
+        return path
+
+
+class DatasetStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.csv_path = os.path.join(directory.name, 'movies.csv')
+        self.snapshot_path = os.path.join(directory.name, 'movies.snapshot')
+        self.movies = make_movies(90)
+        self.write_csv(self.movies.iloc[:50], 1_000_000_000)
+
+    def write_csv(self, df, mtime):
+        df.to_csv(self.csv_path, index=False)
+        os.utime(self.csv_path, ns=(mtime, mtime))
+
+    def read_csv_calls(self):
+        return mock.patch.object(dataset_module.pd, 'read_csv', wraps=pd.read_csv)
+
+    def test_csv_change_loads_a_new_dataset(self):
+        store = dataset_module.DatasetStore(self.csv_path)
+        dataset = store.get()
+        self.assertEqual(len(dataset), 50)
+        self.assertIs(store.get(), dataset)
+        self.assertIs(store.current(), dataset)
+
+        self.write_csv(self.movies.iloc[:60], 2_000_000_000)
+        self.assertIsNone(store.current())
+        reloaded = store.get()
+        self.assertEqual(len(reloaded), 60)
+        self.assertNotEqual(reloaded.fingerprint, dataset.fingerprint)
+        self.assertIs(store.current(), reloaded)
+
+    def test_appended_segment_loads_a_new_dataset(self):
+        store = dataset_module.DatasetStore(self.csv_path)
+        dataset = store.get()
+        SegmentStore(self.csv_path).append(self.movies.iloc[50:])
+        reloaded = store.get()
+        self.assertIsNot(reloaded, dataset)
+        self.assertNotEqual(reloaded.fingerprint, dataset.fingerprint)
+        self.assertEqual(reloaded.df['id'].tolist(), self.movies['id'].tolist())
+
+    def test_missing_csv_gives_no_dataset(self):
+        os.remove(self.csv_path)
+        self.assertIsNone(dataset_module.DatasetStore(self.csv_path).get())
+
+    def test_snapshot_of_the_current_csv_replaces_parsing(self):
+        build_snapshot(self.csv_path, self.snapshot_path)
+        store = dataset_module.DatasetStore(self.csv_path, snapshot_path=self.snapshot_path)
+        with self.read_csv_calls() as read_csv:
+            df = store.get().df
+        read_csv.assert_not_called()
+        pd.testing.assert_frame_equal(df, clean_dataframe(pd.read_csv(self.csv_path)))
+
+    def test_stale_or_foreign_snapshot_falls_back_to_the_csv(self):
+        build_snapshot(self.csv_path, self.snapshot_path)
+        self.write_csv(self.movies.iloc[:60], 2_000_000_000)
+        self.assertIsNone(load_snapshot(self.snapshot_path, source_version=file_version(self.csv_path)))
+        store = dataset_module.DatasetStore(self.csv_path, snapshot_path=self.snapshot_path)
+        with self.read_csv_calls() as read_csv:
+            self.assertEqual(len(store.get()), 60)
+        read_csv.assert_called_once()
+
+        build_snapshot(self.csv_path, self.snapshot_path)
+        with open(self.snapshot_path, 'r+b') as file:
+            file.write(b'NOTSNAP!')
+        self.assertIsNone(load_snapshot(self.snapshot_path))
+        with self.read_csv_calls() as read_csv:
+            self.assertEqual(len(dataset_module.DatasetStore(self.csv_path, snapshot_path=self.snapshot_path).get()), 60)
+        read_csv.assert_called_once()
+
+
+class AggregateTests(SimpleTestCase):
+    def setUp(self):
+        self.dataset = make_dataset(1000)
+        self.filters = parse_filters([{'column': 'vote_count', 'operator': 'gte', 'value': 50}])
+        self.df = self.dataset.df[self.dataset.df['vote_count'] >= 50]
+
+    def aggregate(self, **params):
+        return aggregate(self.dataset, self.filters, parse_aggregate_params(params))
+
+    def assert_groups_match(self, groups, expected):
+        self.assertEqual([group['key'] for group in groups], list(expected.index))
+        for group in groups:
+            row = expected.loc[group['key']]
+            with self.subTest(key=group['key']):
+                self.assertEqual(group['count'], row['count'])
+                for stat in ('mean', 'median', 'min', 'max', 'p10', 'p90'):
+                    if np.isnan(row[stat]):
+                        self.assertIsNone(group[stat])
+                    else:
+                        np.testing.assert_allclose(group[stat], row[stat], rtol=1e-9)
+
+    @staticmethod
+    def pandas_stats(df, key, column):
+        grouped = df.groupby(key)
+        return pd.DataFrame({
+            'count': grouped.size(),
+            'mean': grouped[column].mean(),
+            'median': grouped[column].median(),
+            'min': grouped[column].min(),
+            'max': grouped[column].max(),
+            'p10': grouped[column].quantile(0.1),
+            'p90': grouped[column].quantile(0.9),
+        })
+
+    def test_groupby_genre_matches_pandas(self):
+        exploded = self.df.assign(genre=self.df['genres'].map(split_genres)).explode('genre').dropna(subset=['genre'])
+        result = self.aggregate(by='genre', column='runtime', percentiles='10,90')
+        self.assertEqual(result['total_count'], len(self.df))
+        self.assert_groups_match(result['groups'], self.pandas_stats(exploded, 'genre', 'runtime'))
+
+    def test_groupby_year_matches_pandas(self):
+        years = pd.to_numeric(self.df['release_date'].str[:4], errors='coerce')
+        by_year = self.df.assign(year=years).dropna(subset=['year']).astype({'year': int})
+        result = self.aggregate(by='year', column='budget', percentiles='10,90')
+        self.assert_groups_match(result['groups'], self.pandas_stats(by_year, 'year', 'budget'))
+
+    def test_histograms_match_numpy(self):
+        result = self.aggregate(kind='histogram', column='popularity', bins='12')
+        values = self.df['popularity'].dropna()
+        full = self.dataset.df['popularity']
+        counts, edges = np.histogram(values, bins=12, range=(full.min(), full.max()))
+        self.assertEqual(result['counts'], counts.tolist())
+        np.testing.assert_allclose(result['edges'], edges)
+
+        result = self.aggregate(kind='histogram2d', x='vote_average', y='runtime', bins='4,6', y_range='80,120')
+        known = self.df.dropna(subset=['vote_average', 'runtime'])
+        votes = self.dataset.df['vote_average']
+        counts, _, _ = np.histogram2d(known['vote_average'], known['runtime'], bins=[4, 6],
+                                      range=[(votes.min(), votes.max()), (80, 120)])
+        self.assertEqual(result['counts'], counts.astype(int).tolist())
+        self.assertEqual(result['missing'], len(self.df) - len(known))
+        self.assertEqual(result['outside'], len(known) - int(counts.sum()))
+
+    def test_bad_ranges_and_percentiles_raise_value_error(self):
+        for params in ({'kind': 'histogram', 'column': 'runtime', 'range': 'inf,100'},
+                       {'kind': 'histogram', 'column': 'runtime', 'range': '0,nan'},
+                       {'kind': 'histogram', 'column': 'runtime', 'range': '10'},
+                       {'kind': 'histogram', 'column': 'runtime', 'range': '1,2,3'},
+                       {'kind': 'histogram', 'column': 'runtime', 'range': '5,1'},
+                       {'kind': 'histogram2d', 'x': 'runtime', 'y': 'budget', 'y_range': '0,-inf'},
+                       {'by': 'genre', 'column': 'runtime', 'percentiles': 'nan'},
+                       {'by': 'genre', 'column': 'runtime', 'percentiles': '50,abc'}):
+            with self.subTest(params=params), self.assertRaises(ValueError):
+                parse_aggregate_params(params)
+
+    def test_bad_bins_get_a_clean_message(self):
+        for params in ({'kind': 'histogram', 'column': 'runtime', 'bins': 'many'},
+                       {'kind': 'histogram', 'column': 'runtime', 'bins': '2.5'},
+                       {'kind': 'histogram', 'column': 'runtime', 'bins': '0'},
+                       {'kind': 'histogram2d', 'x': 'runtime', 'y': 'budget', 'bins': '4,'}):
+            with self.subTest(params=params), self.assertRaisesMessage(ValueError, "bins must be an integer between 1 and"):
+                parse_aggregate_params(params)
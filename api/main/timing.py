@@ -0,0 +1,182 @@
+"""Per-request stage timings, their histograms and an opt-in profiler.
+
+Code marks a stage with ``with span('fit'):`` (or ``@timed('fit')``). Inside
+a request handled by ``ServerTimingMiddleware`` the durations are added up
+per stage name; outside of one a span costs a context variable lookup. The
+middleware sends them as a ``Server-Timing`` header and records them in the
+histograms behind ``GET /api/metrics`` (Prometheus text format). The
+histograms live in each worker process, so every worker reports its own.
+
+With ``PROFILE_SLOW_REQUESTS_MS`` set, a ``PROFILE_SAMPLE_RATE`` share of the
+requests runs under cProfile and the profile of those slower than the
+threshold is written to ``PROFILE_DIR``. Each request is profiled in one
+place only, a second profiler would fail to start on Python 3.12+: under
+WSGI the middleware profiles the whole request, under ASGI it cannot profile
+the event loop shared by all requests, so the work handed to the executor
+is profiled instead (``asyncviews.py``).
+"""
+import bisect
+import contextvars
+import functools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PROFILE_SLOW_REQUESTS_MS = getattr(settings, 'PROFILE_SLOW_REQUESTS_MS', None)
+PROFILE_SAMPLE_RATE = getattr(settings, 'PROFILE_SAMPLE_RATE', 1.0)
+PROFILE_DIR = getattr(settings, 'PROFILE_DIR', None)
+
+_timings = contextvars.ContextVar('timings', default=None)
+# Set by the middleware in async mode, where the executor profiles the request instead of it
+_profile_offloaded = contextvars.ContextVar('profile_offloaded', default=False)
+
+
+class Timings:
+    """Stage durations of one request in milliseconds, in the order the stages first ran."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, ms):
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+
+
+@contextmanager
+def collect():
+    """Collect the spans of the enclosed code, yields the ``Timings``."""
+    timings = Timings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+@contextmanager
+def profile_offloaded():
+    """Let ``run_profiled(..., offloaded=True)`` profile the enclosed request."""
+    token = _profile_offloaded.set(True)
+    try:
+        yield
+    finally:
+        _profile_offloaded.reset(token)
+
+
+@contextmanager
+def span(name):
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (time.perf_counter() - started) * 1000)
+
+
+def timed(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing(timings, total_ms):
+    parts = [f'{name};dur={ms:.3f}' for name, ms in timings.stages.items()]
+    parts.append(f'total;dur={total_ms:.3f}')
+    return ', '.join(parts)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+
+class Metrics:
+    """Histograms of request and stage durations, labelled by endpoint (URL name)."""
+
+    def __init__(self):
+        self.requests = {}
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, method, status, total_ms, timings):
+        with self._lock:
+            self.requests.setdefault((endpoint, method, str(status)), Histogram()).observe(total_ms / 1000)
+            for stage, ms in timings.stages.items():
+                self.stages.setdefault((endpoint, stage), Histogram()).observe(ms / 1000)
+
+    def render(self):
+        """All histograms in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            self._render(lines, 'filmy_request_duration_seconds', "Duration of API requests.",
+                         ('endpoint', 'method', 'status'), self.requests)
+            self._render(lines, 'filmy_stage_duration_seconds', "Duration of the stages of API requests.",
+                         ('endpoint', 'stage'), self.stages)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render(lines, name, help_text, label_names, histograms):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for key, histogram in sorted(histograms.items()):
+            labels = ','.join(f'{label}="{_escape(value)}"' for label, value in zip(label_names, key))
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{{{labels}}} {cumulative}')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
+
+
+def run_profiled(function, offloaded=False):
+    """``(result, profile)`` of ``function()``, run under cProfile for the sampled share of calls, else profile is None.
+
+    ``offloaded`` calls are only profiled inside ``profile_offloaded``.
+    """
+    if PROFILE_SLOW_REQUESTS_MS is None or (offloaded and not _profile_offloaded.get()):
+        return function(), None
+    if random.random() >= PROFILE_SAMPLE_RATE:
+        return function(), None
+    import cProfile
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        return function(), profile
+    finally:
+        profile.disable()
+
+
+def save_profile(profile, endpoint, total_ms):
+    """Write ``profile`` to PROFILE_DIR when the request took at least PROFILE_SLOW_REQUESTS_MS."""
+    if total_ms < PROFILE_SLOW_REQUESTS_MS:
+        return None
+    directory = PROFILE_DIR or os.path.join(settings.BASE_DIR, 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{time.strftime("%Y%m%d-%H%M%S")}-{endpoint}-{int(total_ms)}ms-{os.getpid()}.prof')
+    profile.dump_stats(path)
+    return path
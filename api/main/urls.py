@@ -1,11 +1,29 @@
-from django.urls import path
-from . import views
-
-urlpatterns = [
-    #path("", views.index, name="index"),
-    path('movies/', views.MovieListView.as_view(), name='movie-list'),
-    path('eda_file', views.EDAFileView.as_view(), name='eda_file'),
-    path('clustering/kmeans/', views.KMeansClusteringView.as_view(), name='kmeans_clustering'),
-    path('clustering/predict/', views.ClusterPredictionView.as_view(), name='cluster_predict'),
-    path('clustering/dbscan/', views.DBScanClusteringView.as_view(), name='dbscan_clustering')
-]
\ No newline at end of file
+from django.urls import path
+from . import views
+from .asyncviews import async_view
+from .query import movie_index_missing
+
+
+def api_path(route, view, name, offload=True):
+    """``path`` to the async version of a view, see asyncviews.py; ``offload=False`` serves it on the event loop."""
+    return path(route, async_view(view.as_view(), name, offload), name=name)
+
+
+urlpatterns = [
+    #path("", views.index, name="index"),
+    api_path('movies/', views.MovieListView, 'movie-list', offload=movie_index_missing),
+    api_path('movies/autocomplete/', views.MovieAutocompleteView, 'movie_autocomplete',
+             offload=movie_index_missing),
+    api_path('movies/aggregate/', views.MovieAggregateView, 'movie_aggregate'),
+    api_path('movies/export/', views.MovieExportView, 'movie_export'),
+    api_path('movies/similar/', views.SimilarMoviesView, 'similar_movies'),
+    api_path('metrics', views.MetricsView, 'metrics', offload=False),
+    api_path('eda_file', views.EDAFileView, 'eda_file', offload=False),
+    api_path('clustering/kmeans/', views.KMeansClusteringView, 'kmeans_clustering'),
+    api_path('clustering/kmeans/sweep/', views.KMeansSweepView, 'kmeans_sweep'),
+    api_path('clustering/predict/', views.ClusterPredictionView, 'cluster_predict'),
+    api_path('clustering/predict/batch/', views.ClusterPredictionBatchView, 'cluster_predict_batch'),
+    api_path('clustering/dbscan/', views.DBScanClusteringView, 'dbscan_clustering'),
+    api_path('clustering/jobs/<str:job_id>/', views.ClusteringJobView, 'clustering_job', offload=False),
+    api_path('clustering/jobs/<str:job_id>/result/', views.ClusteringJobResultView, 'clustering_job_result'),
+]
@@ -1,126 +1,105 @@
 import json
 import mimetypes
-from django.http import Http404, FileResponse
+import math
+from django.conf import settings
+from django.http import Http404, FileResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.urls import reverse
 from rest_framework import permissions
 from rest_framework.views import APIView
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-import pandas as pd
 import os
 from rest_framework import status
-from sklearn.decomposition import PCA
+from .aggregate import aggregate, parse_aggregate_params
+from .cache import clustering_cache, make_key
+from . import jobs
+from .clustering import ClusteringError, dbscan_clustering, kmeans_clustering, parse_dbscan_params, parse_kmeans_params
+from .dataset import get_dataset, PROJECT_ROOT
+from .export import EXPORT_RENDERERS, STREAMS, cluster_labels
+from .parsers import NDJSONParser
+from .prediction import DEFAULT_GENRE, ModelNotFound, parse_movie_features, pipeline_store
+from .renderers import CLUSTERING_RENDERERS, encode_result
+from .query import COLUMN_TYPES, FilterError, decode_cursor, encode_cursor, get_movie_index, parse_filters, parse_sort
 from .serializers import MovieSerializer
-from pathlib import Path
+from .similar import MAX_SIMILAR_COUNT, SIMILAR_COUNT, get_similar_movies
+from .sweep import kmeans_sweep, parse_sweep_params
+from .timing import metrics, timed
 import numpy as np
-from sklearn.cluster import KMeans, DBSCAN
-from sklearn.preprocessing import StandardScaler
-from sklearn.impute import SimpleImputer
-from sklearn.preprocessing import MinMaxScaler
-import pickle
-
-BASE_DIR = Path(__file__).resolve().parent.parent
-PROJECT_ROOT = BASE_DIR.parent
-CSV_FILENAME = 'tmdb_movie_data.csv'
-DATA_FILE_PATH = os.path.join(PROJECT_ROOT, CSV_FILENAME)
+
 EDA_FILE_PATH = os.path.join(PROJECT_ROOT, 'eda.ipynb')
-MODEL_KMEANS_FILENAME = 'kmeans_pipeline.pkl'
-MODEL_KMEANS_PATH = os.path.join(PROJECT_ROOT, MODEL_KMEANS_FILENAME)
 
 
-def get_dataframe():
+def _none_for_nan(record):
+    return {key: None if isinstance(value, float) and math.isnan(value) else value for key, value in record.items()}
+
+
+@timed('records')
+def _movie_records(dataset, positions):
+    return [_none_for_nan(movie) for movie in dataset.df.take(positions).to_dict('records')]
+
+def _filters(request):
+    """``(filters, error)`` from the JSON ``?filters=`` of the movie list (see ``query.py``)."""
+    try:
+        filters = json.loads(request.query_params.get('filters', '[]'))
+        if not isinstance(filters, list):
+            raise ValueError()
+    except (json.JSONDecodeError, ValueError):
+        return None, Response({"detail": "Invalid filter format. Expected JSON."}, status=status.HTTP_400_BAD_REQUEST)
     try:
-        df = pd.read_csv(DATA_FILE_PATH)
-    except FileNotFoundError:
-        return None
+        return parse_filters(filters), None
+    except FilterError as e:
+        return None, Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Replace 0 in budget/revenue/runtime for NaN
-    df[['budget', 'revenue', 'runtime']] = df[['budget', 'revenue', 'runtime']].replace(0, np.nan)
-    return df
 
 def index(request):
     return render(request, 'index.html')
 
 
 class MovieListView(APIView):
-    try:
-        df_global = pd.read_csv(DATA_FILE_PATH)
-    except FileNotFoundError:
-        df_global = None
-
-    COLUMN_TYPES = {
-        'id': 'numeric',
-        'title': 'string',
-        'release_date': 'string',
-        'vote_average': 'numeric',
-        'vote_count': 'numeric',
-        'popularity': 'numeric',
-        'budget': 'numeric',
-        'revenue': 'numeric',
-        'runtime': 'numeric',
-        'genres': 'string',
-        'spoken_languages': 'string',
-    }
+    COLUMN_TYPES = COLUMN_TYPES
+    # Served on the event loop under ASGI (asyncviews.py), must not touch the database
+    authentication_classes = ()
 
     def get(self, request):
-        if self.df_global is None:
+        dataset = get_dataset()
+        if dataset is None:
             return Response({"detail": "CSV not found."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        df = self.df_global.copy()
-        filters_json = request.query_params.get('filters', '[]')
+        filters, error = _filters(request)
+        if error is not None:
+            return error
 
         try:
-            filters = json.loads(filters_json)
-            if not isinstance(filters, list):
+            limit = int(request.query_params.get('limit', 20))
+            page = int(request.query_params.get('page', 1))
+            if limit < 1 or page < 1:
                 raise ValueError()
-        except (json.JSONDecodeError, ValueError):
-            return Response({"detail": "Invalid filter format. Expected JSON."}, status=status.HTTP_400_BAD_REQUEST)
-
-        for f in filters:
-            column = f.get('column')
-            operator = f.get('operator')
-            value = f.get('value')
+        except ValueError:
+            return Response({"detail": "page and limit must be positive integers."}, status=status.HTTP_400_BAD_REQUEST)
 
-            if not all([column, operator, value is not None]) or column not in self.COLUMN_TYPES:
-                continue
+        index = get_movie_index(dataset)
 
-            col_type = self.COLUMN_TYPES.get(column)
+        # Keyset pagination: ?cursor= (empty for the first page), ordered by ?sort= (id by default)
+        if 'cursor' in request.query_params:
+            return self.get_keyset_page(request, dataset, index, filters, limit)
 
+        sort = request.query_params.get('sort')
+        if sort:
             try:
-                if col_type == 'string':
-                    col_data = df[column].astype(str)
-                    if operator == 'contains':
-                        df = df[col_data.str.contains(str(value), case=False, na=False)]
-                    elif operator == 'eq':
-                        df = df[col_data == str(value)]
-
-                elif col_type == 'numeric':
-                    numeric_col = pd.to_numeric(df[column], errors='coerce')
-                    num_value = float(value)
-
-                    if operator == 'gte':
-                        df = df[numeric_col >= num_value]
-                    elif operator == 'lte':
-                        df = df[numeric_col <= num_value]
-                    elif operator == 'eq':
-                        df = df[numeric_col == num_value]
-                    elif operator == 'gt':
-                        df = df[numeric_col > num_value]
-                    elif operator == 'lt':
-                        df = df[numeric_col < num_value]
-
-            except (ValueError, TypeError, Exception) as e:
-                print(f"Error while loading filter: {e}")
-                pass
-
-        total_movies = len(df)
-        movies = df.to_dict('records')
-
-        page = int(request.query_params.get('page', 1))
-        limit = int(request.query_params.get('limit', 20))
+                order = index.sort_order(parse_sort(sort))
+            except FilterError as e:
+                return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            positions = order.ordered(index.filter(filters))
+        else:
+            positions = index.positions(filters)
+        total_movies = len(positions)
         start_index = (page - 1) * limit
         end_index = page * limit
 
-        paginated_movies = movies[start_index:end_index]
+        # Only the rows of the requested page are turned into records
+        paginated_movies = _movie_records(dataset, positions[start_index:end_index])
 
         serializer = MovieSerializer(paginated_movies, many=True)
         response_data = {
@@ -133,9 +112,205 @@ class MovieListView(APIView):
 
         return Response(response_data, status=status.HTTP_200_OK)
 
+    def get_keyset_page(self, request, dataset, index, filters, limit):
+        sort = request.query_params.get('sort') or 'id'
+        cursor = request.query_params.get('cursor')
+        try:
+            order = index.sort_order(parse_sort(sort))
+            start = order.seek(decode_cursor(cursor, sort)) if cursor else 0
+        except (FilterError, TypeError, ValueError) as e:
+            return Response({"detail": str(e) or "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+        bitmap = index.filter(filters)
+        rows, has_next = order.scan(bitmap, start, limit)
+
+        serializer = MovieSerializer(_movie_records(dataset, rows), many=True)
+        response_data = {
+            "total_count": int(np.count_nonzero(bitmap)),
+            "limit": limit,
+            "sort": sort,
+            "next": has_next,
+            "next_cursor": encode_cursor(sort, order.cursor(rows[-1])) if has_next else None,
+            "results": serializer.data
+        }
+
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
+class MovieExportView(APIView):
+    """All movies matching ``?filters=`` (optionally ``?sort=``), streamed as CSV, NDJSON or Parquet.
+
+    ``?clusters=kmeans`` or ``?clusters=dbscan`` adds a ``cluster`` column, the
+    remaining query parameters are those of the clustering endpoint.
+    """
+    permission_classes = (permissions.AllowAny,)
+    renderer_classes = EXPORT_RENDERERS
+    CLUSTER_PARAMS = {'kmeans': parse_kmeans_params, 'dbscan': parse_dbscan_params}
+
+    def get(self, request):
+        dataset = get_dataset()
+        if dataset is None:
+            return Response({"detail": "CSV not found."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        filters, error = _filters(request)
+        if error is not None:
+            return error
+
+        index = get_movie_index(dataset)
+        sort = request.query_params.get('sort')
+        try:
+            positions = index.sort_order(parse_sort(sort)).ordered(index.filter(filters)) if sort \
+                else index.positions(filters)
+        except FilterError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        labels = None
+        kind = request.query_params.get('clusters')
+        if kind:
+            if kind not in self.CLUSTER_PARAMS:
+                return Response({"detail": "clusters must be kmeans or dbscan."}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                params = self.CLUSTER_PARAMS[kind](request.query_params)
+            except ValueError as e:
+                return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                labels = cluster_labels(dataset, kind, params)
+            except ClusteringError as e:
+                return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        encoding = _encoding(request)
+        response = StreamingHttpResponse(
+            STREAMS[encoding](dataset, positions, labels),
+            content_type=request.accepted_renderer.media_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="movies.{encoding}"'
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if isinstance(response, Response):
+            # Errors, including a 406 for an unknown format, are JSON whatever format was asked for
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = JSONRenderer.media_type
+        return response
+
+
+class MovieAggregateView(APIView):
+    """Group-by statistics and histograms of the movies matching ``?filters=`` (see ``aggregate.py``)."""
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request):
+        dataset = get_dataset()
+        if dataset is None:
+            return Response({"detail": "CSV not found."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        filters, error = _filters(request)
+        if error is not None:
+            return error
+
+        try:
+            params = parse_aggregate_params(request.query_params)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        cache_key = make_key('aggregate', {**params, 'filters': filters}, dataset.fingerprint)
+        body = clustering_cache.get(cache_key)
+        if body is None:
+            body = json.dumps(aggregate(dataset, filters, params), separators=(',', ':')).encode('utf-8')
+            clustering_cache.set(cache_key, body)
+
+        return HttpResponse(body, content_type='application/json', status=status.HTTP_200_OK)
+
+
+class MovieAutocompleteView(APIView):
+    """Titles matching ``?q=`` for the title filter, ranked by ``MovieIndex.autocomplete``."""
+    permission_classes = (permissions.AllowAny,)
+    authentication_classes = ()
+
+    FIELDS = ('id', 'title', 'release_date', 'vote_average', 'popularity')
+    MAX_COUNT = 50
+
+    def get(self, request):
+        dataset = get_dataset()
+        if dataset is None:
+            return Response({"detail": "CSV not found."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        query = request.query_params.get('q', '').strip()
+        try:
+            count = int(request.query_params.get('n', 10))
+            if not 1 <= count <= self.MAX_COUNT:
+                raise ValueError()
+        except ValueError:
+            return Response({"detail": f"n must be an integer between 1 and {self.MAX_COUNT}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = get_movie_index(dataset).autocomplete(query, count) if query else []
+        results = [{field: movie[field] for field in self.FIELDS} for movie in _movie_records(dataset, rows)]
+        return Response({"query": query, "results": results}, status=status.HTTP_200_OK)
+
+
+class SimilarMoviesView(APIView):
+    """Nearest movies to ``id`` or to a feature row, optionally only those with a ``genre``/``language`` (see ``similar.py``).
+
+    GET takes the parameters from the query string, POST also from a JSON body.
+    """
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request):
+        return self.similar(request, request.query_params.dict())
+
+    def post(self, request):
+        return self.similar(request, _request_params(request))
+
+    def similar(self, request, params):
+        dataset = get_dataset()
+        if dataset is None:
+            return Response({"detail": "CSV not found."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        try:
+            count = int(params.get('n', SIMILAR_COUNT))
+            if not 1 <= count <= MAX_SIMILAR_COUNT:
+                raise ValueError()
+        except (TypeError, ValueError):
+            return Response({"detail": f"n must be an integer between 1 and {MAX_SIMILAR_COUNT}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            similar = get_similar_movies(dataset)
+        except ModelNotFound as e:
+            return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        movie_id = None
+        if params.get('id') not in (None, ''):
+            try:
+                movie_id = int(params['id'])
+            except (TypeError, ValueError):
+                return Response({"detail": "id must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+            row = similar.row(movie_id)
+            if row is None:
+                raise Http404("Movie doesn't exist.")
+            point = similar.X[row]
+        else:
+            try:
+                point = similar.point(parse_movie_features(params))
+            except (TypeError, ValueError, AttributeError):
+                return Response({"detail": "Expected a movie id or numeric movie features."}, status=status.HTTP_400_BAD_REQUEST)
+
+        mask = None
+        for param, column in (('genre', 'genres'), ('language', 'spoken_languages')):
+            if params.get(param):
+                column_mask = similar.mask(column, str(params[param]))
+                mask = column_mask if mask is None else mask & column_mask
+
+        rows, distances = similar.nearest(point, count, mask, exclude_id=movie_id)
+        results = [
+            {**movie, "distance": float(distance)}
+            for movie, distance in zip(_movie_records(dataset, rows), distances)
+        ]
+        return Response({"id": movie_id, "count": len(results), "results": results}, status=status.HTTP_200_OK)
+
 
 class EDAFileView(APIView):
     permission_classes = (permissions.AllowAny,)
+    authentication_classes = ()
 
     def get(self, request):
         if not os.path.exists(EDA_FILE_PATH):
@@ -157,237 +332,286 @@ class EDAFileView(APIView):
             raise Http404("Error while downloading file")
 
 
-class KMeansClusteringView(APIView):
+class MetricsView(APIView):
+    """Request and stage duration histograms of this worker in the Prometheus text format (see ``timing.py``)."""
     permission_classes = (permissions.AllowAny,)
+    authentication_classes = ()
 
     def get(self, request):
-        df = get_dataframe()
-        if df is None:
-            return Response(
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _request_params(request):
+    """Query parameters overlaid with the fields of a JSON or form body."""
+    params = request.query_params.dict()
+    data = request.data
+    if hasattr(data, 'dict'):
+        data = data.dict()
+    if isinstance(data, dict):
+        params.update(data)
+    return params
+
+
+def _encoding(request):
+    """Encoding picked by content negotiation: json, columnar or msgpack (see ``renderers.py``)."""
+    return request.accepted_renderer.format
+
+
+def _labels_only(request):
+    """``?labels_only=1``: only the cluster labels instead of the movies and PCA data (see ``renderers.py``)."""
+    return request.query_params.get('labels_only', '').lower() in ('1', 'true', 'yes')
+
+
+def _encoded_response(request, body):
+    return HttpResponse(body, content_type=request.accepted_renderer.media_type, status=status.HTTP_200_OK)
+
+
+def _submit_clustering_job(request, dataset, kind, params, on_result=None):
+    try:
+        job = jobs.backend.submit(kind, params, make_key(kind, params, dataset.fingerprint), on_result=on_result)
+    except jobs.JobQueueFull as e:
+        return Response({"detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    return Response(_job_data(request, job), status=status.HTTP_202_ACCEPTED)
+
+
+def _job_data(request, job):
+    return {
+        **job.as_dict(),
+        "status_url": request.build_absolute_uri(reverse('clustering_job', args=[job.id])),
+        "result_url": request.build_absolute_uri(reverse('clustering_job_result', args=[job.id])),
+    }
+
+
+class KMeansClusteringView(APIView):
+    permission_classes = (permissions.AllowAny,)
+    renderer_classes = CLUSTERING_RENDERERS
+
+    def get_params(self, request, params):
+        dataset = get_dataset()
+        if dataset is None:
+            return None, None, Response(
                 {"detail": "CSV file was not found"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-        # Parameter K
         try:
-            n_clusters = int(request.query_params.get('k', 5))
-            if n_clusters < 2:
-                raise ValueError("k must be at least 2")
+            params = parse_kmeans_params(params)
         except ValueError as e:
-            return Response(
+            return None, None, Response(
                 {"detail": str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        features_query = request.query_params.get('features')
-        if features_query:
-            numeric_features = [f.strip() for f in features_query.split(',') if f.strip()]
-        else:  # Default features
-            numeric_features = ['vote_average', 'vote_count', 'popularity', 'budget', 'revenue', 'runtime']
-
-        # Data preparation
-        X = df[numeric_features].copy()
+        return dataset, params, None
 
-        try:
-            # Preprocessing
-            imputer = SimpleImputer(strategy='median')
-            X_imputed = imputer.fit_transform(X)
+    def get(self, request):
+        dataset, params, error = self.get_params(request, request.query_params)
+        if error is not None:
+            return error
+
+        # K-Means is seeded, so the same parameters on the same data always give the same response
+        encoding = _encoding(request)
+        labels_only = _labels_only(request)
+        cache_key = make_key('kmeans', {**params, 'encoding': encoding, 'labels_only': labels_only}, dataset.fingerprint)
+        body = clustering_cache.get(cache_key)
+        if body is None:
+            try:
+                result = kmeans_clustering(dataset, params['k'], params['features'], params['tf'])
+            except ClusteringError as e:
+                return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            body = encode_result(result, encoding, labels_only)
+            clustering_cache.set(cache_key, body)
 
-            if request.query_params.get('tf') == "standardScaler":
-                scaler = StandardScaler()  # MinMaxScaler or StandardScaler
-            elif request.query_params.get('tf') == "minMaxScaler":
-                scaler = MinMaxScaler()
-            X_scaled = scaler.fit_transform(X_imputed)
+        return _encoded_response(request, body)
 
-            # K-Means
-            kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-            clusters = kmeans.fit_predict(X_scaled)
+    def post(self, request):
+        """Run the clustering as a background job, see ``ClusteringJobView``."""
+        dataset, params, error = self.get_params(request, _request_params(request))
+        if error is not None:
+            return error
 
-            df['cluster'] = clusters
+        cache_key = make_key('kmeans', {**params, 'encoding': 'json', 'labels_only': False}, dataset.fingerprint)
+        return _submit_clustering_job(
+            request, dataset, 'kmeans', params,
+            on_result=lambda result: clustering_cache.set(cache_key, encode_result(result, 'json')),
+        )
 
-            # Reduction dimension pro visualisation
-            pca = PCA(n_components=2)
-            principal_components = pca.fit_transform(X_scaled)
 
-        except Exception as e:
-            return Response({"detail": f"Error while K-Means or PCA: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+class KMeansSweepView(APIView):
+    """Inertia, silhouette and Davies-Bouldin for every k in ``k_min..k_max`` (see ``sweep.py``)."""
+    permission_classes = (permissions.AllowAny,)
 
-        # Summary
-        cluster_summary = df.groupby('cluster')[numeric_features].agg(['count', 'mean']).reset_index()
-        cluster_summary.columns = ['_'.join(col).strip() if col[1] else col[0] for col in cluster_summary.columns.values]
+    def get(self, request):
+        dataset = get_dataset()
+        if dataset is None:
+            return Response({"detail": "CSV file was not found"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        cluster_summary.rename(columns={'vote_average_count': 'movie_count'}, inplace=True)
-        cluster_summary['cluster'] = cluster_summary['cluster'].astype(int)
+        try:
+            params = parse_sweep_params(request.query_params)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Dominant genre
-        cluster_genres = []
-        for cluster_id in range(n_clusters):
-            cluster_data = df[df['cluster'] == cluster_id]
-            all_genres = ', '.join(cluster_data['genres'].astype(str).str.replace(r'[\[\]\"]', '', regex=True)).split(', ')
-            all_genres = [g.strip() for g in all_genres if g.strip()]
-            dominant_genre = pd.Series(all_genres).mode()[0] if all_genres else "N/A"
-            cluster_genres.append({'cluster': cluster_id, 'dominant_genre': dominant_genre})
+        cache_key = make_key('kmeans_sweep', params, dataset.fingerprint)
+        body = clustering_cache.get(cache_key)
+        if body is None:
+            try:
+                sweep = kmeans_sweep(dataset, params['k_min'], params['k_max'], params['features'], params['tf'])
+            except ClusteringError as e:
+                return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            body = json.dumps(sweep).encode('utf-8')
+            clustering_cache.set(cache_key, body)
 
-        summary_df = cluster_summary.merge(pd.DataFrame(cluster_genres), on='cluster')
+        return HttpResponse(body, content_type='application/json', status=status.HTTP_200_OK)
 
-        # Film details
-        movies_to_serialize = df[['id', 'title', 'cluster'] + numeric_features].copy()
 
-        # Data for PCA visualisation
-        pca_df = pd.DataFrame(data=principal_components, columns=['PC1', 'PC2'])
-        pca_df['cluster'] = clusters
+class ClusteringJobView(APIView):
+    permission_classes = (permissions.AllowAny,)
+    authentication_classes = ()
 
-        # 6. Serialization (JSON-incompatible values)
-        summary_df.replace([np.inf, -np.inf], np.nan, inplace=True)
-        movies_to_serialize.replace([np.inf, -np.inf], np.nan, inplace=True)
-        pca_df.replace([np.inf, -np.inf], np.nan, inplace=True)
+    def get(self, request, job_id):
+        job = jobs.backend.get(job_id)
+        if job is None:
+            raise Http404("Job doesn't exist.")
+        return Response(_job_data(request, job), status=status.HTTP_200_OK)
 
-        json_str_summary = summary_df.to_json(orient='records', double_precision=15)
-        json_str_movies = movies_to_serialize.to_json(orient='records', double_precision=15)
-        json_str_pca = pca_df.to_json(orient='records', double_precision=15)
 
-        response_data = {
-            "n_clusters": n_clusters,
-            "cluster_summary": json.loads(json_str_summary),
-            "movies_with_cluster": json.loads(json_str_movies),
-            "pca_data": json.loads(json_str_pca)
-        }
+class ClusteringJobResultView(APIView):
+    permission_classes = (permissions.AllowAny,)
+    renderer_classes = CLUSTERING_RENDERERS
 
-        return Response(response_data, status=status.HTTP_200_OK)
+    def get(self, request, job_id):
+        job = jobs.backend.get(job_id)
+        if job is None:
+            raise Http404("Job doesn't exist.")
+        if job.status == jobs.FAILED:
+            return Response({"detail": job.error}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if job.status != jobs.FINISHED:
+            return Response(_job_data(request, job), status=status.HTTP_202_ACCEPTED)
+        return _encoded_response(request, encode_result(job.result, _encoding(request), _labels_only(request)))
 
 
 class ClusterPredictionView(APIView):
-    def get_pipeline(self):
-        try:
-            with open(MODEL_KMEANS_PATH, 'rb') as file:
-                return pickle.load(file)
-        except FileNotFoundError:
-            raise Exception("Model pipeline not found.")
-
     def post(self, request):
-        pipeline = self.get_pipeline()
-
         data = request.data
         try:
-            new_data = {
-                'vote_average': float(data.get('vote_average')),
-                'vote_count': float(data.get('vote_count', 100)),
-                'popularity': float(data.get('popularity', 50)),
-                'budget': float(data.get('budget')),
-                'revenue': float(data.get('revenue', 0)),
-                'runtime': float(data.get('runtime', 90)),
-            }
-            target_genre = data.get('genre', 'Action')
+            new_data = parse_movie_features(data)
+            target_genre = data.get('genre', DEFAULT_GENRE)
 
-        except (TypeError, ValueError):
+        except (TypeError, ValueError, AttributeError):
             return Response({"detail": "Invalid format of numeric inputs."}, status=status.HTTP_400_BAD_REQUEST)
 
-        data = pd.DataFrame([new_data], index=[0])
-        predicted_cluster = pipeline.predict(data)[0]
-
         try:
-            df = pd.read_csv(DATA_FILE_PATH)
-            features = ['vote_average', 'vote_count', 'popularity', 'budget', 'revenue', 'runtime']
-            df['cluster'] = pipeline.predict(df[features].fillna(0))
+            predicted_cluster = pipeline_store.predict([new_data])[0]
+        except ModelNotFound as e:
+            return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            recommended_movies = df[
-                (df['cluster'] == predicted_cluster) &
-                (df['genres'].astype(str).str.contains(target_genre))
-                ].sample(n=3)
-
-            recommendations = recommended_movies[['title', 'vote_average', 'popularity']].to_dict('records')
-        except:
+        dataset = get_dataset()
+        if dataset is None:
             recommendations = []
+        else:
+            recommendations = pipeline_store.assignments(dataset).recommend(predicted_cluster, str(target_genre))
 
         return Response({"predicted_cluster": int(predicted_cluster), "recommendations": recommendations}, status=status.HTTP_200_OK)
 
 
-class DBScanClusteringView(APIView):
-    permission_classes = (permissions.AllowAny,)
-
-    def get(self, request):
-        df = get_dataframe()
-        if df is None:
-            return Response({"detail": "CSV file not found"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        try:
-            eps = float(request.query_params.get('eps', 0.5))
-            min_samples = int(request.query_params.get('minPts', 5))
-            if eps <= 0 or min_samples < 2:
-                raise ValueError("eps must be > 0 a minPts >= 2")
-        except ValueError as e:
-            return Response(
-                {"detail": f"Invalid parser format: {e}"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+class ClusterPredictionBatchView(APIView):
+    """Cluster and recommendations for many movies at once.
 
-        features_query = request.query_params.get('features')
-        if features_query:
-            numeric_features = [f.strip() for f in features_query.split(',') if f.strip()]
-        else:
-            numeric_features = ['vote_average', 'vote_count', 'popularity', 'budget', 'revenue', 'runtime']
+    Takes a JSON array or NDJSON body of the same objects as
+    ``ClusterPredictionView`` and streams one result per input, in input
+    order, as NDJSON (NDJSON body or ``Accept: application/x-ndjson``) or as
+    a JSON array. Invalid items get an ``error`` instead of failing the batch.
+    """
+    parser_classes = (JSONParser, NDJSONParser)
 
-        X = df[numeric_features].copy()
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({"detail": "Expected a JSON array or NDJSON body."}, status=status.HTTP_400_BAD_REQUEST)
+        max_items = getattr(settings, 'PREDICTION_BATCH_MAX_ITEMS', 50000)
+        if len(items) > max_items:
+            return Response({"detail": f"At most {max_items} movies per batch."}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows, genres, errors = [], [], {}
+        for position, item in enumerate(items):
+            try:
+                rows.append(parse_movie_features(item))
+                genres.append(str(item.get('genre', DEFAULT_GENRE)))
+            except (TypeError, ValueError, AttributeError):
+                errors[position] = "Invalid format of numeric inputs."
 
         try:
-            imputer = SimpleImputer(strategy='median')
-            X_imputed = imputer.fit_transform(X)
+            clusters = pipeline_store.predict(rows) if rows else []
+        except ModelNotFound as e:
+            return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            scaler = StandardScaler()
-            X_scaled = scaler.fit_transform(X_imputed)
+        dataset = get_dataset()
+        assignments = pipeline_store.assignments(dataset) if dataset is not None else None
 
-            dbscan = DBSCAN(eps=eps, min_samples=min_samples)
-            clusters = dbscan.fit_predict(X_scaled)
+        def results():
+            rng = np.random.default_rng()
+            predicted = iter(zip(clusters, genres))
+            for position in range(len(items)):
+                if position in errors:
+                    yield {"index": position, "error": errors[position]}
+                    continue
+                cluster, genre = next(predicted)
+                recommendations = assignments.recommend(cluster, genre, rng=rng) if assignments is not None else []
+                yield {"index": position, "predicted_cluster": int(cluster), "recommendations": recommendations}
 
-            df['cluster'] = clusters
+        accept = request.META.get('HTTP_ACCEPT', '')
+        if request.content_type.startswith(NDJSONParser.media_type) or NDJSONParser.media_type in accept:
+            stream = (json.dumps(result) + '\n' for result in results())
+            return StreamingHttpResponse(stream, content_type=NDJSONParser.media_type)
 
-            pca = PCA(n_components=2)
-            principal_components = pca.fit_transform(X_scaled)
+        return StreamingHttpResponse(_json_array(results()), content_type='application/json')
 
-        except Exception as e:
-            return Response({"detail": f"Chyba při DBSCAN: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        clustered_df = df[df['cluster'] != -1].copy()
-        noise_points = len(df[df['cluster'] == -1])
+def _json_array(values):
+    separator = '['
+    for value in values:
+        yield separator + json.dumps(value)
+        separator = ','
+    yield ']' if separator == ',' else '[]'
 
-        unique_clusters = clustered_df['cluster'].unique()
-        n_clusters = len(unique_clusters)
 
-        cluster_summary = clustered_df.groupby('cluster')[numeric_features].agg(['count', 'mean']).reset_index()
-        cluster_summary.columns = ['_'.join(col).strip() if col[1] else col[0] for col in cluster_summary.columns.values]
+class DBScanClusteringView(APIView):
+    permission_classes = (permissions.AllowAny,)
+    renderer_classes = CLUSTERING_RENDERERS
 
-        cluster_summary.rename(columns={f'{numeric_features[0]}_count': 'movie_count', 'cluster': 'cluster_id'}, inplace=True)
-        cluster_summary['cluster_id'] = cluster_summary['cluster_id'].astype(int)
+    def get_params(self, request, params):
+        dataset = get_dataset()
+        if dataset is None:
+            return None, None, Response({"detail": "CSV file not found"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        try:
+            params = parse_dbscan_params(params)
+        except ValueError as e:
+            return None, None, Response(
+                {"detail": f"Invalid parser format: {e}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        cluster_genres = []
-        for cluster_id in unique_clusters:
-            cluster_data = df[df['cluster'] == cluster_id]
-            all_genres = ', '.join(cluster_data['genres'].astype(str).str.replace(r'[\[\]\"]', '', regex=True)).split(', ')
-            all_genres = [g.strip() for g in all_genres if g.strip()]
-            dominant_genre = pd.Series(all_genres).mode()[0] if all_genres else "N/A"
-            cluster_genres.append({'cluster_id': int(cluster_id), 'dominant_genre': dominant_genre})
+        return dataset, params, None
 
-        summary_df = cluster_summary.merge(pd.DataFrame(cluster_genres), on='cluster_id', how='left')
-        movies_to_serialize = df[['id', 'title', 'cluster'] + numeric_features].copy()
-        pca_df = pd.DataFrame(data=principal_components, columns=['PC1', 'PC2'])
-        pca_df['cluster'] = clusters
+    def get(self, request):
+        dataset, params, error = self.get_params(request, request.query_params)
+        if error is not None:
+            return error
 
-        summary_df.replace([np.inf, -np.inf], np.nan, inplace=True)
-        movies_to_serialize.replace([np.inf, -np.inf], np.nan, inplace=True)
-        pca_df.replace([np.inf, -np.inf], np.nan, inplace=True)
+        try:
+            result = dbscan_clustering(dataset, params['eps'], params['minPts'], params['features'],
+                                       engine=params['engine'])
+        except ClusteringError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        json_str_summary = summary_df.to_json(orient='records', double_precision=15)
-        json_str_movies = movies_to_serialize.to_json(orient='records', double_precision=15)
-        json_str_pca = pca_df.to_json(orient='records', double_precision=15)
+        return _encoded_response(request, encode_result(result, _encoding(request), _labels_only(request)))
 
-        response_data = {
-            "n_clusters": n_clusters,
-            "noise_points": noise_points,
-            "eps": eps,
-            "min_samples": min_samples,
-            "cluster_summary": json.loads(json_str_summary),
-            "movies_with_cluster": json.loads(json_str_movies),
-            "pca_data": json.loads(json_str_pca)
-        }
+    def post(self, request):
+        """Run the clustering as a background job, see ``ClusteringJobView``."""
+        dataset, params, error = self.get_params(request, _request_params(request))
+        if error is not None:
+            return error
 
-        return Response(response_data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return _submit_clustering_job(request, dataset, 'dbscan', params)
@@ -3,6 +3,8 @@ import {Input} from "@/components/ui/input.tsx";
 import {Loader2} from "lucide-react";
 import {cn} from "@/lib/utils.ts";
 import type {DBScanResult} from "@/utils/types/DBScanResult.ts";
+import type {ClusterLabels} from "@/utils/types/ClusterLabels.ts";
+import {applyClusterLabels} from "@/utils/functions.ts";
 import {API_BASE_URL} from "@/utils/constants";
 import axios from "axios";
 import {ClusterScatterPlot} from "@/components/clustering/ClusterScatterPlot.tsx";
@@ -27,16 +29,25 @@ export const DBScan: FC = () => {
     const [loading, setLoading] = useState<boolean>(false);
     const [error, setError] = useState<string | null>(null);
     const [selectedCluster, setSelectedCluster] = useState<number | null>(null);
+    const [resultFeatures, setResultFeatures] = useState<string | null>(null);
 
 const fetchDBScanResults = async (eps: number, minPts: number, features: string[]) => {
     setLoading(true);
     setError(null);
-    setResults(null);
     try {
         const featureQuery = features.join(',');
-        const response = await axios.get<DBScanResult>(
-            `${API_BASE_URL}clustering/dbscan/?eps=${eps}&minPts=${minPts}&features=${featureQuery}`
-        );
+        const url = `${API_BASE_URL}clustering/dbscan/?eps=${eps}&minPts=${minPts}&features=${featureQuery}`;
+        // Při změně jen eps/minPts stačí nové štítky, filmy a PCA souřadnice zůstávají stejné
+        if (results && resultFeatures === featureQuery) {
+            const response = await axios.get<ClusterLabels<DBScanResult['cluster_summary'][number]>>(`${url}&labels_only=1`);
+            if (response.data.projection === results.projection) {
+                setResults(applyClusterLabels(results, response.data));
+                return;
+            }
+        }
+        setResults(null);
+        const response = await axios.get<DBScanResult>(url);
+        setResultFeatures(featureQuery);
         setResults(response.data);
     } catch (err) {
         if (axios.isAxiosError(err)) {
@@ -0,0 +1,65 @@
+import React, {useEffect, useState} from 'react';
+import Plot from 'react-plotly.js';
+import axios from "axios";
+import {API_BASE_URL} from "@/utils/constants";
+import type {KMeansSweep} from "@/utils/types/KMeansSweep.ts";
+
+type ElbowChartProps = {
+    features: string[];
+    transformativeFunction: string;
+    onSelectK: (k: number) => void;
+};
+
+const K_MIN = 2;
+const K_MAX = 12;
+
+// Loketní graf: inertia a silhouette pro K_MIN..K_MAX z jednoho požadavku, kliknutím se vybere K
+export const ElbowChart: React.FC<ElbowChartProps> = ({ features, transformativeFunction, onSelectK }) => {
+    const [sweep, setSweep] = useState<KMeansSweep | null>(null);
+
+    useEffect(() => {
+        let cancelled = false;
+        setSweep(null);
+        axios.get<KMeansSweep>(
+            `${API_BASE_URL}clustering/kmeans/sweep/?k_min=${K_MIN}&k_max=${K_MAX}&features=${features.join(',')}&tf=${transformativeFunction}`
+        ).then(response => {
+            if (!cancelled) setSweep(response.data);
+        }).catch(() => {
+            if (!cancelled) setSweep(null);
+        });
+        return () => {
+            cancelled = true;
+        };
+    }, [features, transformativeFunction]);
+
+    if (!sweep) return null;
+
+    const k = sweep.scores.map(score => score.k);
+
+    return (
+        <div className="p-4 mb-6 border rounded-lg shadow-md" style={{ height: '400px' }}>
+            <Plot
+                data={[
+                    { x: k, y: sweep.scores.map(score => score.inertia), name: 'Inertia', type: 'scatter', mode: 'lines+markers' },
+                    { x: k, y: sweep.scores.map(score => score.silhouette), name: 'Silhouette', type: 'scatter', mode: 'lines+markers', yaxis: 'y2' },
+                    { x: k, y: sweep.scores.map(score => score.davies_bouldin), name: 'Davies-Bouldin', type: 'scatter', mode: 'lines+markers', yaxis: 'y2' },
+                ]}
+                layout={{
+                    title: { text: 'Volba K (loketní metoda)', font: { size: 16 } },
+                    autosize: true,
+                    margin: { t: 50, b: 50, l: 60, r: 60 },
+                    xaxis: { title: { text: 'K' }, dtick: 1 },
+                    yaxis: { title: { text: 'Inertia' } },
+                    yaxis2: { title: { text: 'Silhouette / Davies-Bouldin' }, overlaying: 'y', side: 'right' },
+                    legend: { orientation: 'h', y: -0.2 },
+                }}
+                config={{ responsive: true, displayModeBar: false }}
+                style={{ width: '100%', height: '100%' }}
+                onClick={(event) => {
+                    const point = event.points[0];
+                    if (point && typeof point.x === 'number') onSelectK(point.x);
+                }}
+            />
+        </div>
+    );
+};
@@ -7,9 +7,13 @@ import axios from "axios";
 import {cn} from "@/lib/utils.ts";
 import {KMeansDetails} from "@/components/clustering/KMeansDetails.tsx";
 import type {KMeansResult} from "@/utils/types/KMeansResult.ts";
+import type {ClusterLabels} from "@/utils/types/ClusterLabels.ts";
+import type {ClusterSummary} from "@/utils/types/ClusterSummary.ts";
+import {applyClusterLabels} from "@/utils/functions.ts";
 import {ClusterScatterPlot} from "@/components/clustering/ClusterScatterPlot.tsx";
 import {PlotlyBoxPlots} from "@/components/clustering/PlotlyBoxPlots.tsx";
 import {KMeansDescription} from "@/components/clustering/KMeansDescription.tsx";
+import {ElbowChart} from "@/components/clustering/ElbowChart.tsx";
 import {Select, SelectContent, SelectItem, SelectTrigger, SelectValue} from "@/components/ui/select.tsx";
 import { Link } from "react-router-dom";
 
@@ -30,15 +34,26 @@ export const KMeans: FC = () => {
     const [error, setError] = useState<string | null>(null);
     const [selectedCluster, setSelectedCluster] = useState<number | null>(null);
     const [transformativeFunction, setTransformativeFunction] = useState<'standardScaler' | 'minMaxScaler'>('standardScaler');
+    const [resultParams, setResultParams] = useState<string | null>(null);
 
     const fetchKMeansResults = async (k: number, features: string[], transformativeFunction: 'standardScaler' | 'minMaxScaler') => {
         setLoading(true);
         setError(null);
-        setResults(null);
         setSelectedCluster(null);
         try {
             const featureQuery = features.join(',');
-            const response = await axios.get<KMeansResult>(`${API_BASE_URL}clustering/kmeans/?k=${k}&features=${featureQuery}&tf=${transformativeFunction}`);
+            const url = `${API_BASE_URL}clustering/kmeans/?k=${k}&features=${featureQuery}&tf=${transformativeFunction}`;
+            // Při změně jen K stačí nové štítky, filmy a PCA souřadnice zůstávají stejné
+            if (results && resultParams === `${featureQuery}|${transformativeFunction}`) {
+                const response = await axios.get<ClusterLabels<ClusterSummary>>(`${url}&labels_only=1`);
+                if (response.data.projection === results.projection) {
+                    setResults(applyClusterLabels(results, response.data));
+                    return;
+                }
+            }
+            setResults(null);
+            const response = await axios.get<KMeansResult>(url);
+            setResultParams(`${featureQuery}|${transformativeFunction}`);
             setResults(response.data);
         } catch (err) {
             if (axios.isAxiosError(err)) {
@@ -110,6 +125,14 @@ export const KMeans: FC = () => {
                 ))}
             </div>
 
+            {selectedFeatures.length > 0 && (
+                <ElbowChart
+                    features={selectedFeatures}
+                    transformativeFunction={transformativeFunction}
+                    onSelectK={setKValue}
+                />
+            )}
+
             {loading && (
                 <div className="flex justify-center items-center h-40">
                     <Loader2 className="mr-2 h-8 w-8 animate-spin text-blue-500"/>
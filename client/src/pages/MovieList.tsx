@@ -1,6 +1,8 @@
 import { useState, type FC, useEffect } from "react";
 import { useGetMovies } from "../utils/api/useGetMovies";
-import { Plus, X } from "lucide-react";
+import { useAutocomplete } from "../utils/api/useAutocomplete";
+import { movieExportUrl } from "../utils/api/movieExportUrl";
+import { Download, Plus, X } from "lucide-react";
 import { flexRender, getCoreRowModel, getSortedRowModel, useReactTable, type SortingState } from "@tanstack/react-table";
 import { Button } from "@/components/ui/button";
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "@/components/ui/table.tsx";
@@ -34,6 +36,9 @@ export const MovieList: FC = () => {
   }, [activeFilters]);
 
   const { isPending, error, data } = useGetMovies(currentPage, limit, debouncedFilters);
+  // Návrhy pro první filtr podle názvu
+  const titleQuery = String(activeFilters.find(f => f.column === 'title')?.value ?? "");
+  const titleSuggestions = useAutocomplete(titleQuery);
   const totalPages = data ? Math.ceil(data.total_count / limit) : 1;
 
 
@@ -130,6 +135,7 @@ export const MovieList: FC = () => {
                       value={filter.value}
                       onChange={(e) => updateFilter(index, 'value', e.target.value)}
                       className="w-full sm:w-[200px] bg-white"
+                      list={filter.column === 'title' ? 'title-suggestions' : undefined}
                     />
 
                     <Button
@@ -143,6 +149,11 @@ export const MovieList: FC = () => {
                   </div>
                 )
               })}
+              <datalist id="title-suggestions">
+                {titleSuggestions.map(movie => (
+                  <option key={movie.id} value={movie.title} />
+                ))}
+              </datalist>
 
               <Button
                 variant="outline"
@@ -152,6 +163,13 @@ export const MovieList: FC = () => {
                 <Plus className="w-4 h-4 mr-2" />
                 Přidat filtr
               </Button>
+
+              <Button variant="outline" className="self-start" asChild>
+                <a href={movieExportUrl(debouncedFilters, "csv")} download>
+                  <Download className="w-4 h-4 mr-2" />
+                  Stáhnout CSV
+                </a>
+              </Button>
             </div>
 
             <div className="text-slate-600">
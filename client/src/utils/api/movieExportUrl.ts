@@ -0,0 +1,11 @@
+import type { FilterCondition } from "../types/FilterCondition.ts";
+import {API_BASE_URL} from "@/utils/constants";
+
+// Odkaz na stažení všech filmů odpovídajících filtrům (server je streamuje)
+export const movieExportUrl = (filters: FilterCondition[], format: "csv" | "ndjson") => {
+  const params = new URLSearchParams({ format });
+  if (filters.length > 0) {
+    params.set("filters", JSON.stringify(filters));
+  }
+  return API_BASE_URL + "movies/export/?" + params.toString();
+};
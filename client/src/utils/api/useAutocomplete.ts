@@ -0,0 +1,24 @@
+import { useQuery } from "@tanstack/react-query";
+import axios from "axios";
+import {API_BASE_URL} from "@/utils/constants";
+
+type AutocompleteResponse = {
+  query: string;
+  results: { id: number; title: string; release_date: string | null; vote_average: number | null; popularity: number | null }[];
+};
+
+// Návrhy názvů pro filtr podle názvu, seřazené serverem podle shody a popularity
+export const useAutocomplete = (query: string) => {
+  const { data } = useQuery({
+    queryKey: ['movie-autocomplete', query],
+    queryFn: async () => {
+      const response = await axios.get<AutocompleteResponse>(
+        API_BASE_URL+"movies/autocomplete/", { params: { q: query, n: 10 } }
+      );
+      return response.data;
+    },
+    enabled: query.trim().length > 0,
+    staleTime: 60 * 1000,
+  });
+  return data?.results ?? [];
+};
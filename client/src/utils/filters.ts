@@ -12,6 +12,7 @@ export const filterableColumns = [
 export const operators = {
   string: [
     { id: 'contains', label: 'obsahuje' },
+    { id: 'startswith', label: 'začíná na' },
     { id: 'eq', label: 'je rovno' },
   ],
   numeric: [
@@ -54,6 +54,26 @@ export const getVisiblePages = (currentPage: number, totalPages: number) => {
         return visiblePages;
 };
 
+type ClusteredResult = {
+    projection: string;
+    movies_with_cluster: { cluster: number }[];
+    pca_data: { cluster: number }[];
+};
+
+// Přenese nové shluky do filmů a PCA bodů předchozí odpovědi se stejnou projekcí
+export const applyClusterLabels = <T extends ClusteredResult>(
+    previous: T,
+    update: { projection: string; cluster_summary: unknown[]; labels: number[] } & Partial<T>,
+): T => {
+    const {labels, ...rest} = update;
+    return {
+        ...previous,
+        ...rest,
+        movies_with_cluster: previous.movies_with_cluster.map((movie, i) => ({...movie, cluster: labels[i]})),
+        pca_data: previous.pca_data.map((point, i) => ({...point, cluster: labels[i]})),
+    } as T;
+};
+
 export const generateColors = (n: number) => {
     const baseColors = [
         'rgba(255, 99, 132, 0.7)',
@@ -0,0 +1,7 @@
+// Odpověď s ?labels_only=1 – jen nové přiřazení shluků pro filmy, které už klient má
+export type ClusterLabels<Summary> = {
+    n_clusters: number;
+    projection: string;
+    cluster_summary: Summary[];
+    labels: number[];
+};
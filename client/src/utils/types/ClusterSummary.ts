@@ -1,7 +1,10 @@
+import type {GenreShare} from "@/utils/types/GenreShare.ts";
+
 export type ClusterSummary = {
     cluster: number;
     movie_count: number;
     dominant_genre: string;
+    genre_distribution: GenreShare[];
     vote_average_mean: number;
     popularity_mean: number;
     budget_mean: number;
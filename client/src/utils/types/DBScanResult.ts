@@ -1,10 +1,14 @@
+import type {GenreShare} from "@/utils/types/GenreShare.ts";
+
 export type DBScanResult = {
     n_clusters: number;
+    projection: string;
     noise_points: number;
     cluster_summary: {
         cluster_id: number;
         movie_count: number;
         dominant_genre: string;
+        genre_distribution: GenreShare[];
         budget_count: number;
         budget_mean: number;
         popularity_count: number;
@@ -0,0 +1,6 @@
+// Nejčastější žánry shluku s počtem filmů a jejich podílem ve shluku
+export type GenreShare = {
+    genre: string;
+    count: number;
+    share: number;
+};
@@ -3,6 +3,7 @@ import type {Movie} from "@/utils/types/Movie.ts";
 
 export type KMeansResult = {
     n_clusters: number;
+    projection: string;
     cluster_summary: ClusterSummary[];
     movies_with_cluster: Movie[];
     pca_data: {
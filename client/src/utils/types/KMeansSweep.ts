@@ -0,0 +1,12 @@
+// Odpověď /clustering/kmeans/sweep/ – metriky K-Means pro každé K z rozsahu
+export type KMeansSweep = {
+    features: string[];
+    tf: string;
+    silhouette_sample: number;
+    scores: {
+        k: number;
+        inertia: number;
+        silhouette: number;
+        davies_bouldin: number;
+    }[];
+};
@@ -1,111 +1,341 @@
-import requests
-import time
-import pandas as pd
-import numpy as np
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-BEARER_TOKEN = os.getenv('BEARER_TOKEN')
-BASE_URL = "https://api.themoviedb.org/3"
-START_PAGE = 201
-PAGES_TO_ADD = 500
-MAX_PAGES_TO_FETCH = START_PAGE + PAGES_TO_ADD - 1
-
-DISCOVER_DELAY = 0.5
-DETAILS_DELAY = 1.2
-OUTPUT_FILENAME = "tmdb_movie_data.csv"
-
-headers = {
-    "accept": "application/json",
-    "Authorization": f"Bearer {BEARER_TOKEN}"
-}
-
-existing_df = pd.read_csv(OUTPUT_FILENAME)
-existing_movie_ids = set(existing_df['id'].unique())
-print(f"Načteno {len(existing_df)} filmů z '{OUTPUT_FILENAME}'.")
-print(f"Pokračování od stránky {START_PAGE} a do {PAGES_TO_ADD} stránek.")
-
-new_movies_base_data = []
-
-for page in range(START_PAGE, MAX_PAGES_TO_FETCH + 1):
-    discover_url = f"{BASE_URL}/discover/movie?include_adult=false&include_video=false&language=en-US&page={page}&sort_by=popularity.desc"
-    
-    try:
-        response = requests.get(discover_url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        results = data.get('results', [])
-        
-        for movie in results:
-            movie_id = movie.get('id')
-            # Přidáme film POUZE, pokud ho již nemáme v existujících ID
-            if movie_id not in existing_movie_ids:
-                new_movies_base_data.append({
-                    'id': movie_id,
-                    'title': movie.get('title'),
-                    'release_date': movie.get('release_date'),
-                    'vote_average': movie.get('vote_average'),
-                    'vote_count': movie.get('vote_count'),
-                    'popularity': movie.get('popularity')
-                })
-                existing_movie_ids.add(movie_id) # Přidáme nové ID, aby se neopakovalo
-            
-        print(f"Stránka {page} stažena. Nových filmů: {len(new_movies_base_data)}")
-        
-        if page >= data.get('total_pages', MAX_PAGES_TO_FETCH) or not results:
-             print("Stažena poslední stránka")
-             break
-        
-        time.sleep(DISCOVER_DELAY) 
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Chyba na stránce {page}: {e}")
-        break
-
-df_new_base = pd.DataFrame(new_movies_base_data)
-if df_new_base.empty:
-    print("ℹŽádné nové filmy ke stažení.")
-    exit()
-
-print(f"Získáno {len(df_new_base)} NOVÝCH ID pro detailní stahování.")
-
-new_details_list = []
-print("\nStahování detailních dat pro NOVÉ filmy.")
-
-for i, movie_id in enumerate(df_new_base['id'].unique()):
-    detail_url = f"{BASE_URL}/movie/{movie_id}"
-    
-    try:
-        detail_response = requests.get(detail_url, headers=headers)
-        detail_response.raise_for_status()
-        detail_data = detail_response.json()
-        
-        new_details_list.append({
-            'id': movie_id,
-            'budget': detail_data.get('budget', 0),
-            'revenue': detail_data.get('revenue', 0),
-            'runtime': detail_data.get('runtime', np.nan),
-            'genres': ", ".join([g['name'] for g in detail_data.get('genres', [])]),
-            'spoken_languages': ", ".join([l['english_name'] for l in detail_data.get('spoken_languages', [])])
-        })
-        
-        if (i + 1) % 50 == 0:
-            print(f"Zpracováno {i + 1}/{len(df_new_base)} nových filmů...")
-            
-        time.sleep(DETAILS_DELAY) 
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Chyba u ID {movie_id}: {e}")
-        time.sleep(DETAILS_DELAY * 2)
-        continue
-
-df_new_details = pd.DataFrame(new_details_list)
-df_new_complete = pd.merge(df_new_base, df_new_details, on='id', how='left')
-final_df = pd.concat([existing_df, df_new_complete], ignore_index=True)
-final_df.to_csv(OUTPUT_FILENAME, index=False)
-
-print("\n" + "="*50)
-print(f"Celkový počet řádků ve finálním CSV: {len(final_df)}")
-print(f"Přidáno {len(df_new_complete)} filmů.")
\ No newline at end of file
+"""Stahování nových filmů z TMDB API do ``tmdb_movie_data.csv``.
+
+Discover stránky i detaily filmů se stahují souběžně přes jednu sdílenou
+``aiohttp`` session (pool spojení). Počet požadavků za sekundu hlídá token
+bucket, 429 a chyby serveru se opakují s exponenciálním čekáním a hlavičkou
+``Retry-After``. Po každé dávce se průběh zapíše do checkpointu (JSON lines),
+takže po pádu se pokračuje bez opětovného stahování. Nové filmy se na konci
+zapíšou jako nový segment datasetu (``api/main/segments.py``), CSV se
+nepřepisuje.
+
+``--base-url`` (nebo ``TMDB_BASE_URL``) umožňuje pustit skript proti
+lokálnímu stub serveru místo TMDB (``tmdb_stub.py``, testy v
+``test_download_data.py``).
+"""
+import argparse
+import asyncio
+import email.utils
+import json
+import os
+import random
+import sys
+import time
+
+import aiohttp
+import pandas as pd
+from dotenv import load_dotenv
+
+# Segmentové úložiště datasetu sdílí skript s API
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from main.segments import SegmentStore  # noqa: E402
+
+load_dotenv()
+
+BEARER_TOKEN = os.getenv('BEARER_TOKEN')
+BASE_URL = os.getenv('TMDB_BASE_URL', "https://api.themoviedb.org/3")
+START_PAGE = 201
+PAGES_TO_ADD = 500
+
+OUTPUT_FILENAME = "tmdb_movie_data.csv"
+CHECKPOINT_FILENAME = "tmdb_download.checkpoint.jsonl"
+
+# TMDB povoluje zhruba 40-50 požadavků za sekundu, necháváme rezervu
+RATE_LIMIT = 20
+CONCURRENCY = 8
+DETAILS_BATCH_SIZE = 100
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+REQUEST_TIMEOUT = 30
+
+
+class DownloadError(Exception):
+    pass
+
+
+class TokenBucket:
+    """Nejvýše ``rate`` požadavků za sekundu, nárazově až ``capacity``."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, delay):
+        # Po 429 čekají všechny požadavky, ne jen ten, který ji dostal
+        self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def retry_after(value):
+    """Sekundy z hlavičky ``Retry-After`` (číslo nebo HTTP datum), jinak None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt):
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+class TMDBClient:
+    def __init__(self, session, base_url, limiter, concurrency, max_retries=MAX_RETRIES):
+        self.session = session
+        self.base_url = base_url.rstrip('/')
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def get_json(self, path, params=None):
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            try:
+                async with self._semaphore, self.session.get(self.base_url + path, params=params) as response:
+                    if response.status == 429 or response.status >= 500:
+                        error = f"HTTP {response.status}"
+                        delay = retry_after(response.headers.get('Retry-After'))
+                        if delay is None:
+                            delay = backoff(attempt)
+                        if response.status == 429:
+                            self.limiter.pause(delay)
+                    else:
+                        # Ostatní 4xx nemá smysl opakovat
+                        response.raise_for_status()
+                        return await response.json()
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                error = str(e) or e.__class__.__name__
+                delay = backoff(attempt)
+
+            if attempt == self.max_retries:
+                break
+            await asyncio.sleep(delay)
+        raise DownloadError(f"{path}: {error} (po {self.max_retries + 1} pokusech)")
+
+    async def discover(self, page):
+        return await self.get_json('/discover/movie', {
+            'include_adult': 'false',
+            'include_video': 'false',
+            'language': 'en-US',
+            'page': page,
+            'sort_by': 'popularity.desc',
+        })
+
+    async def details(self, movie_id):
+        return await self.get_json(f'/movie/{movie_id}')
+
+
+class Checkpoint:
+    """Append-only záznam hotových stránek a detailů.
+
+    Každá dávka je jeden řádek zapsaný a ``fsync``-nutý najednou, neúplný
+    poslední řádek po pádu se při načtení zahodí.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pages = set()
+        self.total_pages = None
+        self.finished_discover = False
+        self.movies = []
+        self.details = {}
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return self
+        with open(self.path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._apply(record)
+        return self
+
+    def _apply(self, record):
+        if 'page' in record:
+            self.pages.add(record['page'])
+            self.movies.extend(record['movies'])
+            self.total_pages = record.get('total_pages') or self.total_pages
+        if record.get('last_page'):
+            self.finished_discover = True
+        for detail in record.get('details', []):
+            self.details[detail['id']] = detail
+
+    def append(self, record):
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+        self._apply(record)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def base_record(movie):
+    return {
+        'id': movie.get('id'),
+        'title': movie.get('title'),
+        'release_date': movie.get('release_date'),
+        'vote_average': movie.get('vote_average'),
+        'vote_count': movie.get('vote_count'),
+        'popularity': movie.get('popularity')
+    }
+
+
+def detail_record(movie_id, detail_data):
+    return {
+        'id': movie_id,
+        'budget': detail_data.get('budget', 0),
+        'revenue': detail_data.get('revenue', 0),
+        'runtime': detail_data.get('runtime'),
+        'genres': ", ".join([g['name'] for g in detail_data.get('genres', [])]),
+        'spoken_languages': ", ".join([l['english_name'] for l in detail_data.get('spoken_languages', [])])
+    }
+
+
+async def fetch_pages(client, checkpoint, existing_movie_ids, start_page, last_page, concurrency):
+    known_ids = set(existing_movie_ids) | {movie['id'] for movie in checkpoint.movies}
+    pages = [page for page in range(start_page, last_page + 1) if page not in checkpoint.pages]
+
+    for start in range(0, len(pages), concurrency):
+        if checkpoint.finished_discover:
+            break
+        batch = pages[start:start + concurrency]
+        if checkpoint.total_pages:
+            batch = [page for page in batch if page <= checkpoint.total_pages]
+        responses = await asyncio.gather(*(client.discover(page) for page in batch), return_exceptions=True)
+
+        # Stránky se zapisují v pořadí, aby se zachovalo řazení podle popularity
+        for page, data in zip(batch, responses):
+            if isinstance(data, Exception):
+                print(f"Chyba na stránce {page}: {data}")
+                return False
+
+            results = data.get('results', [])
+            movies = []
+            for movie in results:
+                movie_id = movie.get('id')
+                # Přidáme film POUZE, pokud ho již nemáme v existujících ID
+                if movie_id not in known_ids:
+                    movies.append(base_record(movie))
+                    known_ids.add(movie_id)
+
+            last = page >= data.get('total_pages', last_page) or not results
+            checkpoint.append({'page': page, 'total_pages': data.get('total_pages'), 'movies': movies, 'last_page': last})
+            print(f"Stránka {page} stažena. Nových filmů: {len(checkpoint.movies)}")
+            if last:
+                print("Stažena poslední stránka")
+                break
+    return True
+
+
+async def fetch_details(client, checkpoint, batch_size):
+    pending = list(dict.fromkeys(movie['id'] for movie in checkpoint.movies if movie['id'] not in checkpoint.details))
+    total = len(checkpoint.movies)
+
+    async def fetch(movie_id):
+        try:
+            return detail_record(movie_id, await client.details(movie_id))
+        except (DownloadError, aiohttp.ClientResponseError) as e:
+            print(f"Chyba u ID {movie_id}: {e}")
+            return None
+
+    for start in range(0, len(pending), batch_size):
+        details = await asyncio.gather(*(fetch(movie_id) for movie_id in pending[start:start + batch_size]))
+        checkpoint.append({'details': [detail for detail in details if detail is not None]})
+        print(f"Zpracováno {len(checkpoint.details)}/{total} nových filmů...")
+
+
+def write_output(store, checkpoint):
+    """Nové filmy jako další segment datasetu, existující data se nepřepisují."""
+    df_new_base = pd.DataFrame(checkpoint.movies)
+    df_new_details = pd.DataFrame(list(checkpoint.details.values()),
+                                  columns=['id', 'budget', 'revenue', 'runtime', 'genres', 'spoken_languages'])
+    df_new_complete = pd.merge(df_new_base, df_new_details, on='id', how='left')
+    return store.append(df_new_complete), df_new_complete
+
+
+async def download(args):
+    store = SegmentStore(args.output)
+    existing_df = store.read()
+    existing_movie_ids = set(existing_df['id'].unique())
+    print(f"Načteno {len(existing_df)} filmů z '{args.output}' ({len(store.files())} souborů).")
+
+    checkpoint = Checkpoint(args.checkpoint).load()
+    if checkpoint.pages:
+        print(f"Pokračování z checkpointu: {len(checkpoint.pages)} stránek, {len(checkpoint.details)} detailů.")
+    print(f"Pokračování od stránky {args.start_page} a do {args.pages} stránek.")
+
+    headers = {
+        "accept": "application/json",
+        "Authorization": f"Bearer {BEARER_TOKEN}"
+    }
+    limiter = TokenBucket(args.rate)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(headers=headers, connector=connector, timeout=timeout) as session:
+        client = TMDBClient(session, args.base_url, limiter, args.concurrency)
+        if not await fetch_pages(client, checkpoint, existing_movie_ids, args.start_page,
+                                 args.start_page + args.pages - 1, args.concurrency):
+            # Neúplný seznam stránek se nezapisuje, další spuštění naváže z checkpointu
+            print(f"Stahování stránek selhalo, checkpoint '{args.checkpoint}' zůstává pro pokračování.")
+            return 1
+
+        if not checkpoint.movies:
+            print("Žádné nové filmy ke stažení.")
+            checkpoint.remove()
+            return 0
+
+        print(f"Získáno {len(checkpoint.movies)} NOVÝCH ID pro detailní stahování.")
+        print("\nStahování detailních dat pro NOVÉ filmy.")
+        await fetch_details(client, checkpoint, DETAILS_BATCH_SIZE)
+
+    segment, df_new_complete = write_output(store, checkpoint)
+    checkpoint.remove()
+
+    print("\n" + "="*50)
+    print(f"Nový segment: {segment}")
+    print(f"Celkový počet řádků: {len(existing_df) + len(df_new_complete)}")
+    print(f"Přidáno {len(df_new_complete)} filmů.")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stažení nových filmů z TMDB.")
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--output', default=OUTPUT_FILENAME)
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILENAME)
+    parser.add_argument('--start-page', type=int, default=START_PAGE)
+    parser.add_argument('--pages', type=int, default=PAGES_TO_ADD)
+    parser.add_argument('--rate', type=float, default=RATE_LIMIT, help="Požadavků za sekundu.")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    sys.exit(asyncio.run(download(parser.parse_args())))
+
+
+if __name__ == '__main__':
+    main()
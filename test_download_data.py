@@ -0,0 +1,122 @@
+"""Testy ``download_data.py`` proti ``tmdb_stub.py``: ``python -m unittest test_download_data``."""
+import argparse
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import aiohttp
+import pandas as pd
+
+import download_data
+from download_data import Checkpoint, DownloadError, TMDBClient, TokenBucket, download
+from main.segments import SegmentStore
+from tmdb_stub import TMDBStub
+
+COLUMNS = ['id', 'title', 'release_date', 'vote_average', 'vote_count', 'popularity', 'budget', 'revenue',
+           'runtime', 'genres', 'spoken_languages']
+
+
+class StubTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.stub = TMDBStub(total_pages=4, per_page=5)
+        await self.stub.start()
+        self.addAsyncCleanup(self.stub.stop)
+        # Krátké čekání mezi pokusy, testy nemají čekat sekundy
+        patcher = mock.patch.multiple(download_data, BACKOFF_BASE=0.01, BACKOFF_MAX=0.05)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TMDBClientTests(StubTestCase):
+    async def get(self, path, max_retries=3):
+        async with aiohttp.ClientSession() as session:
+            client = TMDBClient(session, self.stub.url, TokenBucket(100), 4, max_retries=max_retries)
+            return await client.get_json(path)
+
+    async def test_429_waits_for_retry_after(self):
+        self.stub.fail('/movie/1000', 429, retry_after=1)
+        detail = await self.get('/movie/1000')
+        self.assertEqual(detail['id'], 1000)
+        first, second = self.stub.hits('/movie/1000')
+        self.assertGreaterEqual(second - first, 0.95)
+
+    async def test_429_pauses_the_other_requests(self):
+        limiter = TokenBucket(100)
+        limiter.pause(0.5)
+        started = time.monotonic()
+        await limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.45)
+
+    async def test_server_errors_are_retried(self):
+        self.stub.fail('/movie/1001', 500, 503)
+        self.assertEqual((await self.get('/movie/1001'))['id'], 1001)
+        self.assertEqual(len(self.stub.hits('/movie/1001')), 3)
+
+    async def test_gives_up_after_max_retries(self):
+        self.stub.fail('/movie/1002', 500, 500, 500)
+        with self.assertRaises(DownloadError):
+            await self.get('/movie/1002', max_retries=2)
+        self.assertEqual(len(self.stub.hits('/movie/1002')), 3)
+
+    async def test_other_client_errors_are_not_retried(self):
+        self.stub.broken.add('/movie/1003')
+        with self.assertRaises(aiohttp.ClientResponseError):
+            await self.get('/movie/1003')
+        self.assertEqual(len(self.stub.hits('/movie/1003')), 1)
+
+
+class DownloadTests(StubTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output = os.path.join(directory.name, 'movies.csv')
+        self.checkpoint = os.path.join(directory.name, 'checkpoint.jsonl')
+        # Film 1000 už v datech je, znovu se stahovat nemá
+        pd.DataFrame([[1000, 'Stub Movie 0', '2000-01-01', 5.0, 0, 1000.0, 0, 0, 80, 'Drama', 'English']],
+                     columns=COLUMNS).to_csv(self.output, index=False)
+        patcher = mock.patch('builtins.print')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def args(self):
+        return argparse.Namespace(base_url=self.stub.url, output=self.output, checkpoint=self.checkpoint,
+                                  start_page=1, pages=10, rate=200, concurrency=2)
+
+    async def test_failed_page_keeps_the_checkpoint_and_resumes(self):
+        self.stub.broken.add(self.stub.discover_path(3))
+        self.assertEqual(await download(self.args()), 1)
+        # Nic se nezapsalo, hotové stránky zůstaly v checkpointu
+        self.assertEqual(len(SegmentStore(self.output).files()), 1)
+        self.assertEqual(Checkpoint(self.checkpoint).load().pages, {1, 2})
+
+        self.stub.broken.clear()
+        self.stub.requests.clear()
+        self.assertEqual(await download(self.args()), 0)
+        requested = [path for path, _ in self.stub.requests]
+        self.assertNotIn(self.stub.discover_path(1), requested)
+        self.assertNotIn(self.stub.discover_path(2), requested)
+        self.assertIn(self.stub.discover_path(3), requested)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+        df = SegmentStore(self.output).read()
+        self.assertEqual(sorted(df['id']), list(range(1000, 1020)))
+        self.assertTrue(df.loc[df['id'] == 1007, 'runtime'].eq(87).all())
+
+    async def test_details_are_not_refetched_after_a_crash(self):
+        with mock.patch.object(download_data, 'write_output', side_effect=RuntimeError("crash")):
+            with self.assertRaises(RuntimeError):
+                await download(self.args())
+        fetched = len(Checkpoint(self.checkpoint).load().details)
+        self.assertEqual(fetched, 19)
+
+        self.stub.requests.clear()
+        self.assertEqual(await download(self.args()), 0)
+        self.assertEqual([path for path, _ in self.stub.requests if path.startswith('/movie/')], [])
+        self.assertEqual(len(SegmentStore(self.output).read()), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
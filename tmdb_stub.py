@@ -0,0 +1,125 @@
+"""Lokální náhrada TMDB API pro ``download_data.py``.
+
+Obsluhuje ``/discover/movie`` a ``/movie/{id}`` s deterministickými daty a
+umí vracet chyby: ``fail(path, *statusy)`` nastaví odpovědi, které dostanou
+první požadavky na danou cestu (např. 429 s ``Retry-After``), ``broken``
+jsou cesty, které selhávají pořád. ``requests`` zaznamenává všechny
+požadavky i s časem.
+
+Ruční spuštění: ``python tmdb_stub.py --port 8765`` a pak
+``python download_data.py --base-url http://127.0.0.1:8765``.
+"""
+import argparse
+import asyncio
+import time
+
+from aiohttp import web
+
+GENRES = ['Action', 'Comedy', 'Drama', 'Horror', 'Romance']
+LANGUAGES = ['English', 'French', 'German', 'Czech']
+
+
+class TMDBStub:
+    def __init__(self, total_pages=5, per_page=20, first_id=1000):
+        self.total_pages = total_pages
+        self.per_page = per_page
+        self.first_id = first_id
+        self.failures = {}
+        self.broken = set()
+        self.requests = []
+        self.url = None
+        self._runner = None
+
+    def fail(self, path, *statuses, retry_after=None):
+        """Prvních ``len(statuses)`` požadavků na ``path`` dostane tyto statusy."""
+        self.failures[path] = [(status, retry_after) for status in statuses]
+
+    def hits(self, path):
+        return [at for requested, at in self.requests if requested == path]
+
+    def discover_path(self, page):
+        return f'/discover/movie?page={page}'
+
+    def movie(self, movie_id):
+        index = movie_id - self.first_id
+        return {
+            'id': movie_id,
+            'title': f'Stub Movie {index}',
+            'release_date': f'{2000 + index % 25}-01-01',
+            'vote_average': round(5 + index % 50 / 10, 1),
+            'vote_count': 10 * index,
+            'popularity': 1000.0 - index,
+        }
+
+    async def handle(self, request):
+        if request.path == '/discover/movie':
+            path = self.discover_path(int(request.query.get('page', 1)))
+        else:
+            path = request.path
+        self.requests.append((path, time.monotonic()))
+
+        if path in self.broken:
+            return web.json_response({'status_message': 'broken'}, status=404)
+        pending = self.failures.get(path)
+        if pending:
+            status, retry_after = pending.pop(0)
+            headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+            return web.json_response({'status_message': 'stub error'}, status=status, headers=headers)
+
+        if request.path == '/discover/movie':
+            page = int(request.query.get('page', 1))
+            if page > self.total_pages:
+                return web.json_response({'page': page, 'results': [], 'total_pages': self.total_pages})
+            start = self.first_id + (page - 1) * self.per_page
+            return web.json_response({
+                'page': page,
+                'results': [self.movie(movie_id) for movie_id in range(start, start + self.per_page)],
+                'total_pages': self.total_pages,
+            })
+
+        movie_id = int(request.match_info['movie_id'])
+        index = movie_id - self.first_id
+        return web.json_response({
+            **self.movie(movie_id),
+            'budget': 1_000_000 * (index % 7),
+            'revenue': 2_500_000 * (index % 5),
+            'runtime': 80 + index % 60,
+            'genres': [{'id': i, 'name': GENRES[i]} for i in range(len(GENRES)) if index >> i & 1],
+            'spoken_languages': [{'english_name': LANGUAGES[index % len(LANGUAGES)]}],
+        })
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/discover/movie', self.handle)
+        app.router.add_get('/movie/{movie_id}', self.handle)
+        return app
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f'http://{host}:{port}'
+        return self.url
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+async def serve(port, total_pages):
+    stub = TMDBStub(total_pages=total_pages)
+    print(f"TMDB stub na {await stub.start(port=port)}")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokální náhrada TMDB API.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--pages', type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(serve(args.port, args.pages))
+
+
+if __name__ == '__main__':
+    main()
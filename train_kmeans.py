@@ -1,47 +1,276 @@
-import pandas as pd
-import numpy as np
+"""Training of the K-Means pipeline used by the cluster prediction.
+
+    python train_kmeans.py                  # full retrain over the whole dataset
+    python train_kmeans.py --incremental    # only the rows added since the last training
+
+Every training writes a versioned artifact (``kmeans_pipeline.v<N>.pkl``),
+atomically replaces ``kmeans_pipeline.pkl`` with it and keeps the training
+state (trained ids, median reservoir, cluster sizes) next to it in
+``kmeans_pipeline.state.npz``.
+
+The incremental mode updates the imputer medians from a row reservoir, the
+scaler with ``partial_fit`` and warm-starts ``MiniBatchKMeans`` from the
+current centroids, fed with the new rows only. ``--drift`` compares the
+result with a full retrain to show when a full retrain is due.
+"""
+import argparse
+import json
+import os
 import pickle
-from sklearn.pipeline import Pipeline
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer
+from sklearn.metrics import adjusted_rand_score
+from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.compose import ColumnTransformer
+
+# The dataset is the CSV plus the segments appended by download_data.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from main.segments import SegmentStore  # noqa: E402
 
 CSV_FILENAME = 'tmdb_movie_data.csv'
 MODEL_FILENAME = 'kmeans_pipeline.pkl'
-
-try:
-    df = pd.read_csv(CSV_FILENAME)
-except FileNotFoundError:
-    print(f"Error: File '{CSV_FILENAME}' not found.")
-    exit()
-
-df[['budget', 'revenue', 'runtime']] = df[['budget', 'revenue', 'runtime']].replace(0, np.nan)
+STATE_FILENAME = 'kmeans_pipeline.state.npz'
 
 numeric_features = ['vote_average', 'vote_count', 'popularity', 'budget', 'revenue', 'runtime']
 n_clusters = 5
 
-numeric_transformer = Pipeline(steps=[
-    ('imputer', SimpleImputer(strategy='median')),
-    ('scaler', StandardScaler())
-])
-
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('num', numeric_transformer, numeric_features)
-    ],
-    remainder='drop'
-)
-
-kmeans_pipeline = Pipeline(steps=[
-    ('preprocessor', preprocessor),
-    ('cluster', KMeans(n_clusters=n_clusters, random_state=42, n_init=10))
-])
-
-print("Training K-Means pipeline...")
-X = df[numeric_features]
-kmeans_pipeline.fit(X)
-print("Training finished.")
-
-with open(MODEL_FILENAME, 'wb') as file:
-    pickle.dump(kmeans_pipeline, file)
\ No newline at end of file
+# Rows kept for the imputer medians, exact as long as the dataset is smaller
+RESERVOIR_SIZE = 20000
+BATCH_SIZE = 1024
+DRIFT_THRESHOLD = 0.25
+
+
+def load_data(csv_path):
+    df = SegmentStore(csv_path).read()
+    df[['budget', 'revenue', 'runtime']] = df[['budget', 'revenue', 'runtime']].replace(0, np.nan)
+    return df
+
+
+def build_pipeline():
+    numeric_transformer = Pipeline(steps=[
+        ('imputer', SimpleImputer(strategy='median')),
+        ('scaler', StandardScaler())
+    ])
+
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('num', numeric_transformer, numeric_features)
+        ],
+        remainder='drop'
+    )
+
+    return Pipeline(steps=[
+        ('preprocessor', preprocessor),
+        ('cluster', KMeans(n_clusters=n_clusters, random_state=42, n_init=10))
+    ])
+
+
+def pipeline_steps(pipeline):
+    numeric_transformer = pipeline.named_steps['preprocessor'].named_transformers_['num']
+    return numeric_transformer.named_steps['imputer'], numeric_transformer.named_steps['scaler'], pipeline.named_steps['cluster']
+
+
+def update_reservoir(reservoir, seen, rows, rng):
+    """Reservoir sampling (algorithm R) of ``rows`` into ``reservoir``, returns the new pair."""
+    free = max(0, RESERVOIR_SIZE - len(reservoir))
+    reservoir = np.vstack([reservoir, rows[:free]])
+    for offset, row in enumerate(rows[free:]):
+        slot = rng.integers(0, seen + free + offset + 1)
+        if slot < RESERVOIR_SIZE:
+            reservoir[slot] = row
+    return reservoir, seen + len(rows)
+
+
+def load_state(path):
+    with np.load(path) as state:
+        return {name: state[name] for name in state.files}
+
+
+def save_state(path, state):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        np.savez(file, **state)
+    os.replace(tmp_path, path)
+
+
+def save_pipeline(pipeline, model_path, version):
+    """Writes ``<model>.v<version>.pkl`` and swaps it in as ``model_path``."""
+    root, ext = os.path.splitext(model_path)
+    versioned_path = f"{root}.v{version}{ext}"
+    with open(versioned_path, 'wb') as file:
+        pickle.dump(pipeline, file)
+
+    # The API reloads the model when the file changes, it must never see a half-written one
+    tmp_path = model_path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        pickle.dump(pipeline, file)
+    os.replace(tmp_path, model_path)
+    return versioned_path
+
+
+def train_full(df):
+    pipeline = build_pipeline()
+    pipeline.fit(df[numeric_features])
+    return pipeline
+
+
+def train_incremental(pipeline, state, new_rows, seed=42):
+    """Updates a fitted pipeline with ``new_rows`` only, returns the new pipeline and state."""
+    rng = np.random.default_rng(seed + int(state['version']))
+    imputer, scaler, kmeans = pipeline_steps(pipeline)
+    raw = new_rows[numeric_features].to_numpy(dtype=np.float64)
+
+    # Medians from the reservoir, which has seen every row trained so far
+    reservoir, seen = update_reservoir(state['reservoir'], int(state['seen']), raw, rng)
+    imputer.statistics_ = np.nanmedian(reservoir, axis=0)
+
+    # Old centroids back in feature units before the scaler moves
+    centers = kmeans.cluster_centers_ * scaler.scale_ + scaler.mean_
+    imputed = imputer.transform(new_rows[numeric_features])
+    scaler.partial_fit(imputed)
+    centers = (centers - scaler.mean_) / scaler.scale_
+    X = scaler.transform(imputed)
+
+    model = MiniBatchKMeans(
+        n_clusters=n_clusters,
+        init=centers,
+        n_init=1,
+        batch_size=BATCH_SIZE,
+        reassignment_ratio=0.0,
+        random_state=seed,
+    )
+    # The old centroids go into the first batch weighted by their cluster sizes,
+    # so the new rows move them as much as a real continuation of training would
+    order = rng.permutation(len(X))
+    counts = state['counts'].astype(np.float64)
+    for start in range(0, len(X), BATCH_SIZE):
+        batch = X[order[start:start + BATCH_SIZE]]
+        weights = np.ones(len(batch))
+        if start == 0:
+            batch = np.vstack([centers, batch])
+            weights = np.concatenate([np.maximum(counts, 1.0), weights])
+        model.partial_fit(batch, sample_weight=weights)
+
+    pipeline.steps[-1] = ('cluster', model)
+    labels = model.predict(X)
+    state = dict(
+        state,
+        ids=np.concatenate([state['ids'], new_rows['id'].to_numpy(dtype=np.int64)]),
+        reservoir=reservoir,
+        seen=np.int64(seen),
+        counts=state['counts'] + np.bincount(labels, minlength=n_clusters),
+    )
+    return pipeline, state
+
+
+def initial_state(pipeline, df, seed=42):
+    rng = np.random.default_rng(seed)
+    raw = df[numeric_features].to_numpy(dtype=np.float64)
+    reservoir, seen = update_reservoir(np.empty((0, len(numeric_features))), 0, raw, rng)
+    labels = pipeline.predict(df[numeric_features])
+    return {
+        'version': np.int64(0),
+        'ids': df['id'].to_numpy(dtype=np.int64),
+        'reservoir': reservoir,
+        'seen': np.int64(seen),
+        'counts': np.bincount(labels, minlength=n_clusters),
+    }
+
+
+def centroid_drift(pipeline, reference, df):
+    """Distance of each centroid to its matched centroid of ``reference``.
+
+    Both sets are compared in the scaled space of ``reference`` and matched
+    one to one (Hungarian assignment), since cluster numbering is arbitrary.
+    """
+    _, scaler, kmeans = pipeline_steps(pipeline)
+    _, reference_scaler, reference_kmeans = pipeline_steps(reference)
+    centers = (kmeans.cluster_centers_ * scaler.scale_ + scaler.mean_ - reference_scaler.mean_) / reference_scaler.scale_
+    reference_centers = reference_kmeans.cluster_centers_
+
+    distances = np.linalg.norm(centers[:, None, :] - reference_centers[None, :, :], axis=2)
+    rows, columns = linear_sum_assignment(distances)
+    drift = distances[rows, columns]
+    X = df[numeric_features]
+    return {
+        'clusters': [
+            {'cluster': int(row), 'reference_cluster': int(column), 'drift': float(distance)}
+            for row, column, distance in zip(rows, columns, drift)
+        ],
+        'max_drift': float(drift.max()),
+        'mean_drift': float(drift.mean()),
+        'adjusted_rand_index': float(adjusted_rand_score(reference.predict(X), pipeline.predict(X))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the K-Means pipeline for the cluster prediction.")
+    parser.add_argument('--csv', default=CSV_FILENAME)
+    parser.add_argument('--model', default=MODEL_FILENAME)
+    parser.add_argument('--state', default=STATE_FILENAME)
+    parser.add_argument('--incremental', action='store_true', help="Update the current model with the new rows only.")
+    parser.add_argument('--drift', action='store_true', help="Compare the incremental model with a full retrain.")
+    parser.add_argument('--drift-threshold', type=float, default=DRIFT_THRESHOLD)
+    parser.add_argument('--report', help="Write the drift report as JSON to this file.")
+    args = parser.parse_args()
+
+    try:
+        df = load_data(args.csv)
+    except FileNotFoundError:
+        print(f"Error: File '{args.csv}' not found.")
+        return 1
+
+    if not args.incremental:
+        print("Training K-Means pipeline...")
+        pipeline = train_full(df)
+        state = initial_state(pipeline, df)
+        if os.path.exists(args.state):
+            state['version'] = load_state(args.state)['version'] + 1
+        path = save_pipeline(pipeline, args.model, int(state['version']))
+        save_state(args.state, state)
+        print(f"Training finished, {len(df)} rows. Saved as '{path}'.")
+        return 0
+
+    if not os.path.exists(args.state) or not os.path.exists(args.model):
+        print(f"Error: No training state in '{args.state}', run a full training first.")
+        return 1
+
+    state = load_state(args.state)
+    new_rows = df[~np.isin(df['id'].to_numpy(dtype=np.int64), state['ids'])]
+    if new_rows.empty:
+        print("No new rows since the last training.")
+        return 0
+
+    with open(args.model, 'rb') as file:
+        pipeline = pickle.load(file)
+
+    print(f"Updating K-Means pipeline with {len(new_rows)} new rows...")
+    pipeline, state = train_incremental(pipeline, state, new_rows)
+    state['version'] = state['version'] + 1
+    path = save_pipeline(pipeline, args.model, int(state['version']))
+    save_state(args.state, state)
+    print(f"Update finished. Saved as '{path}'.")
+
+    if args.drift:
+        print("Training reference model from scratch...")
+        report = centroid_drift(pipeline, train_full(df), df)
+        for cluster in report['clusters']:
+            print(f"  cluster {cluster['cluster']} -> {cluster['reference_cluster']}: drift {cluster['drift']:.4f}")
+        print(f"Max drift {report['max_drift']:.4f}, mean {report['mean_drift']:.4f}, "
+              f"adjusted Rand index {report['adjusted_rand_index']:.4f}")
+        if report['max_drift'] > args.drift_threshold:
+            print(f"Max drift is above {args.drift_threshold}, a full retrain is recommended.")
+        if args.report:
+            with open(args.report, 'w') as file:
+                json.dump(report, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())